@@ -5,7 +5,7 @@ from typing import Dict, List, Optional
 import pandas as pd
 from datetime import datetime
 from models.experiment_tracker import ExperimentTracker
-from models.model_monitor import ModelMonitor, ModelRegistry
+from models.model_monitor import ModelMonitor, ModelRegistry, window_modifier
 from models.logger import ModelLogger
 from notifications.notifier import NotificationService
 import asyncio
@@ -21,9 +21,13 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Артефакт дерева, статистика обучающего набора которого - эталон дрейфа
+TREE_MODEL_PATH = "models/saved/tree_model"
+
 # Инициализация сервисов
 experiment_tracker = ExperimentTracker()
 model_monitor = ModelMonitor()
+model_monitor.load_baseline_dataset(TREE_MODEL_PATH)
 model_registry = ModelRegistry()
 logger = ModelLogger()
 notifier = NotificationService()
@@ -65,6 +69,10 @@ async def predict(data: Dict):
 @app.get("/api/model/metrics")
 async def get_metrics(window: str = "1d"):
     """Получение метрик модели"""
+    try:
+        window_modifier(window)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     try:
         metrics = model_monitor.calculate_metrics(window)
         return metrics
@@ -109,6 +117,23 @@ async def get_alerts(start_time: Optional[str] = None,
         logger.log(str(e), level="ERROR", category="alerts")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/monitoring/drift")
+async def get_drift(window: str = "1d"):
+    """Дрейф признаков и предсказаний относительно обучающего набора модели"""
+    try:
+        window_modifier(window)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # Модель могли переобучить: эталон перечитывается из текущего артефакта
+    if not model_monitor.load_baseline_dataset(TREE_MODEL_PATH):
+        raise HTTPException(status_code=404, detail="Training dataset statistics not available")
+    try:
+        current = model_monitor.window_stats(window)
+        return model_monitor.detect_feature_drift(current)
+    except Exception as e:
+        logger.log(str(e), level="ERROR", category="drift")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/api/logs")
 async def get_logs(level: Optional[str] = None, 
                   category: Optional[str] = None,
@@ -2,12 +2,22 @@
 from fastapi import FastAPI, UploadFile, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+from fastapi.responses import FileResponse, JSONResponse, Response
 from pydantic import BaseModel
-import pandas as pd
-from typing import Dict
+from typing import Dict, List, Union
 import logging
+import asyncio
+import os
+import time
 from pathlib import Path
-from models.tree_predictor import TreeHaploPredictor
+from models.metrics import REGISTRY, SIZE_BUCKETS
+from models.model_store import ModelStore
+from models.prediction_cache import PredictionCache
+from models.dataset_cache import DatasetCache
+from models.dataset_stats import DatasetStats
+from models.haplo_paths import HaploPathResolver
+from models.training_jobs import TrainingJobManager
+from models.tree_artifact import TreeArtifact
 
 logging.basicConfig(level=logging.INFO)
 
@@ -26,74 +36,311 @@ app.add_middleware(
 
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
+# Значение маркера: число повторов, микроаллель (14.2) или строка копий
+# мультикопийного маркера ("DYS385": "11-14", см. MarkerSchema.encode)
+MarkerValue = Union[int, float, str]
+
 class Markers(BaseModel):
-    markers: Dict[str, int]
+    markers: Dict[str, MarkerValue]
+
+class MarkersBatch(BaseModel):
+    samples: List[Dict[str, MarkerValue]]
+
+model_store = ModelStore()
+# Считается в общем счетчике: под gunicorn /metrics суммирует события всех воркеров
+CACHE_EVENTS = REGISTRY.counter(
+    "ystr_prediction_cache_events_total",
+    "Prediction cache events: hits, misses, evictions, expirations, invalidations", ("event",)
+)
+prediction_cache = PredictionCache(events=CACHE_EVENTS)
+dataset_cache = DatasetCache()
+# Новая версия модели делает старые записи бесполезными
+model_store.add_listener(lambda handle: prediction_cache.invalidate())
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "ystr_predict_stage_seconds",
+    "Prediction request stages: parse, predict, serialize", ("endpoint", "stage")
+)
+BATCH_SIZE = REGISTRY.histogram(
+    "ystr_predict_batch_size",
+    "Samples per prediction request (kind: requested or computed after cache)",
+    ("kind",), buckets=SIZE_BUCKETS
+)
+
+def _model_info():
+    handle = model_store.current
+    return {(handle.version,): 1} if handle is not None else {}
+
+def _model_resources():
+    handle = model_store.current
+    if handle is None:
+        return {}
+    return {("load_seconds",): handle.load_seconds, ("rss_bytes",): handle.rss_bytes}
 
-predictor = TreeHaploPredictor()
+REGISTRY.callback(
+    "ystr_prediction_cache_entries", "Entries in the prediction cache", "gauge",
+    lambda: {(): prediction_cache.stats()["entries"]}
+)
+REGISTRY.callback(
+    "ystr_model_info", "Serving model version", "gauge", _model_info, ("version",)
+)
+REGISTRY.callback(
+    "ystr_model_load", "Load time and RSS after loading the serving model", "gauge",
+    _model_resources, ("measure",)
+)
 
 try:
-    predictor.load_model()
+    model_store.reload()
     logging.info("Model loaded successfully")
 except Exception as e:
     logging.warning(f"Could not load model: {str(e)}")
 
+def publish_trained_model(job_id: str, artifact: Path):
+    """Делает модель завершенной задачи рабочей и публикует ее"""
+    TreeArtifact.install(artifact, "models/saved/tree_model")
+    model_store.reload()
+    logging.info(f"Model from training job {job_id} is now serving")
+
+training_jobs = TrainingJobManager(
+    haplo_api_url=model_store.haplo_api_url,
+    on_success=publish_trained_model,
+    # Уменьшенные деревья для панелей Y12/Y25/... (0 - не обучать)
+    panel_tiers=os.environ.get("TRAIN_PANEL_TIERS", "1") != "0",
+    # Одинаковые образцы обучаются один раз с весом (0 - как есть)
+    deduplicate_samples=os.environ.get("TRAIN_DEDUPLICATE", "1") != "0",
+    # Процессов для обучения узлов дерева (0 - по числу ядер) и бюджет их памяти
+    train_workers=int(os.environ.get("TRAIN_WORKERS", "1")) or os.cpu_count() or 1,
+    train_memory_bytes=int(os.environ["TRAIN_MEMORY_MB"]) * 1024 ** 2 if os.environ.get("TRAIN_MEMORY_MB") else None,
+    # Узлы с прежними данными берут модели из рабочего артефакта (0 - обучать все)
+    reuse_nodes=os.environ.get("TRAIN_REUSE_NODES", "1") != "0",
+    # Сколько завершенных задач хранить в models/saved/jobs/
+    max_finished_jobs=int(os.environ.get("TRAIN_KEEP_JOBS", "10")),
+    # Пути гаплогрупп запрашиваются один раз и хранятся на диске (пустой HAPLO_PATH_CACHE - без кэша);
+    # HAPLO_TREE_VERSION меняют при обновлении дерева гаплогрупп, чтобы сбросить кэш
+    path_resolver=HaploPathResolver(
+        model_store.haplo_api_url,
+        cache_path=os.environ.get("HAPLO_PATH_CACHE", "models/saved/haplo_paths.json") or None,
+        tree_version=os.environ.get("HAPLO_TREE_VERSION", ""),
+        concurrency=int(os.environ.get("HAPLO_CONCURRENCY", "16"))
+    )
+)
+
+# Период проверки артефакта на диске (0 - не проверять)
+MODEL_WATCH_SECONDS = float(os.environ.get("MODEL_WATCH_SECONDS", "30"))
+
+async def watch_model_artifact():
+    """Подхватывает модель, опубликованную другим воркером"""
+    while True:
+        await asyncio.sleep(MODEL_WATCH_SECONDS)
+        try:
+            await asyncio.to_thread(model_store.reload_if_changed)
+        except Exception as e:
+            logging.error(f"Model watch error: {str(e)}")
+
+@app.on_event("startup")
+async def start_model_watch():
+    # Выполняется в каждом воркере после fork
+    if MODEL_WATCH_SECONDS > 0:
+        asyncio.create_task(watch_model_artifact())
+
+def _timed_response(endpoint: str, content: Dict) -> JSONResponse:
+    """Сериализует ответ сразу, чтобы учесть время сериализации"""
+    start = time.perf_counter()
+    response = JSONResponse(content=content)
+    STAGE_SECONDS.labels(endpoint, "serialize").observe(time.perf_counter() - start)
+    return response
+
 @app.post("/api/predict")
 async def predict(data: Markers):
-    if not predictor.is_trained:
-        raise HTTPException(status_code=400, detail="Model not trained")
+    BATCH_SIZE.labels("requested").observe(1)
+    with model_store.acquire() as handle:
+        if handle is None:
+            raise HTTPException(status_code=400, detail="Model not trained")
+
+        start = time.perf_counter()
+        try:
+            key = PredictionCache.make_key(data.markers, handle.predictor.schema, handle.version)
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        cached = prediction_cache.get(key)
+        if cached is not None:
+            STAGE_SECONDS.labels("predict", "parse").observe(time.perf_counter() - start)
+            return _timed_response("predict", {**cached, "model_version": handle.version})
+
+        STAGE_SECONDS.labels("predict", "parse").observe(time.perf_counter() - start)
+
+        BATCH_SIZE.labels("computed").observe(1)
+        start = time.perf_counter()
+        try:
+            # Маркеры пишутся по позициям схемы модели, без DataFrame
+            predictions = handle.predictor.predict_markers([data.markers])
+        except Exception as e:
+            logging.error(f"Prediction error: {str(e)}")
+            raise HTTPException(status_code=500, detail=str(e))
+        STAGE_SECONDS.labels("predict", "predict").observe(time.perf_counter() - start)
+
+        prediction_cache.put(key, predictions[0])
+        return _timed_response("predict", {**predictions[0], "model_version": handle.version})
+
+@app.post("/api/predict/batch")
+async def predict_batch(data: MarkersBatch):
+    if not data.samples:
+        raise HTTPException(status_code=400, detail="Empty batch")
+    BATCH_SIZE.labels("requested").observe(len(data.samples))
 
+    with model_store.acquire() as handle:
+        if handle is None:
+            raise HTTPException(status_code=400, detail="Model not trained")
+
+        start = time.perf_counter()
+        schema = handle.predictor.schema
+        try:
+            keys = [
+                PredictionCache.make_key(sample, schema, handle.version)
+                for sample in data.samples
+            ]
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        results = [prediction_cache.get(key) for key in keys]
+
+        # Одинаковые гаплотипы внутри батча считаем один раз
+        pending = {}
+        for i, key in enumerate(keys):
+            if results[i] is None and key not in pending:
+                pending[key] = i
+
+        if pending:
+            samples = [data.samples[i] for i in pending.values()]
+            STAGE_SECONDS.labels("batch", "parse").observe(time.perf_counter() - start)
+
+            BATCH_SIZE.labels("computed").observe(len(pending))
+            start = time.perf_counter()
+            try:
+                # Все промахи спускаются по дереву одним проходом
+                predictions = handle.predictor.predict_markers(samples)
+            except Exception as e:
+                logging.error(f"Batch prediction error: {str(e)}")
+                raise HTTPException(status_code=500, detail=str(e))
+            STAGE_SECONDS.labels("batch", "predict").observe(time.perf_counter() - start)
+
+            computed = dict(zip(pending, predictions))
+            for key, prediction in computed.items():
+                prediction_cache.put(key, prediction)
+            results = [
+                result if result is not None else computed[key]
+                for key, result in zip(keys, results)
+            ]
+        else:
+            STAGE_SECONDS.labels("batch", "parse").observe(time.perf_counter() - start)
+
+        return _timed_response("batch", {"predictions": results, "model_version": handle.version})
+
+@app.get("/metrics")
+async def metrics():
+    return Response(content=REGISTRY.render(), media_type=REGISTRY.CONTENT_TYPE)
+
+@app.get("/api/cache/stats")
+async def get_cache_stats():
+    return prediction_cache.stats()
+
+@app.get("/api/model")
+async def get_model_info():
+    with model_store.acquire() as handle:
+        if handle is None:
+            raise HTTPException(status_code=404, detail="Model not loaded")
+        return {
+            "model_version": handle.version,
+            "loaded_at": handle.loaded_at,
+            "load_seconds": handle.load_seconds,
+            "rss_bytes": handle.rss_bytes,
+            "panel_tiers": {
+                name: {"version": tier.version, "markers": len(tier.feature_names or [])}
+                for name, tier in handle.predictor.tiers.items()
+            }
+        }
+
+@app.get("/api/model/dataset_stats")
+async def get_model_dataset_stats():
+    """Статистика обучающего набора текущей модели (эталон для поиска дрейфа)"""
+    with model_store.acquire() as handle:
+        if handle is None:
+            raise HTTPException(status_code=404, detail="Model not loaded")
+        stats = handle.predictor.dataset_stats
+        if stats is None:
+            raise HTTPException(status_code=404, detail="Model was saved without dataset statistics")
+        return stats.summary()
+
+@app.post("/api/model/reload")
+async def reload_model():
+    """Перечитывает сохраненную модель без остановки обслуживания"""
+    previous = model_store.current
     try:
-        predictions = predictor.predict(pd.DataFrame([data.markers]))
-        return predictions[0]
+        handle = await asyncio.to_thread(model_store.reload)
     except Exception as e:
-        logging.error(f"Prediction error: {str(e)}")
+        logging.error(f"Reload error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
+    return {
+        "model_version": handle.version,
+        "previous_version": previous.version if previous else None
+    }
 
 @app.post("/api/train/csv")
-async def train_from_csv(file: UploadFile):
+async def train_from_csv(file: UploadFile, incremental: bool = False):
+    """Обучает модель на CSV; с ``incremental=true`` дообучает рабочую модель новыми образцами"""
     try:
-        content = await file.read()
-        with open("temp.csv", "wb") as f:
-            f.write(content)
-        
-        df = pd.read_csv("temp.csv", sep=';', low_memory=False)
-        
-        def process_value(val):
-            try:
-                if pd.isna(val):
-                    return None
-                if isinstance(val, (int, float)):
-                    return float(val)
-                if '-' in str(val):
-                    return float(str(val).split('-')[0])
-                return float(val)
-            except:
-                return None
-
-        # Обрабатываем только числовые маркеры
-        for col in df.columns:
-            if col != 'Haplogroup':
-                df[col] = df[col].apply(process_value)
-
-        df = df.dropna()
-        X = df.drop('Haplogroup', axis=1)
-        y = df['Haplogroup']
-
-        logging.info(f"Data loaded: {len(df)} samples")
+        # Разбираем загрузку прямо из потока, без промежуточного temp.csv;
+        # уже встречавшийся файл берется из кэша разобранных наборов
+        # Статистика набора собирается по кускам при разборе и уходит в артефакт
+        stats = DatasetStats()
+        X, y = await asyncio.to_thread(dataset_cache.load, file.file, name=file.filename, stats=stats)
+
+        logging.info(f"Data loaded: {len(X)} samples")
         logging.info(f"Markers: {', '.join(X.columns[:5])}...")
         logging.info(f"Unique haplogroups: {len(y.unique())}")
 
-        # Обучаем дерево
-        await predictor.train(X, y)
-        predictor.save_model()
+        # Обучаем дерево в отдельном процессе
+        job_id = training_jobs.submit(X, y, stats=stats, incremental=incremental)
 
         return {
-            "message": "Model trained successfully",
-            "samples": len(df),
+            "message": "Training started",
+            "job_id": job_id,
+            "incremental": incremental,
+            "samples": len(X),
             "haplogroups": len(y.unique()),
             "markers": len(X.columns)
         }
 
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         logging.error(f"Training error: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/train/jobs")
+async def list_training_jobs():
+    return training_jobs.list()
+
+@app.get("/api/train/jobs/{job_id}")
+async def get_training_job(job_id: str):
+    try:
+        return training_jobs.get(job_id)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@app.post("/api/train/jobs/{job_id}/cancel")
+async def cancel_training_job(job_id: str):
+    try:
+        return await asyncio.to_thread(training_jobs.cancel, job_id)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@app.get("/api/train/jobs/{job_id}/artifact")
+async def get_training_artifact(job_id: str):
+    try:
+        # Артефакт - каталог, отдаем его одним zip-архивом
+        archive = await asyncio.to_thread(training_jobs.artifact_archive, job_id)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return FileResponse(archive, filename=f"tree_model_{job_id}.zip")
@@ -0,0 +1,47 @@
+# c:\projects\DNA-utils-universal\ystr_predictor\benchmarks\compare.py
+"""Сравнение двух файлов результатов benchmarks.run
+
+    python -m benchmarks.compare benchmarks/results/abc123.json benchmarks/results/def456.json
+"""
+import argparse
+import json
+from typing import Dict, Tuple
+
+
+def _index(report: Dict) -> Dict[Tuple, Dict]:
+    return {
+        (r["kind"], r["name"], r["samples"], r.get("phase"), r.get("batch_size")): r
+        for r in report["results"] if r["status"] == "ok"
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    args = parser.parse_args()
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.candidate, encoding="utf-8") as f:
+        candidate = json.load(f)
+
+    print(f"baseline:  {baseline['environment'].get('commit')}")
+    print(f"candidate: {candidate['environment'].get('commit')}")
+    print(f"{'case':<55} {'base s':>10} {'cand s':>10} {'speedup':>8} {'RSS MB':>15}")
+
+    old, new = _index(baseline), _index(candidate)
+    for key in sorted(set(old) & set(new), key=str):
+        kind, name, samples, phase, batch_size = key
+        label = f"{name} n={samples} {phase}" + (f" batch={batch_size}" if batch_size else "")
+        a, b = old[key], new[key]
+        rss = f"{a.get('peak_rss_mb') or 0:.0f}->{b.get('peak_rss_mb') or 0:.0f}"
+        print(f"{label:<55} {a['seconds']:>10.4f} {b['seconds']:>10.4f} "
+              f"{a['seconds'] / b['seconds']:>7.2f}x {rss:>15}")
+
+    for key in sorted(set(old) ^ set(new), key=str):
+        print(f"only in {'baseline' if key in old else 'candidate'}: {key}")
+
+
+if __name__ == "__main__":
+    main()
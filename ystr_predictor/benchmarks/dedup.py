@@ -0,0 +1,95 @@
+# c:\projects\DNA-utils-universal\ystr_predictor\benchmarks\dedup.py
+"""Сжатие обучающего набора дедупликацией и его влияние на дерево
+
+    python -m benchmarks.dedup --samples 5000 --sample-generations 25 5 --output dedup.json
+
+Для каждой глубины родства ``--sample-generations`` (чем меньше, тем
+больше одинаковых гаплотипов, как у родственников в открытых базах)
+синтетическая выборка делится 80/20. TreeHaploPredictor обучается на
+обучающей части как есть и после ``deduplicate`` с весами-повторами;
+обе модели проверяются на одной отложенной части.
+
+Пути гаплогрупп передаются готовыми, поэтому время обучения - это время
+обучения узлов.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from benchmarks.synthetic import SyntheticYstrDataset
+from benchmarks.tiers import path_accuracy
+from models.deduplication import compression_stats, deduplicate
+from models.tree_predictor import TreeHaploPredictor
+
+
+def _train_and_score(X_train, y_train, weights, X_test, y_test, dataset) -> Dict:
+    predictor = TreeHaploPredictor()
+    start = time.perf_counter()
+    asyncio.run(predictor.train(X_train, y_train, haplo_paths=dataset.paths, sample_weight=weights))
+    seconds = time.perf_counter() - start
+    predictions = predictor.predict(X_test)
+    return {
+        "rows": len(X_train),
+        "train_seconds": seconds,
+        **path_accuracy(predictions, y_test.to_numpy(), dataset.paths),
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Training set deduplication report")
+    parser.add_argument("--samples", type=int, default=5000)
+    parser.add_argument("--sample-generations", type=int, nargs="+", default=[25, 5, 1],
+                        help="Generations from the group modal haplotype (fewer - more duplicates)")
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=None, help="Optional JSON file for the report")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+
+    report = {"samples": args.samples, "cases": []}
+    print(f"{'gens':>4} {'rows':>6} {'unique':>6} {'ratio':>6} {'full s':>7} {'dedup s':>7} "
+          f"{'speedup':>7} {'exact':>13} {'on path':>13}")
+    for generations in args.sample_generations:
+        dataset = SyntheticYstrDataset(args.samples, depth=args.depth,
+                                       sample_generations=generations, seed=args.seed)
+        X, y = dataset.training_data()
+        rank = y.groupby(y).cumcount()
+        train_mask = (rank < np.ceil(y.map(y.value_counts()) * 0.8)).to_numpy()
+        X_train, y_train = X[train_mask], y[train_mask]
+        X_test, y_test = X[~train_mask], y[~train_mask]
+
+        start = time.perf_counter()
+        X_unique, y_unique, counts = deduplicate(X_train, y_train)
+        dedup_seconds = time.perf_counter() - start
+
+        full = _train_and_score(X_train, y_train, None, X_test, y_test, dataset)
+        dedup = _train_and_score(X_unique, y_unique, counts, X_test, y_test, dataset)
+
+        case = {
+            "sample_generations": generations,
+            **compression_stats(counts),
+            "dedup_seconds": dedup_seconds,
+            "full": full,
+            "deduplicated": dedup,
+            "train_speedup": full["train_seconds"] / dedup["train_seconds"],
+            "exact_delta": dedup["exact"] - full["exact"],
+            "on_path_delta": dedup["on_path"] - full["on_path"],
+        }
+        report["cases"].append(case)
+        print(f"{generations:>4} {case['rows']:>6} {case['unique_rows']:>6} "
+              f"{case['compression_ratio']:>6.2f} {full['train_seconds']:>7.2f} "
+              f"{dedup['train_seconds']:>7.2f} {case['train_speedup']:>7.2f} "
+              f"{full['exact']:>6.3f}/{dedup['exact']:.3f} {full['on_path']:>6.3f}/{dedup['on_path']:.3f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+# c:\projects\DNA-utils-universal\ystr_predictor\benchmarks\haplo_paths.py
+"""Время получения путей гаплогрупп перед обучением
+
+    python -m benchmarks.haplo_paths --depth 8 --latency 0.005 --concurrency 1 4 16
+
+Пути синтетического дерева отдает ``HaploPathStub`` с задержкой
+``--latency`` на запрос. Сравниваются прежний способ (по одному
+запросу, новый клиент на каждый) и ``HaploPathResolver`` с разным
+числом одновременных запросов, а затем повторное обучение с дисковым
+кэшем, когда новых гаплогрупп - доля ``--new-fraction``.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+
+from benchmarks.haplo_stub import HaploPathStub
+from benchmarks.synthetic import SyntheticYstrDataset
+from models.haplo_paths import HaploPathResolver
+
+
+async def _per_call_clients(url: str, haplogroups: List[str]):
+    """Прежний TreeHaploPredictor.get_haplo_path в цикле"""
+    for haplogroup in haplogroups:
+        async with httpx.AsyncClient() as client:
+            await client.get(f"{url}/search/{haplogroup}")
+
+
+def _run(stub: HaploPathStub, name: str, coroutine) -> Dict:
+    requests, connections = stub.requests, stub.connections
+    stub.max_in_flight = 0
+    start = time.perf_counter()
+    asyncio.run(coroutine)
+    seconds = time.perf_counter() - start
+    case = {
+        "case": name,
+        "seconds": seconds,
+        "requests": stub.requests - requests,
+        "connections": stub.connections - connections,
+        "max_in_flight": stub.max_in_flight,
+    }
+    print(f"{name:>24} {seconds:>8.2f} {case['requests']:>8} {case['connections']:>11} "
+          f"{case['max_in_flight']:>9}")
+    return case
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Haplogroup path resolution report")
+    parser.add_argument("--depth", type=int, default=8)
+    parser.add_argument("--branching", type=int, default=2)
+    parser.add_argument("--latency", type=float, default=0.005, help="Stub delay per request, s")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--new-fraction", type=float, default=0.05)
+    parser.add_argument("--skip-baseline", action="store_true")
+    parser.add_argument("--output", default=None, help="Optional JSON file for the report")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+
+    dataset = SyntheticYstrDataset(0, depth=args.depth, branching=args.branching)
+    haplogroups = dataset.haplogroups
+    report = {"haplogroups": len(haplogroups), "latency": args.latency, "cases": []}
+    print(f"{len(haplogroups)} haplogroups, {args.latency * 1000:.0f} ms per request")
+    print(f"{'case':>24} {'seconds':>8} {'requests':>8} {'connections':>11} {'in flight':>9}")
+
+    with HaploPathStub(dataset.paths, latency=args.latency) as stub:
+        if not args.skip_baseline:
+            report["cases"].append(_run(stub, "client per request", _per_call_clients(stub.url, haplogroups)))
+        for concurrency in args.concurrency:
+            resolver = HaploPathResolver(stub.url, concurrency=concurrency)
+            report["cases"].append(_run(stub, f"resolver x{concurrency}", resolver.resolve(haplogroups)))
+
+        # Повторное обучение: кэш первого набора на диске, новые группы добираются запросами
+        known = haplogroups[:int(len(haplogroups) * (1 - args.new_fraction))]
+        concurrency = max(args.concurrency)
+        with tempfile.TemporaryDirectory() as tmp:
+            cache_path = str(Path(tmp) / "haplo_paths.json")
+            first = HaploPathResolver(stub.url, cache_path=cache_path, concurrency=concurrency)
+            report["cases"].append(_run(stub, "cache, first training", first.resolve(known)))
+            retrain = HaploPathResolver(stub.url, cache_path=cache_path, concurrency=concurrency)
+            report["cases"].append(_run(stub, "cache, retraining", retrain.resolve(haplogroups)))
+            report["cache_bytes"] = Path(cache_path).stat().st_size
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+# c:\projects\DNA-utils-universal\ystr_predictor\benchmarks\haplo_stub.py
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+from urllib.parse import unquote
+
+
+class HaploPathStub:
+    """Локальная замена сервиса путей гаплогрупп (ftdna_haplo, порт 9003)
+
+    Отвечает на ``GET /api/search/{haplogroup}`` так же, как настоящий
+    сервис: ``{"ftdna_path": [...]}`` или 404 для неизвестной группы.
+    Используется как контекстный менеджер, ``url`` подставляется в
+    ``haplo_api_url`` предикторов.
+
+    ``latency`` - задержка ответа в секундах, ``failures`` - сколько
+    первых запросов каждой гаплогруппы получат 503, ``stalls`` - сколько
+    следующих за ними ответят только через ``stall`` секунд (таймаут
+    клиента). Соединения
+    keep-alive (HTTP/1.1); ``connections`` - сколько их открыто,
+    ``max_in_flight`` - наибольшее число одновременных запросов.
+    """
+
+    def __init__(self, paths: Dict[str, List[str]], host: str = "127.0.0.1", port: int = 0,
+                 latency: float = 0.0, failures: int = 0, stalls: int = 0, stall: float = 1.0):
+        self.paths = paths
+        self.latency = latency
+        self.failures = failures
+        self.stalls = stalls
+        self.stall = stall
+        self.requests = 0
+        self.connections = 0
+        self.max_in_flight = 0
+        self._in_flight = 0
+        self._attempts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Заголовки и тело пишутся отдельно: без TCP_NODELAY ответ ждет ACK
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                with stub._lock:
+                    stub.connections += 1
+
+            def do_GET(self):
+                prefix, _, haplogroup = self.path.rpartition("/")
+                haplogroup = unquote(haplogroup)
+                with stub._lock:
+                    stub.requests += 1
+                    stub._in_flight += 1
+                    stub.max_in_flight = max(stub.max_in_flight, stub._in_flight)
+                    attempt = stub._attempts[haplogroup] = stub._attempts.get(haplogroup, 0) + 1
+                try:
+                    if stub.latency:
+                        time.sleep(stub.latency)
+                    if stub.failures < attempt <= stub.failures + stub.stalls:
+                        time.sleep(stub.stall)
+                    self._answer(prefix, haplogroup, attempt)
+                finally:
+                    with stub._lock:
+                        stub._in_flight -= 1
+
+            def _answer(self, prefix: str, haplogroup: str, attempt: int):
+                if attempt <= stub.failures:
+                    self._reply(503, {"error": "Service unavailable"})
+                    return
+                path = stub.paths.get(haplogroup) if prefix.endswith("/search") else None
+                if path is None:
+                    self._reply(404, {"error": "Haplogroup not found"})
+                else:
+                    self._reply(200, {"ftdna_path": path, "yfull_path": []})
+
+            def _reply(self, status: int, payload: Dict):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/api"
+
+    def start(self) -> "HaploPathStub":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "HaploPathStub":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
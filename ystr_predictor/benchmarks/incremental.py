@@ -0,0 +1,91 @@
+# c:\projects\DNA-utils-universal\ystr_predictor\benchmarks\incremental.py
+"""Дообучение дерева новыми образцами против полного обучения
+
+    python -m benchmarks.incremental --samples 30000 --days 3 --daily 1000
+
+Дерево обучается на первых строках выборки, затем ``--days`` раз
+дообучается (``TreeHaploPredictor.update``) порцией по ``--daily``
+образцов. Для сравнения на тех же строках обучается новое дерево.
+Точность считается на отложенных ``--holdout`` строках.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import time
+from typing import List, Optional
+
+from benchmarks.synthetic import SyntheticYstrDataset
+from benchmarks.tiers import _forest_size, path_accuracy
+from models.tree_predictor import TreeHaploPredictor
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Incremental tree update report")
+    parser.add_argument("--samples", type=int, default=30000)
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument("--days", type=int, default=3)
+    parser.add_argument("--daily", type=int, default=1000)
+    parser.add_argument("--holdout", type=float, default=0.1)
+    parser.add_argument("--n-estimators", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=None, help="Optional JSON file for the report")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+
+    dataset = SyntheticYstrDataset(args.samples, depth=args.depth, seed=args.seed)
+    X, y = dataset.training_data()
+    test_start = int(len(X) * (1 - args.holdout))
+    base_end = test_start - args.days * args.daily
+    if base_end <= 0:
+        raise ValueError("Not enough samples for the base model")
+    X_test, labels = X.iloc[test_start:], y.iloc[test_start:].to_numpy()
+
+    def evaluate(predictor: TreeHaploPredictor) -> dict:
+        return {**path_accuracy(predictor.predict(X_test), labels, dataset.paths),
+                "trees": _forest_size(predictor)["trees"]}
+
+    predictor = TreeHaploPredictor()
+    predictor.n_estimators = args.n_estimators
+    start = time.perf_counter()
+    asyncio.run(predictor.train(X.iloc[:base_end], y.iloc[:base_end], haplo_paths=dataset.paths))
+    report = {"base_samples": base_end, "base_seconds": time.perf_counter() - start, "days": []}
+    print(f"base model: {base_end} samples, {report['base_seconds']:.1f}s")
+    print(f"{'day':>3} {'samples':>8} {'update s':>9} {'retrain s':>9} {'nodes':>6} "
+          f"{'exact upd':>9} {'exact new':>9} {'trees upd':>9} {'trees new':>9}")
+
+    for day in range(1, args.days + 1):
+        end = base_end + day * args.daily
+        batch = slice(end - args.daily, end)
+        start = time.perf_counter()
+        update = asyncio.run(predictor.update(X.iloc[batch], y.iloc[batch], haplo_paths=dataset.paths))
+        update_seconds = time.perf_counter() - start
+
+        retrained = TreeHaploPredictor()
+        retrained.n_estimators = args.n_estimators
+        start = time.perf_counter()
+        asyncio.run(retrained.train(X.iloc[:end], y.iloc[:end], haplo_paths=dataset.paths))
+        retrain_seconds = time.perf_counter() - start
+
+        run = {
+            "day": day,
+            "samples": end,
+            "update_seconds": update_seconds,
+            "retrain_seconds": retrain_seconds,
+            "updated_nodes": len(update["updated_nodes"]),
+            "stale_nodes": update["stale_nodes"],
+            "updated": evaluate(predictor),
+            "retrained": evaluate(retrained),
+        }
+        report["days"].append(run)
+        print(f"{day:>3} {end:>8} {update_seconds:>9.1f} {retrain_seconds:>9.1f} {run['updated_nodes']:>6} "
+              f"{run['updated']['exact']:>9.3f} {run['retrained']['exact']:>9.3f} "
+              f"{run['updated']['trees']:>9} {run['retrained']['trees']:>9}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
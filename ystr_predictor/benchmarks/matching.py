@@ -0,0 +1,98 @@
+# c:\projects\DNA-utils-universal\ystr_predictor\benchmarks\matching.py
+"""Задержка поиска совпадений по генетической дистанции
+
+    python -m benchmarks.matching --rows 1000000 --max-distance 4 10 --output matching.json
+
+Синтетические профили (строки ``a-b`` у палиндромов, как их загружают
+пользователи) размножаются до ``--rows`` строк со случайными шагами ±1,
+чтобы у запросов были и близкие, и далекие совпадения. Для каждой панели
+и ``--max-distance`` меряется время одного запроса ко всей матрице и
+пропускная способность ``match_many`` на ``--queries`` запросах.
+"""
+import argparse
+import json
+import logging
+import statistics
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from benchmarks.synthetic import SyntheticYstrDataset
+from models.genetic_distance import HaplotypeMatrix
+
+
+def build_matrix(rows: int, base_samples: int, seed: int) -> Tuple[HaplotypeMatrix, List[Dict]]:
+    """Матрица из ``rows`` строк и профили исходной выборки для запросов"""
+    frame = SyntheticYstrDataset(base_samples, seed=seed).frame().drop(columns="Haplogroup")
+    base = HaplotypeMatrix.from_frame(frame).columns.T
+    rng = np.random.default_rng(seed)
+    values = np.resize(base, (rows, base.shape[1])).astype(np.int16)
+    steps = rng.integers(-1, 2, values.shape, dtype=np.int16) * (rng.random(values.shape) < 0.05)
+    values = np.where(values > 0, np.clip(values + steps, 1, 255), 0).astype(np.uint8)
+    profiles = [{k: v for k, v in row.items() if v} for row in frame.to_dict("records")]
+    return HaplotypeMatrix(values), profiles
+
+
+def _latency(matrix: HaplotypeMatrix, queries: List[Dict], repeat: int, **kwargs) -> Dict:
+    seconds, found = [], []
+    for query in queries:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            matches = matrix.match(query, **kwargs)
+            seconds.append(time.perf_counter() - start)
+        found.append(len(matches.rows))
+    seconds.sort()
+    return {
+        "p50_ms": statistics.median(seconds) * 1000,
+        "p95_ms": seconds[int(0.95 * (len(seconds) - 1))] * 1000,
+        "matches_mean": float(np.mean(found)),
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Genetic distance matching benchmark")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--base-samples", type=int, default=50_000)
+    parser.add_argument("--panels", nargs="+", default=["Y12", "Y25", "Y37"])
+    parser.add_argument("--max-distance", type=int, nargs="+", default=[4, 10])
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=None, help="Optional JSON file for the report")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+
+    start = time.perf_counter()
+    matrix, profiles = build_matrix(args.rows, args.base_samples, args.seed)
+    build_seconds = time.perf_counter() - start
+    rng = np.random.default_rng(args.seed + 1)
+    queries = [profiles[i] for i in rng.choice(len(profiles), args.queries, replace=False)]
+
+    report = {
+        "rows": len(matrix),
+        "matrix_bytes": int(matrix.columns.nbytes),
+        "build_seconds": build_seconds,
+        "cases": [],
+    }
+    print(f"{len(matrix)} rows, {matrix.columns.nbytes / 2 ** 20:.0f} MB")
+    print(f"{'panel':>5} {'max GD':>6} {'p50 ms':>7} {'p95 ms':>7} {'matches':>9} {'batch q/s':>9}")
+    for panel in args.panels:
+        for max_distance in args.max_distance:
+            kwargs = {"panel": panel, "max_distance": max_distance}
+            latency = _latency(matrix, queries, args.repeat, **kwargs)
+            start = time.perf_counter()
+            matrix.match_many(queries, **kwargs)
+            batch_qps = len(queries) / (time.perf_counter() - start)
+            case = {**kwargs, **latency, "batch_queries_per_second": batch_qps}
+            report["cases"].append(case)
+            print(f"{panel:>5} {max_distance:>6} {latency['p50_ms']:>7.1f} {latency['p95_ms']:>7.1f} "
+                  f"{latency['matches_mean']:>9.0f} {batch_qps:>9.1f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
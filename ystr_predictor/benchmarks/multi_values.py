@@ -0,0 +1,95 @@
+# c:\projects\DNA-utils-universal\ystr_predictor\benchmarks\multi_values.py
+"""Разбор мультикопийных маркеров: построчный apply против векторного
+
+    python -m benchmarks.multi_values --rows 10000 100000 300000
+
+Перед замером проверяется, что оба варианта дают одинаковые столбцы.
+"""
+import argparse
+import json
+import logging
+import statistics
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import SyntheticYstrDataset
+from models.csv_handler import CsvHandler
+
+
+def expand_legacy(df: pd.DataFrame) -> Dict[str, pd.Series]:
+    """Прежняя реализация из CsvHandler.load_data: apply на ячейку и на позицию"""
+    processed = {}
+    for column, num_values in CsvHandler.MULTI_VALUE_MARKERS.items():
+        if column in df.columns:
+            values_lists = df[column].apply(CsvHandler.parse_multi_values)
+            for i in range(num_values):
+                processed[f"{column}_{i+1}"] = values_lists.apply(
+                    lambda x: x[i] if i < len(x) else 0
+                )
+    return processed
+
+
+def expand_vectorized(df: pd.DataFrame) -> Dict[str, pd.Series]:
+    processed = {}
+    for column, num_values in CsvHandler.MULTI_VALUE_MARKERS.items():
+        if column in df.columns:
+            values = CsvHandler.parse_multi_value_column(df[column], num_values)
+            for i in range(num_values):
+                processed[f"{column}_{i+1}"] = pd.Series(values[:, i], index=df.index)
+    return processed
+
+
+def _time(func, df: pd.DataFrame, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(df)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Multi-copy marker parsing benchmark")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", default=None, help="Optional JSON file for the results")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    results = []
+    for rows in args.rows:
+        frame = SyntheticYstrDataset(rows).frame()
+        # Так столбцы выглядят после pd.read_csv: пустые ячейки - NaN
+        df = frame.replace("", np.nan)
+
+        legacy, vectorized = expand_legacy(df), expand_vectorized(df)
+        for name, column in legacy.items():
+            if not column.astype(np.int64).equals(vectorized[name]):
+                raise AssertionError(f"Column {name} differs between implementations")
+
+        legacy_seconds = _time(expand_legacy, df, args.repeat)
+        vectorized_seconds = _time(expand_vectorized, df, args.repeat)
+        result = {
+            "rows": rows,
+            "legacy_seconds": legacy_seconds,
+            "vectorized_seconds": vectorized_seconds,
+            "legacy_rows_per_second": rows / legacy_seconds,
+            "vectorized_rows_per_second": rows / vectorized_seconds,
+            "speedup": legacy_seconds / vectorized_seconds,
+        }
+        results.append(result)
+        logging.info(
+            f"{rows} rows: legacy {legacy_seconds:.3f} s, vectorized {vectorized_seconds:.3f} s "
+            f"({result['speedup']:.1f}x, {result['vectorized_rows_per_second']:.0f} rows/s)"
+        )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
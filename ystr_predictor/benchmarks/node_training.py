@@ -0,0 +1,82 @@
+# c:\projects\DNA-utils-universal\ystr_predictor\benchmarks\node_training.py
+"""Время обучения дерева в зависимости от числа процессов
+
+    python -m benchmarks.node_training --samples 20000 --depth 6 --workers 1 2 4 8
+
+Одно и то же дерево обучается с разным ``train_workers``; модели узлов
+от числа процессов не зависят (``random_state`` фиксирован), поэтому
+предсказания сверяются с последовательным обучением. В ``startup_seconds``
+- время до первого результата пула (запуск процессов, импорт sklearn).
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import List, Optional
+
+from benchmarks.synthetic import SyntheticYstrDataset
+from models.deduplication import deduplicate
+from models.tree_predictor import TreeHaploPredictor
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Parallel node training report")
+    parser.add_argument("--samples", type=int, default=20000)
+    parser.add_argument("--depth", type=int, default=6)
+    parser.add_argument("--n-estimators", type=int, default=100)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--memory-mb", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=None, help="Optional JSON file for the report")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+
+    dataset = SyntheticYstrDataset(args.samples, depth=args.depth, seed=args.seed)
+    X, y = dataset.training_data()
+    X, y, weights = deduplicate(X, y)
+    probe = X.iloc[:1000]
+
+    report = {"samples": args.samples, "unique_samples": len(X), "cpus": os.cpu_count(), "runs": []}
+    print(f"{len(X)} unique samples, {os.cpu_count()} CPUs")
+    print(f"{'workers':>7} {'nodes':>6} {'seconds':>8} {'startup':>8} {'speedup':>8} {'same':>5}")
+    baseline = reference = None
+    for workers in args.workers:
+        predictor = TreeHaploPredictor()
+        predictor.n_estimators = args.n_estimators
+        predictor.train_workers = workers
+        predictor.train_memory_bytes = args.memory_mb * 1024 ** 2 if args.memory_mb else None
+
+        start = time.perf_counter()
+        marks = []
+        asyncio.run(predictor.train(
+            X, y, haplo_paths=dataset.paths, sample_weight=weights,
+            progress_callback=lambda done, total: marks.append((time.perf_counter() - start, done, total))
+        ))
+        seconds = time.perf_counter() - start
+
+        predictions = predictor.predict(probe)
+        if reference is None:
+            baseline, reference = seconds, predictions
+        # Первая отметка - узлы без заданий, вторая - первый обученный узел
+        startup = marks[1][0] if len(marks) > 1 else 0.0
+        run = {
+            "workers": workers,
+            "nodes": marks[-1][2] if marks else 0,
+            "seconds": seconds,
+            "startup_seconds": startup,
+            "speedup": baseline / seconds,
+            "same_predictions": predictions == reference,
+        }
+        report["runs"].append(run)
+        print(f"{workers:>7} {run['nodes']:>6} {seconds:>8.2f} {startup:>8.2f} "
+              f"{run['speedup']:>8.2f} {str(run['same_predictions']):>5}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
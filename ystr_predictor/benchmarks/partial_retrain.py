@@ -0,0 +1,100 @@
+# c:\projects\DNA-utils-universal\ystr_predictor\benchmarks\partial_retrain.py
+"""Переобучение дерева, когда новые образцы пришли в одну ветвь
+
+    python -m benchmarks.partial_retrain --samples 20000 --depth 4 --new 500
+
+Дерево обучается и сохраняется, затем в выборку добавляется ``--new``
+образцов одной ветви второго уровня (по умолчанию - ветви первого
+образца) и дерево обучается снова: с прошлым артефактом (узлы с прежним
+отпечатком берут его модели) и с нуля. Сравниваются время, число
+переобученных узлов и совпадение предсказаний.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import tempfile
+import time
+from typing import List, Optional
+
+import numpy as np
+
+from benchmarks.synthetic import SyntheticYstrDataset
+from models.deduplication import deduplicate
+from models.tree_artifact import TreeArtifact
+from models.tree_predictor import TreeHaploPredictor
+
+
+def _top(predictions: List[dict]) -> List[Optional[str]]:
+    return [
+        p["path_predictions"][-1]["predictions"][0]["haplogroup"] if p["path_predictions"] else None
+        for p in predictions
+    ]
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Partial subtree retraining report")
+    parser.add_argument("--samples", type=int, default=20000)
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument("--new", type=int, default=500, help="New samples of one branch")
+    parser.add_argument("--branch", default=None, help="Second-level node (default: first sample's)")
+    parser.add_argument("--n-estimators", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=None, help="Optional JSON file for the report")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+
+    dataset = SyntheticYstrDataset(args.samples + 20 * args.new, depth=args.depth, seed=args.seed)
+    X, y = dataset.training_data()
+    base = np.arange(len(X)) < args.samples
+    branch = args.branch or dataset.paths[y.iloc[0]][1]
+    in_branch = y.map(lambda name: branch in dataset.paths[name]).to_numpy()
+    new = np.flatnonzero(~base & in_branch)[:args.new]
+    rows = np.concatenate([np.flatnonzero(base), new])
+
+    def train(rows: np.ndarray, previous: Optional[TreeArtifact] = None):
+        X_unique, y_unique, weights = deduplicate(X.iloc[rows], y.iloc[rows])
+        predictor = TreeHaploPredictor()
+        predictor.n_estimators = args.n_estimators
+        start = time.perf_counter()
+        asyncio.run(predictor.train(X_unique, y_unique, haplo_paths=dataset.paths,
+                                    sample_weight=weights, previous=previous))
+        return predictor, time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as tmp:
+        first, first_seconds = train(np.flatnonzero(base))
+        first.save_model(f"{tmp}/")
+        partial, partial_seconds = train(rows, TreeArtifact(f"{tmp}/tree_model"))
+    scratch, scratch_seconds = train(rows)
+
+    probe = X.iloc[~base]
+    summary = partial.retraining_summary()["full"]
+    report = {
+        "branch": branch,
+        "base_samples": int(base.sum()),
+        "new_samples": len(new),
+        "first_seconds": first_seconds,
+        "partial_seconds": partial_seconds,
+        "scratch_seconds": scratch_seconds,
+        "nodes": summary["nodes"],
+        "rebuilt": summary["rebuilt"],
+        "reused": summary["reused"],
+        "saved_seconds": summary["saved_seconds"],
+        "same_top_prediction": float(np.mean(
+            np.array(_top(partial.predict(probe)), dtype=object) == np.array(_top(scratch.predict(probe)), dtype=object)
+        )),
+        "rebuilt_nodes": summary["rebuilt_nodes"],
+    }
+    print(f"{report['new_samples']} new samples in {branch}, {report['nodes']} nodes")
+    print(f"rebuilt {report['rebuilt']}, reused {report['reused']} "
+          f"(~{report['saved_seconds']:.1f}s of training saved)")
+    print(f"partial {partial_seconds:.1f}s, from scratch {scratch_seconds:.1f}s, "
+          f"same top prediction {report['same_top_prediction']:.3f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+# c:\projects\DNA-utils-universal\ystr_predictor\benchmarks\run.py
+"""Бенчмарки CsvHandler и предикторов на синтетических данных
+
+Запуск из каталога ystr_predictor::
+
+    python -m benchmarks.run --samples 1000 5000 --batch-sizes 1 100 1000
+
+Каждый случай выполняется в отдельном процессе, поэтому пиковый RSS
+относится только к нему. Предикторы, для которых не установлены
+зависимости (xgboost, lightgbm, catboost), помечаются как skipped.
+Результаты пишутся в JSON, два файла сравнивает ``benchmarks.compare``.
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# Имя -> (модуль, класс, способ обучения, аргументы конструктора)
+PREDICTORS = {
+    "HaplogroupPredictor": ("models.predictor", "HaplogroupPredictor", "labels", {}),
+    "TreeHaploPredictor": ("models.tree_predictor", "TreeHaploPredictor", "paths", {}),
+    "HierarchicalHaploPredictor": ("models.hierarchical_predictor", "HierarchicalHaploPredictor", "paths", {}),
+    "EnsemblePredictor": ("models.ensemble_predictor", "EnsemblePredictor", "levels", {}),
+    # n_jobs=-1 по умолчанию не принимает ThreadPoolExecutor внутри класса
+    "CalibratedParallelPredictor": (
+        "models.calibrated_predictor", "CalibratedParallelPredictor", "levels",
+        {"n_jobs": os.cpu_count() or 1}
+    ),
+}
+CSV_READERS = ("load_data", "read_training_stream")
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Пиковый RSS текущего процесса в мегабайтах"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux отдает килобайты, macOS - байты
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 1024
+
+
+def _dataset(options: Dict):
+    from benchmarks.synthetic import SyntheticYstrDataset
+    return SyntheticYstrDataset(
+        options["samples"], depth=options["depth"],
+        branching=options["branching"], seed=options["seed"]
+    )
+
+
+def _bench_csv(options: Dict) -> List[Dict]:
+    from models.csv_handler import CsvHandler
+
+    dataset = _dataset(options)
+    data = dataset.csv_bytes()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = Path(tmp_dir) / "synthetic.csv"
+        path.write_bytes(data)
+
+        records = []
+        for workers in options["csv_workers"]:
+            timings = []
+            for _ in range(options["repeat"]):
+                start = time.perf_counter()
+                if options["name"] == "load_data":
+                    CsvHandler.load_data(str(path), workers=workers)
+                else:
+                    CsvHandler.read_training_file(str(path), workers=workers)
+                timings.append(time.perf_counter() - start)
+
+            seconds = statistics.median(timings)
+            records.append({
+                "phase": "parse",
+                "workers": workers,
+                "seconds": seconds,
+                "throughput": options["samples"] / seconds,
+                "megabytes_per_second": len(data) / 2 ** 20 / seconds,
+            })
+    return records
+
+
+def _bench_predictor(options: Dict) -> List[Dict]:
+    import numpy as np
+    from benchmarks.haplo_stub import HaploPathStub
+
+    module_name, class_name, mode, kwargs = PREDICTORS[options["name"]]
+    # ImportError здесь означает отсутствующую зависимость: случай пропускается
+    predictor_class = getattr(importlib.import_module(module_name), class_name)
+
+    dataset = _dataset(options)
+    X, y = dataset.training_data()
+    # Стратифицированное деление 80/20: в обучении остаются все группы
+    rank = y.groupby(y).cumcount()
+    train_mask = (rank < np.ceil(y.map(y.value_counts()) * 0.8)).to_numpy()
+    X_train, y_train = X[train_mask].reset_index(drop=True), y[train_mask].reset_index(drop=True)
+    X_test = X[~train_mask].reset_index(drop=True)
+    n_train = len(X_train)
+
+    results = []
+    with HaploPathStub(dataset.paths) as stub:
+        if mode == "paths":
+            kwargs = {**kwargs, "haplo_api_url": stub.url}
+        predictor = predictor_class(**kwargs)
+
+        start = time.perf_counter()
+        if mode == "paths":
+            asyncio.run(predictor.train(X_train, y_train))
+        elif mode == "levels":
+            predictor.train(X_train, dataset.level_labels(y_train))
+        else:
+            predictor.train(X_train, y_train)
+        seconds = time.perf_counter() - start
+        results.append({
+            "phase": "train",
+            "seconds": seconds,
+            "throughput": n_train / seconds,
+            "path_requests": stub.requests,
+        })
+
+    for batch_size in options["batch_sizes"]:
+        # Батч больше отложенной выборки набираем повторением строк
+        rows = [i % len(X_test) for i in range(batch_size)]
+        batch = X_test.iloc[rows].reset_index(drop=True)
+        predictor.predict(batch)  # прогрев
+
+        timings = []
+        for _ in range(options["repeat"]):
+            start = time.perf_counter()
+            predictor.predict(batch)
+            timings.append(time.perf_counter() - start)
+        seconds = statistics.median(timings)
+        results.append({
+            "phase": "predict",
+            "batch_size": batch_size,
+            "seconds": seconds,
+            "seconds_min": min(timings),
+            "throughput": batch_size / seconds,
+        })
+    return results
+
+
+def _run_case(options: Dict, queue):
+    """Точка входа дочернего процесса"""
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger().setLevel(logging.WARNING)
+    try:
+        if options["kind"] == "csv":
+            records = _bench_csv(options)
+        else:
+            records = _bench_predictor(options)
+        queue.put({"status": "ok", "records": records, "peak_rss_mb": peak_rss_mb()})
+    except ImportError as e:
+        queue.put({"status": "skipped", "error": f"Missing dependency: {e}"})
+    except Exception as e:
+        queue.put({"status": "error", "error": f"{type(e).__name__}: {e}",
+                   "traceback": traceback.format_exc()})
+
+
+def run_case(options: Dict, timeout: float) -> List[Dict]:
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=_run_case, args=(options, queue))
+    start = time.perf_counter()
+    process.start()
+
+    try:
+        outcome = queue.get(timeout=timeout)
+    except Exception:
+        outcome = {"status": "timeout", "error": f"No result in {timeout} seconds"}
+        process.terminate()
+    process.join()
+
+    base = {
+        "kind": options["kind"],
+        "name": options["name"],
+        "samples": options["samples"],
+        "status": outcome["status"],
+        "wall_seconds": time.perf_counter() - start,
+    }
+    if outcome["status"] != "ok":
+        base["error"] = outcome.get("error")
+        logging.warning(f"{options['name']} ({options['samples']} samples): {outcome['status']}: {base['error']}")
+        return [base]
+    return [
+        {**base, "peak_rss_mb": outcome["peak_rss_mb"], **record}
+        for record in outcome["records"]
+    ]
+
+
+def environment() -> Dict:
+    """Сведения для сравнения прогонов: коммит, версии, железо"""
+    import numpy
+    import pandas
+    import sklearn
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        "commit": commit,
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": numpy.__version__,
+        "pandas": pandas.__version__,
+        "sklearn": sklearn.__version__,
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--samples", type=int, nargs="+", default=[1000, 5000])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 10, 100, 1000])
+    parser.add_argument("--predictors", nargs="+", default=list(PREDICTORS),
+                        choices=list(PREDICTORS))
+    parser.add_argument("--csv", nargs="*", default=list(CSV_READERS), choices=CSV_READERS,
+                        help="CsvHandler readers to benchmark (empty to skip)")
+    parser.add_argument("--csv-workers", type=int, nargs="+", default=[1],
+                        help="Parser process counts for the CSV readers (1 - serial)")
+    parser.add_argument("--depth", type=int, default=4, help="Haplogroup tree depth")
+    parser.add_argument("--branching", type=int, default=2)
+    parser.add_argument("--repeat", type=int, default=5, help="Timed repetitions (median is reported)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--timeout", type=float, default=1800, help="Seconds per case")
+    parser.add_argument("--output", default=None,
+                        help="JSON file (default benchmarks/results/<commit>.json)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    common = {
+        "depth": args.depth, "branching": args.branching,
+        "repeat": args.repeat, "seed": args.seed, "batch_sizes": args.batch_sizes,
+        "csv_workers": args.csv_workers,
+    }
+    cases = [
+        {**common, "kind": "csv", "name": name, "samples": samples}
+        for samples in args.samples for name in args.csv
+    ] + [
+        {**common, "kind": "predictor", "name": name, "samples": samples}
+        for samples in args.samples for name in args.predictors
+    ]
+
+    results = []
+    for options in cases:
+        logging.info(f"Running {options['kind']} {options['name']} with {options['samples']} samples")
+        for record in run_case(options, args.timeout):
+            results.append(record)
+            if record["status"] == "ok":
+                batch = f" batch={record['batch_size']}" if "batch_size" in record else ""
+                batch += f" workers={record['workers']}" if "workers" in record else ""
+                logging.info(
+                    f"  {record['phase']}{batch}: {record['seconds']:.4f} s, "
+                    f"{record['throughput']:.1f} samples/s, peak RSS {record['peak_rss_mb']} MB"
+                )
+
+    report = {
+        "environment": environment(),
+        "parameters": {**common, "samples": args.samples},
+        "results": results,
+    }
+    output = Path(args.output or f"benchmarks/results/{report['environment']['commit'] or 'local'}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    logging.info(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+# c:\projects\DNA-utils-universal\ystr_predictor\benchmarks\synthetic.py
+import io
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Типичные модальные значения однокопийных маркеров панели FTDNA
+SINGLE_COPY_MODALS = {
+    "DYS393": 13, "DYS390": 24, "DYS19": 14, "DYS391": 11, "DYS426": 12,
+    "DYS388": 12, "DYS439": 12, "DYS389I": 13, "DYS392": 13, "DYS389II": 29,
+    "DYS458": 17, "DYS455": 11, "DYS454": 11, "DYS447": 25, "DYS437": 15,
+    "DYS448": 19, "DYS449": 29, "DYS460": 11, "Y-GATA-H4": 11, "DYS456": 16,
+    "DYS607": 15, "DYS576": 18, "DYS570": 17, "DYS442": 12, "DYS438": 12,
+}
+
+# Мультикопийные маркеры: модальные значения копий (как в CsvHandler.MULTI_VALUE_MARKERS)
+MULTI_COPY_MODALS = {
+    "DYS385": (11, 14),
+    "DYS464": (15, 15, 16, 17),
+    "DYF395S1": (15, 16),
+    "CDY": (36, 38),
+    "YCAII": (19, 23),
+    "DYS413": (23, 23),
+    "DYS459": (9, 10),
+}
+
+# Быстро мутирующие маркеры; остальные мутируют с базовой скоростью
+FAST_MARKERS = {"DYS449", "DYS570", "DYS576", "DYS458", "CDY", "DYS464", "DYF395S1"}
+BASE_MUTATION_RATE = 0.002
+FAST_MUTATION_RATE = 0.008
+
+
+class SyntheticYstrDataset:
+    """Синтетическая выборка Y-STR гаплотипов с глубоким деревом гаплогрупп
+
+    Дерево: ``roots`` корневых гаплогрупп, у каждого узла ``branching``
+    потомков до глубины ``depth``. Модальный гаплотип потомка получается из
+    родительского пошаговыми мутациями (±1 повтор) за ``generations``
+    поколений ветви, образец - из модального гаплотипа своей группы
+    за ``sample_generations`` поколений. Каждой группе достается не меньше
+    ``min_samples_per_group`` образцов (если их хватает), чтобы модели с
+    кросс-валидацией могли обучаться. Небольшая доля ячеек остается
+    пустой или получает микроаллель вида ``17.2``.
+
+    Пути гаплогрупп в формате ``ftdna_path`` доступны в ``paths`` и
+    отдаются заглушкой ``HaploPathStub``. Генерация детерминирована по ``seed``.
+    """
+
+    def __init__(self, n_samples: int, depth: int = 4, branching: int = 2,
+                 roots: Sequence[str] = ("R", "I", "J", "E", "G", "N"),
+                 generations: int = 40, sample_generations: int = 25,
+                 min_samples_per_group: int = 10,
+                 missing_rate: float = 0.001, microvariant_rate: float = 0.002,
+                 seed: int = 42):
+        self.n_samples = n_samples
+        self.depth = depth
+        self.branching = branching
+        self.roots = tuple(roots)
+        self.generations = generations
+        self.sample_generations = sample_generations
+        self.min_samples_per_group = min_samples_per_group
+        self.missing_rate = missing_rate
+        self.microvariant_rate = microvariant_rate
+        self.seed = seed
+
+        self.marker_columns = list(SINGLE_COPY_MODALS) + list(MULTI_COPY_MODALS)
+        # Плоский вектор всех копий: (столбец, номер копии)
+        self._slots: List[Tuple[str, int]] = [(name, 0) for name in SINGLE_COPY_MODALS]
+        for name, copies in MULTI_COPY_MODALS.items():
+            self._slots.extend((name, i) for i in range(len(copies)))
+        self._rates = np.array([
+            FAST_MUTATION_RATE if name in FAST_MARKERS else BASE_MUTATION_RATE
+            for name, _ in self._slots
+        ])
+
+        self.paths: Dict[str, List[str]] = {}
+        self.modals: Dict[str, np.ndarray] = {}
+        self._frame: Optional[pd.DataFrame] = None
+        self._build_tree(np.random.default_rng(seed))
+
+    def _mutate(self, rng: np.random.Generator, haplotype: np.ndarray, generations: int,
+                size: Optional[int] = None) -> np.ndarray:
+        shape = (size, len(haplotype)) if size else (len(haplotype),)
+        steps = rng.poisson(self._rates * generations, shape)
+        # Каждое событие - шаг на один повтор вверх или вниз
+        ups = rng.binomial(steps, 0.5)
+        return np.maximum(haplotype + 2 * ups - steps, 1)
+
+    def _build_tree(self, rng: np.random.Generator):
+        ancestor = np.array(
+            list(SINGLE_COPY_MODALS.values())
+            + [value for copies in MULTI_COPY_MODALS.values() for value in copies]
+        )
+        counter = 0
+
+        def grow(name: str, path: List[str], modal: np.ndarray, level: int):
+            nonlocal counter
+            self.paths[name] = path
+            self.modals[name] = modal
+            if level == self.depth:
+                return
+            for _ in range(self.branching):
+                counter += 1
+                # Фиксированная ширина кода: одно имя не входит в другое как подстрока
+                child = f"{path[0]}-BY{counter:05d}"
+                grow(child, path + [child], self._mutate(rng, modal, self.generations), level + 1)
+
+        for root in self.roots:
+            # Корневые гаплогруппы далеко друг от друга
+            grow(root, [root], self._mutate(rng, ancestor, self.generations * 10), 0)
+
+    @property
+    def haplogroups(self) -> List[str]:
+        return list(self.paths)
+
+    def frame(self) -> pd.DataFrame:
+        """Сырые данные в виде, в котором их загружают пользователи: строки, ``a-b`` для копий"""
+        if self._frame is not None:
+            return self._frame
+
+        rng = np.random.default_rng(self.seed + 1)
+        # Чем глубже узел, тем чаще он встречается: образцы в основном на листьях
+        names = self.haplogroups
+        weights = np.array([len(self.paths[name]) ** 2 for name in names], dtype=float)
+        minimum = min(self.min_samples_per_group, self.n_samples // len(names))
+        labels = np.concatenate([
+            np.repeat(names, minimum),
+            rng.choice(names, self.n_samples - minimum * len(names), p=weights / weights.sum())
+        ])
+        rng.shuffle(labels)
+
+        values = np.empty((self.n_samples, len(self._slots)), dtype=np.int64)
+        for name in np.unique(labels):
+            rows = np.flatnonzero(labels == name)
+            values[rows] = self._mutate(rng, self.modals[name], self.sample_generations, len(rows))
+
+        data = {}
+        position = 0
+        for column in self.marker_columns:
+            copies = len(MULTI_COPY_MODALS.get(column, (0,)))
+            block = np.sort(values[:, position:position + copies], axis=1)
+            position += copies
+            text = block[:, 0].astype(str)
+            for i in range(1, copies):
+                text = np.char.add(np.char.add(text, "-"), block[:, i].astype(str))
+            if copies == 1:
+                micro = rng.random(self.n_samples) < self.microvariant_rate
+                text = np.where(micro, np.char.add(text, ".2"), text)
+            missing = rng.random(self.n_samples) < self.missing_rate
+            data[column] = np.where(missing, "", text)
+
+        data["Haplogroup"] = labels
+        self._frame = pd.DataFrame(data)
+        return self._frame
+
+    def to_csv(self, path_or_buffer=None) -> Optional[str]:
+        """CSV с разделителем ``;``, как ожидает CsvHandler"""
+        return self.frame().to_csv(path_or_buffer, sep=";", index=False)
+
+    def csv_bytes(self) -> bytes:
+        return self.to_csv().encode("utf-8")
+
+    def training_data(self) -> Tuple[pd.DataFrame, pd.Series]:
+        """Числовые X и y тем же путем, что и загрузка через /api/train/csv"""
+        from models.csv_handler import CsvHandler
+        return CsvHandler.read_training_stream(io.BytesIO(self.csv_bytes()))
+
+    def level_labels(self, y: pd.Series) -> Dict[str, pd.Series]:
+        """Метки по уровням для ансамблевых предикторов: корень и полная гаплогруппа"""
+        levels = {
+            "base": y.map(lambda name: self.paths[name][0]),
+            "subclade": y,
+        }
+        # Ансамбли ждут целочисленные метки (np.bincount)
+        return {
+            level: pd.Series(pd.factorize(labels, sort=True)[0], index=labels.index)
+            for level, labels in levels.items()
+        }
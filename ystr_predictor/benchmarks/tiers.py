@@ -0,0 +1,141 @@
+# c:\projects\DNA-utils-universal\ystr_predictor\benchmarks\tiers.py
+"""Точность и задержка деревьев панелей FTDNA против полной модели
+
+    python -m benchmarks.tiers --samples 5000 --output tiers.json
+
+Дерево и деревья панелей обучаются на синтетической выборке. Отложенные
+образцы урезаются до маркеров каждой панели (остальные не присылаются) и
+предсказываются дважды: с маршрутизацией в дерево панели и полной моделью
+на дополненных нулями маркерах, как было до появления панелей.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import statistics
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from benchmarks.haplo_stub import HaploPathStub
+from benchmarks.synthetic import SyntheticYstrDataset
+from models.marker_dtypes import marker_values
+from models.marker_schema import PANEL_TIERS, MarkerSchema
+from models.tree_predictor import TreeHaploPredictor
+
+
+def _forest_size(predictor: TreeHaploPredictor) -> Dict[str, int]:
+    nodes = trees = 0
+    stack = [predictor.root]
+    while stack:
+        node = stack.pop()
+        compiled = predictor._node_compiled(node) if predictor._has_model(node) else None
+        if compiled is not None:
+            nodes += 1
+            trees += compiled.n_trees
+        stack.extend(node.children.values())
+    return {"features": len(predictor.feature_names or []), "node_models": nodes, "trees": trees}
+
+
+def path_accuracy(predictions: List[Dict], labels: np.ndarray, paths: Dict[str, List[str]]) -> Dict[str, float]:
+    """Доля точных конечных гаплогрупп и доля предсказаний на верном пути"""
+    exact = on_path = 0
+    for prediction, label in zip(predictions, labels):
+        levels = prediction["path_predictions"]
+        if not levels:
+            continue
+        predicted = levels[-1]["predictions"][0]["haplogroup"]
+        exact += predicted == label
+        on_path += predicted in paths[label]
+    return {"exact": exact / len(labels), "on_path": on_path / len(labels)}
+
+
+def _latency(predictor: TreeHaploPredictor, samples: List[Dict], batch_size: int, repeat: int) -> float:
+    """Медиана секунд на один вызов predict_markers для батча ``batch_size``"""
+    batch = [samples[i % len(samples)] for i in range(batch_size)]
+    predictor.predict_markers(batch)  # прогрев
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        predictor.predict_markers(batch)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Panel tier accuracy and latency report")
+    parser.add_argument("--samples", type=int, default=5000)
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 100])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=None, help="Optional JSON file for the report")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+
+    dataset = SyntheticYstrDataset(args.samples, depth=args.depth, seed=args.seed)
+    X, y = dataset.training_data()
+    # Стратифицированное деление 80/20, как в benchmarks.run
+    rank = y.groupby(y).cumcount()
+    train_mask = (rank < np.ceil(y.map(y.value_counts()) * 0.8)).to_numpy()
+
+    predictor = TreeHaploPredictor()
+    with HaploPathStub(dataset.paths) as stub:
+        predictor.haplo_api_url = stub.url
+        start = time.perf_counter()
+        asyncio.run(predictor.train(X[train_mask], y[train_mask]))
+        train_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        asyncio.run(predictor.train_tiers(X[train_mask], y[train_mask]))
+        tiers_seconds = time.perf_counter() - start
+    print(f"trained full tree in {train_seconds:.1f} s, tiers {sorted(predictor.tiers)} in {tiers_seconds:.1f} s")
+
+    test = X[~train_mask]
+    labels = y[~train_mask].to_numpy()
+    values = marker_values(test)
+
+    report = {"samples": args.samples, "train_seconds": train_seconds,
+              "tiers_train_seconds": tiers_seconds, "tiers": []}
+    print(f"{'panel':<6} {'model':<6} {'features':>8} {'trees':>6} {'exact':>7} {'on path':>8} "
+          + " ".join(f"{f'batch={size} ms':>14}" for size in args.batch_sizes))
+
+    for tier in [*sorted(PANEL_TIERS, key=PANEL_TIERS.get), None]:
+        panel = MarkerSchema.ftdna(tier=tier) if tier else None
+        columns = [c for c in test.columns if panel is None or panel.position(c) is not None]
+        if tier and len(columns) == len(test.columns):
+            # Панель покрывает все маркеры выборки: это и есть полная модель
+            continue
+        positions = [test.columns.get_loc(c) for c in columns]
+        samples = [dict(zip(columns, row)) for row in values[:, positions].tolist()]
+
+        for routed in (True, False):
+            predictor.route_panels = routed
+            predictions = predictor.predict_markers(samples)
+            served = predictions[0].get("panel", "full")
+            model = predictor.tiers.get(served, predictor)
+            entry = {
+                "panel": tier or "all",
+                "routed": routed,
+                "served_by": served,
+                **_forest_size(model),
+                **path_accuracy(predictions, labels, dataset.paths),
+                "latency_seconds": {
+                    size: _latency(predictor, samples, size, args.repeat) for size in args.batch_sizes
+                },
+            }
+            report["tiers"].append(entry)
+            print(f"{entry['panel']:<6} {served:<6} {entry['features']:>8} {entry['trees']:>6} "
+                  f"{entry['exact']:>7.3f} {entry['on_path']:>8.3f} "
+                  + " ".join(f"{entry['latency_seconds'][size] * 1e3:>14.2f}" for size in args.batch_sizes))
+            if tier is None:
+                break
+    predictor.route_panels = True
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
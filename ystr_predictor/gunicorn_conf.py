@@ -0,0 +1,61 @@
+# c:\projects\DNA-utils-universal\ystr_predictor\gunicorn_conf.py
+# Боевой запуск: gunicorn -c gunicorn_conf.py app:app
+#
+# Модель загружается и прогревается один раз в мастер-процессе (preload_app),
+# воркеры получают ее страницы через fork по copy-on-write. Массивы лесов
+# отображены из артефакта в память и общие для всех воркеров.
+import gc
+import multiprocessing
+import os
+import tempfile
+
+bind = os.environ.get("BIND", "0.0.0.0:9004")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+
+# Multiprocess-режим prometheus_client: счетчики и гистограммы воркеров
+# пишутся в файлы общего каталога, и /metrics любого воркера отдает сумму
+# (см. models.metrics). Задается до загрузки приложения; заданный снаружи
+# каталог нужно очищать перед запуском
+if not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="ystr_metrics_")
+
+# Перезапуск воркеров после N запросов (0 - не перезапускать), с разбросом,
+# чтобы воркеры не уходили на перезапуск одновременно
+max_requests = int(os.environ.get("MAX_REQUESTS", "10000"))
+max_requests_jitter = int(os.environ.get("MAX_REQUESTS_JITTER", "1000"))
+
+# Сколько ждать завершения текущих запросов при HUP/TERM
+graceful_timeout = int(os.environ.get("GRACEFUL_TIMEOUT", "30"))
+timeout = int(os.environ.get("TIMEOUT", "120"))
+keepalive = int(os.environ.get("KEEPALIVE", "5"))
+
+# Пустое значение отключает журнал запросов
+accesslog = os.environ.get("ACCESS_LOG", "-") or None
+loglevel = os.environ.get("LOG_LEVEL", "info")
+
+
+def when_ready(server):
+    """Мастер загрузил приложение и вот-вот начнет запускать воркеры"""
+    from app import model_store
+
+    handle = model_store.current
+    if handle is not None:
+        # Собираем все узлы заранее, иначе каждый воркер сделает это сам
+        handle.predictor.materialize()
+        server.log.info(f"Preloaded model version {handle.version}")
+    else:
+        server.log.warning("No model loaded, workers start without a model")
+
+    # Объекты, созданные до fork, убираем из-под сборщика мусора: его
+    # обход иначе трогает их заголовки и копирует страницы в каждый воркер
+    gc.collect()
+    gc.freeze()
+
+
+def child_exit(server, worker):
+    """Убирает live-файлы завершенного воркера из каталога метрик"""
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
@@ -1,4 +1,5 @@
 # c:\projects\DNA-utils-universal\ystr_predictor\models\calibrated_predictor.py
+# -*- coding: cp1251 -*-
 from sklearn.calibration import CalibratedClassifierCV
 from sklearn.preprocessing import StandardScaler
 from sklearn.model_selection import StratifiedKFold
@@ -12,6 +13,7 @@ import concurrent.futures
 from dataclasses import dataclass
 from pathlib import Path
 import time
+from models.marker_dtypes import decode_markers
 
 @dataclass
 class ModelConfig:
@@ -155,7 +157,7 @@ class CalibratedParallelPredictor:
             
             # 
             scaler = StandardScaler()
-            X_scaled = scaler.fit_transform(X)
+            X_scaled = scaler.fit_transform(decode_markers(X))
             self.scalers[level] = scaler
             
             #    
@@ -196,13 +198,13 @@ class CalibratedParallelPredictor:
 
     def predict_level(self, X: pd.DataFrame, level: str) -> np.ndarray:
         """  """
-        X_scaled = self.scalers[level].transform(X)
+        X_scaled = self.scalers[level].transform(decode_markers(X))
         S_test = self._get_stacking_predictions(self.calibrated_models[level], X_scaled)
         return self.meta_models[level].predict(S_test)
 
     def predict_proba_level(self, X: pd.DataFrame, level: str) -> np.ndarray:
         """   """
-        X_scaled = self.scalers[level].transform(X)
+        X_scaled = self.scalers[level].transform(decode_markers(X))
         S_test = self._get_stacking_predictions(self.calibrated_models[level], X_scaled)
         return self.meta_models[level].predict_proba(S_test)
 
@@ -0,0 +1,141 @@
+# c:\projects\DNA-utils-universal\ystr_predictor\models\compiled_forest.py
+import numpy as np
+from typing import Dict, Optional, Tuple
+
+
+class CompiledForest:
+    """RandomForestClassifier вместе со StandardScaler в виде плоских массивов
+
+    Все деревья леса склеены в общие массивы узлов (признак, порог,
+    потомки, вероятности листа). Листья ссылаются сами на себя. Массивы
+    могут быть срезами memory-mapped файлов артефакта: конструктор ничего
+    не копирует и не пересчитывает.
+    Спуск идет сразу для всех образцов и всех деревьев без вызовов sklearn,
+    на каждом шаге двигаются только пары (дерево, образец), еще не
+    дошедшие до листа.
+
+    Порядок вычислений повторяет sklearn: масштабирование во float64,
+    приведение к float32, нормировка листа и последовательное суммирование
+    деревьев. Поэтому ``predict_proba`` совпадает с
+    ``model.predict_proba(scaler.transform(X))`` бит в бит.
+    """
+
+    ARRAY_NAMES = (
+        "feature", "threshold", "children", "is_leaf", "missing_left",
+        "leaf_proba", "roots", "mean", "scale"
+    )
+
+    def __init__(self, arrays: Dict[str, np.ndarray], classes: np.ndarray,
+                 feature_names: Optional[Tuple[str, ...]], max_depth: int):
+        self.feature = arrays["feature"]
+        self.threshold = arrays["threshold"]
+        # Потомки подряд: children[2 * node + go_right]
+        self.children = arrays["children"]
+        self.is_leaf = arrays["is_leaf"]
+        self.missing_left = arrays["missing_left"]
+        self.leaf_proba = arrays["leaf_proba"]
+        self.roots = arrays["roots"]
+        self.mean = arrays["mean"]
+        self.scale = arrays["scale"]
+        self.classes = classes
+        self.feature_names = feature_names
+        self.max_depth = max_depth
+
+    @classmethod
+    def from_sklearn(cls, model, scaler=None) -> 'CompiledForest':
+        """Компилирует обученный лес (и скейлер узла) в плоские массивы"""
+        n_classes = len(model.classes_)
+        n_features = model.n_features_in_
+
+        features, thresholds, children, leaves, missing, probas, roots = [], [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            node_ids = np.arange(tree.node_count, dtype=np.int32)
+            is_leaf = tree.children_left == -1
+
+            features.append(np.where(is_leaf, 0, tree.feature).astype(np.int32))
+            thresholds.append(tree.threshold.astype(np.float64))
+            left = np.where(is_leaf, node_ids, tree.children_left) + offset
+            right = np.where(is_leaf, node_ids, tree.children_right) + offset
+            children.append(np.column_stack((left, right)).ravel().astype(np.int32))
+            leaves.append(is_leaf)
+            missing_left = getattr(tree, "missing_go_to_left", None)
+            if missing_left is None:
+                missing_left = np.zeros(tree.node_count, dtype=bool)
+            missing.append(np.asarray(missing_left, dtype=bool))
+
+            # Та же нормировка, что в DecisionTreeClassifier.predict_proba
+            proba = tree.value[:, 0, :n_classes].astype(np.float64)
+            normalizer = proba.sum(axis=1)[:, np.newaxis]
+            normalizer[normalizer == 0.0] = 1.0
+            probas.append(proba / normalizer)
+
+            roots.append(offset)
+            offset += tree.node_count
+            max_depth = max(max_depth, tree.max_depth)
+
+        if scaler is not None:
+            mean = scaler.mean_ if scaler.with_mean else np.zeros(n_features)
+            scale = scaler.scale_ if scaler.with_std else np.ones(n_features)
+            feature_names = tuple(getattr(scaler, "feature_names_in_", ())) or None
+        else:
+            mean, scale = np.zeros(n_features), np.ones(n_features)
+            feature_names = tuple(getattr(model, "feature_names_in_", ())) or None
+
+        arrays = {
+            "feature": np.concatenate(features),
+            "threshold": np.concatenate(thresholds),
+            "children": np.concatenate(children),
+            "is_leaf": np.concatenate(leaves),
+            "missing_left": np.concatenate(missing),
+            "leaf_proba": np.concatenate(probas),
+            "roots": np.asarray(roots, dtype=np.int32),
+            "mean": np.asarray(mean, dtype=np.float64),
+            "scale": np.asarray(scale, dtype=np.float64),
+        }
+        return cls(arrays, np.asarray(model.classes_), feature_names, max_depth)
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+    def apply(self, X: np.ndarray) -> np.ndarray:
+        """Возвращает глобальные индексы листьев, форма (n_trees, n_samples)"""
+        X = np.asarray(X, dtype=np.float64)
+        # StandardScaler.transform, затем приведение к float32, как в лесу
+        X = np.ascontiguousarray(((X - self.mean) / self.scale).astype(np.float32))
+        n_samples, n_features = X.shape
+        values_flat = X.ravel()
+        has_nan = np.isnan(values_flat).any()
+
+        # Пары (дерево, образец) в плоском виде; двигаем только те, что не в листе
+        nodes = np.repeat(self.roots, n_samples)
+        active = np.flatnonzero(~self.is_leaf[nodes])
+        current = nodes[active]
+        offsets = (active % n_samples) * n_features
+
+        while active.size:
+            values = values_flat[offsets + self.feature[current]]
+            go_right = ~(values <= self.threshold[current])
+            if has_nan:
+                go_right = np.where(np.isnan(values), ~self.missing_left[current], go_right)
+            current = self.children[2 * current + go_right]
+
+            pending = ~self.is_leaf[current]
+            finished = ~pending
+            nodes[active[finished]] = current[finished]
+            active, current, offsets = active[pending], current[pending], offsets[pending]
+        return nodes.reshape(self.n_trees, n_samples)
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        """Вероятности классов для матрицы признаков в порядке feature_names"""
+        leaves = self.apply(X)
+        # Сумма по первой оси идет последовательно по деревьям, как в sklearn
+        proba = self.leaf_proba[leaves].sum(axis=0)
+        proba /= self.n_trees
+        return proba
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        return {name: getattr(self, name) for name in self.ARRAY_NAMES}
@@ -1,11 +1,28 @@
 # c:\projects\DNA-utils-universal\ystr_predictor\models\csv_handler.py
 import pandas as pd
 import numpy as np
-from typing import List, Dict, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Tuple, BinaryIO, Iterator, Optional, Union
+import io
 import logging
+import multiprocessing
+import os
 import re
 
+from models.dataset_stats import DatasetStats
+from models.marker_dtypes import compact_markers, concat_markers, marker_scales, with_scales
+from models.sampling import ReservoirSampler
+
 class CsvHandler:
+    # Версия результата разбора: увеличивать, когда меняются выходные
+    # данные load_data или read_training_stream (сбрасывает DatasetCache)
+    PARSER_VERSION = 4
+
+    # Параллельный разбор: байт тела файла на одно задание пула (не меньше
+    # PARALLEL_MIN_BYTES, чтобы запуск процесса окупался)
+    PARALLEL_BLOCK_BYTES = 64 * 1024 ** 2
+    PARALLEL_MIN_BYTES = 4 * 1024 ** 2
+
     # Маркеры, которые могут иметь множественные значения
     MULTI_VALUE_MARKERS = {
         'DYS385': 2,
@@ -35,48 +52,347 @@ class CsvHandler:
                 
         return sorted(result) if result else []
 
+    # Байты-разделители для r'[-,/\s]+' в ASCII-строках (\s включает \x1c-\x1f);
+    # \x00 разделяет ячейки в общем буфере
+    _SEPARATOR_BYTES = np.zeros(256, dtype=bool)
+    _SEPARATOR_BYTES[list(b"-,/ \t\n\r\x0b\x0c\x1c\x1d\x1e\x1f\x00")] = True
+
     @staticmethod
-    def load_data(file_path: str, sample_size: int = None) -> Tuple[pd.DataFrame, str, List[str]]:
-        """Загрузка данных из CSV"""
-        # Читаем CSV с разделителем ";"
-        df = pd.read_csv(file_path, sep=';')
-        logging.info(f"Initial rows: {len(df)}")
+    def _tokenize_multi_values(text: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Разбирает ASCII-ячейки, склеенные через ``\\x00``, без цикла по ячейкам
 
-        # Если задан размер выборки, берем случайную выборку
-        if sample_size and sample_size < len(df):
-            df = df.sample(n=sample_size, random_state=42)
-            logging.info(f"Sampled {sample_size} rows")
+        Токены - непрерывные участки без разделителей. Годными считаются
+        токены вида ``+?[0-9]+`` (их примет ``int()``), остальные
+        отбрасываются. Возвращает номера ячеек и значения годных токенов.
+        """
+        buffer = np.frombuffer(text.encode("ascii"), dtype=np.uint8)
+        empty = np.empty(0, dtype=np.int64)
+        if buffer.size == 0:
+            return empty, empty
 
-        haplo_column = 'Haplogroup'
+        inside = ~CsvHandler._SEPARATOR_BYTES[buffer]
+        previous = np.r_[False, inside[:-1]]
+        following = np.r_[inside[1:], False]
+        starts = np.flatnonzero(inside & ~previous)
+        ends = np.flatnonzero(inside & ~following) + 1
+        if starts.size == 0:
+            return empty, empty
+
+        is_digit = (buffer >= ord("0")) & (buffer <= ord("9"))
+        leading_plus = np.zeros(buffer.size, dtype=bool)
+        leading_plus[starts] = buffer[starts] == ord("+")
+        bad = inside & ~is_digit & ~leading_plus
+
+        # Счетчики по токенам
+        token_of = np.cumsum(inside & ~previous) - 1
+        bad_count = np.bincount(token_of[bad], minlength=starts.size)
+        digit_positions = np.flatnonzero(is_digit)
+        owner = token_of[digit_positions]
+        digit_count = np.bincount(owner, minlength=starts.size)
+        # Токены длиннее 18 цифр не помещаются в int64 и отбрасываются
+        valid = (bad_count == 0) & (digit_count > 0) & (digit_count <= 18)
+
+        # Значение токена: сумма цифр с весами 10 ** (позиция от конца токена)
+        power = np.minimum(ends[owner] - digit_positions - 1, 18)
+        contributions = (buffer[digit_positions] - ord("0")).astype(np.int64) * (10 ** power)
+        if digit_count.max() <= 15:
+            # Суммы до 10 ** 15 точны и во float64, а bincount намного быстрее add.at
+            values = np.bincount(owner, weights=contributions, minlength=starts.size).astype(np.int64)
+        else:
+            values = np.zeros(starts.size, dtype=np.int64)
+            np.add.at(values, owner, contributions)
+
+        # Номер ячейки: сколько разделителей ячеек встретилось до начала токена
+        rows = np.cumsum(buffer == 0)[starts]
+        return rows[valid], values[valid]
+
+    @staticmethod
+    def parse_multi_value_column(column: pd.Series, num_values: int) -> np.ndarray:
+        """Векторный вариант ``parse_multi_values`` для целого столбца
+
+        Возвращает матрицу int64 формы ``(len(column), num_values)``: значения
+        ячейки по возрастанию, недостающие позиции заполнены нулями, лишние
+        отброшены - как у построчного разбора. Токены, которые не разбирает
+        ``int()`` (например, микроаллели ``15.2``), пропускаются.
+        """
+        result = np.zeros((len(column), num_values), dtype=np.int64)
+        present = np.flatnonzero(column.notna().to_numpy())
+        if present.size == 0:
+            return result
+
+        # str() ячейки, как в построчном разборе (у числовых столбцов это "11.0")
+        values = column.to_numpy()[present]
+        if pd.api.types.infer_dtype(values, skipna=False) == "string":
+            cells = values.tolist()
+        else:
+            cells = [str(value) for value in values]
+        text = "\x00".join(cells)
+
+        if text.isascii() and "_" not in text and text.count("\x00") == len(cells) - 1:
+            rows, values = CsvHandler._tokenize_multi_values(text)
+            rows = present[rows]
+        else:
+            # Не-ASCII символы (юникодные цифры и пробелы) и "_" внутри чисел
+            # бывают в единичных ячейках: их разбираем прежним способом
+            simple = np.array([cell.isascii() and "_" not in cell and "\x00" not in cell
+                               for cell in cells], dtype=bool)
+            rows, values = CsvHandler._tokenize_multi_values(
+                "\x00".join(cell for cell, ok in zip(cells, simple) if ok)
+            )
+            rows = present[simple][rows]
+            parsed = [CsvHandler.parse_multi_values(cells[i]) for i in np.flatnonzero(~simple)]
+            rows = np.concatenate([rows, np.repeat(present[~simple], [len(p) for p in parsed])])
+            values = np.concatenate([values, np.array([v for p in parsed for v in p], dtype=np.int64)])
+            order = np.argsort(rows, kind="stable")
+            rows, values = rows[order], values[order]
+
+        if rows.size == 0:
+            return result
+
+        # Токены идут по строкам подряд: номер токена внутри своей строки
+        starts = np.r_[0, np.flatnonzero(np.diff(rows)) + 1]
+        positions = np.arange(len(rows)) - np.repeat(starts, np.diff(np.r_[starts, len(rows)]))
+        width = int(positions.max()) + 1
+
+        if width <= 16:
+            # Сортируем значения внутри строки в дополненной матрице
+            padded = np.full((len(column), width), np.iinfo(np.int64).max, dtype=np.int64)
+            padded[rows, positions] = values
+            padded.sort(axis=1)
+            padded = padded[:, :num_values]
+            padded[padded == np.iinfo(np.int64).max] = 0
+            result[:, :padded.shape[1]] = padded
+            return result
+
+        order = np.lexsort((values, rows))
+        keep = positions < num_values
+        result[rows[keep], positions[keep]] = values[order][keep]
+        return result
+
+    @staticmethod
+    def process_frame(df: pd.DataFrame, haplo_column: str = 'Haplogroup') -> pd.DataFrame:
+        """Переводит сырые столбцы в числовые маркеры
+
+        Мультизначные маркеры раскладываются на столбцы ``<маркер>_<i>``,
+        остальные приводятся к числам (нечисловое - 0). Значения хранятся
+        в компактных типах, масштабы столбцов - в attrs таблицы
+        (см. ``models.marker_dtypes``).
+        """
         if haplo_column not in df.columns:
             raise ValueError(f"Required column '{haplo_column}' not found")
 
         # Создаем новый DataFrame для обработанных данных
         processed_data = {haplo_column: df[haplo_column]}
+        scales = {}
 
         # Сначала обрабатываем мультизначные маркеры
         for column, num_values in CsvHandler.MULTI_VALUE_MARKERS.items():
             if column in df.columns:
-                values_lists = df[column].apply(CsvHandler.parse_multi_values)
+                values = CsvHandler.parse_multi_value_column(df[column], num_values)
                 
                 # Создаем колонки для каждой позиции
                 for i in range(num_values):
                     new_col = f"{column}_{i+1}"
-                    processed_data[new_col] = values_lists.apply(
-                        lambda x: x[i] if i < len(x) else 0
-                    )
+                    compact, scales[new_col] = compact_markers(values[:, i])
+                    processed_data[new_col] = pd.Series(compact, index=df.index)
 
         # Затем обрабатываем остальные маркеры
         for column in df.columns:
             if column != haplo_column and column not in CsvHandler.MULTI_VALUE_MARKERS:
                 try:
-                    processed_data[column] = pd.to_numeric(df[column], errors='coerce').fillna(0)
+                    numeric = pd.to_numeric(df[column], errors='coerce').fillna(0)
+                    compact, scales[column] = compact_markers(numeric.to_numpy())
+                    processed_data[column] = pd.Series(compact, index=df.index)
                 except Exception as e:
                     logging.warning(f"Error processing column {column}: {str(e)}")
                     continue
 
-        # Создаем новый DataFrame с обработанными данными
-        processed_df = pd.DataFrame(processed_data)
+        return with_scales(pd.DataFrame(processed_data), scales)
+
+    @staticmethod
+    def _read_chunks(source: Union[str, BinaryIO], chunksize: int, haplo_column: str):
+        # Мультизначные маркеры читаются строками: выведенный по куску тип
+        # (число или текст) менял бы их разбор. Однокопийные маркеры разбирает
+        # C-парсер, pd.to_numeric по строкам намного медленнее
+        dtype = {column: str for column in CsvHandler.MULTI_VALUE_MARKERS}
+        dtype[haplo_column] = str
+        return pd.read_csv(source, sep=';', dtype=dtype, chunksize=chunksize)
+
+    @staticmethod
+    def iter_chunks(source: Union[str, BinaryIO], chunksize: int = 50000,
+                    haplo_column: str = 'Haplogroup') -> Iterator[pd.DataFrame]:
+        """Читает CSV кусками по ``chunksize`` строк и отдает их обработанными
+
+        Куски имеют тот же вид, что и результат ``load_data``. Компактный
+        тип столбца выбирается для каждого куска отдельно, поэтому у разных
+        кусков он может отличаться; ``concat_chunks`` склеивает их без потерь.
+        """
+        for chunk in CsvHandler._read_chunks(source, chunksize, haplo_column):
+            yield CsvHandler.process_frame(chunk, haplo_column)
+
+    @staticmethod
+    def concat_chunks(chunks: List[pd.DataFrame], haplo_column: str = 'Haplogroup') -> pd.DataFrame:
+        """Склеивает обработанные куски, приводя маркеры к общему компактному типу"""
+        if len(chunks) == 1:
+            return chunks[0]
+        index = np.concatenate([chunk.index.to_numpy() for chunk in chunks])
+        chunk_scales = [marker_scales(chunk) for chunk in chunks]
+        data, scales = {}, {}
+        for column in chunks[0].columns:
+            if column == haplo_column:
+                data[column] = np.concatenate([chunk[column].to_numpy() for chunk in chunks])
+            else:
+                data[column], scales[column] = concat_markers(
+                    [chunk[column].to_numpy() for chunk in chunks],
+                    [chunk_scale.get(column, 1) for chunk_scale in chunk_scales]
+                )
+        return with_scales(pd.DataFrame(data, index=index), scales)
+
+    @staticmethod
+    def sample_stream(source: Union[str, BinaryIO], sample_size: int, stratify: bool = False,
+                      chunksize: int = 50000, haplo_column: str = 'Haplogroup',
+                      seed: int = 42) -> pd.DataFrame:
+        """Случайная выборка сырых строк CSV за один проход
+
+        В памяти одновременно лежат только кусок и выборка. Со
+        ``stratify=True`` выборка выравнивается по гаплогруппам
+        (см. ``ReservoirSampler``).
+        """
+        sampler = ReservoirSampler(sample_size, stratify=stratify, seed=seed)
+        for chunk in CsvHandler._read_chunks(source, chunksize, haplo_column):
+            if haplo_column not in chunk.columns:
+                raise ValueError(f"Required column '{haplo_column}' not found")
+            sampler.add(chunk, chunk[haplo_column])
+        logging.info(f"Sampled {len(sampler.sample())} of {sampler.rows_seen} rows")
+        return sampler.sample()
+
+    @staticmethod
+    def split_lines(path: str, parts: int,
+                    block_bytes: Optional[int] = None) -> Tuple[int, List[Tuple[int, int]]]:
+        """Делит тело CSV на диапазоны байтов по границам строк
+
+        Возвращает длину строки заголовка и диапазоны ``[start, end)``: их не
+        меньше ``parts`` и каждый не больше ``block_bytes``, но не короче
+        ``PARALLEL_MIN_BYTES``. Граница сдвигается на начало следующей строки,
+        поэтому строки с переводом строки внутри кавычек не поддерживаются
+        (в выгрузках STR их нет).
+        """
+        block_bytes = block_bytes or CsvHandler.PARALLEL_BLOCK_BYTES
+        size = os.path.getsize(path)
+        with open(path, 'rb') as f:
+            f.readline()
+            header_end = f.tell()
+            body = size - header_end
+            count = max(parts, -(-body // block_bytes))
+            count = max(1, min(count, -(-body // CsvHandler.PARALLEL_MIN_BYTES)))
+
+            bounds = [header_end]
+            for i in range(1, count):
+                # Начало строки, в которой лежит байт target - 1, и переход к следующей
+                f.seek(header_end + body * i // count - 1)
+                f.readline()
+                position = f.tell()
+                if bounds[-1] < position < size:
+                    bounds.append(position)
+            bounds.append(size)
+        return header_end, list(zip(bounds[:-1], bounds[1:]))
+
+    @staticmethod
+    def _parse_range(path: str, header_end: int, start: int, end: int, parser: str,
+                     chunksize: int, haplo_column: str) -> List:
+        """Задание пула: разбирает строки ``[start, end)`` с заголовком файла"""
+        with open(path, 'rb') as f:
+            header = f.read(header_end)
+            f.seek(start)
+            body = f.read(end - start)
+        source = io.BytesIO(header + body)
+        del body
+        if parser == 'load_data':
+            return list(CsvHandler.iter_chunks(source, chunksize, haplo_column))
+        return list(CsvHandler._training_blocks(source, chunksize, haplo_column))
+
+    @staticmethod
+    def parse_parallel(path: str, parser: str = 'load_data', workers: Optional[int] = None,
+                       chunksize: int = 50000, haplo_column: str = 'Haplogroup',
+                       block_bytes: Optional[int] = None) -> List:
+        """Разбирает файл по диапазонам строк в пуле процессов
+
+        Возвращает результаты кусков (как ``iter_chunks`` для ``parser='load_data'``
+        или блоки ``read_training_stream``) в порядке строк файла. Склейка
+        тех же кусков дает результат, равный последовательному разбору:
+        компактные типы примиряются ``concat_markers`` независимо от того,
+        где прошли границы кусков. ``workers=None`` - все ядра.
+        """
+        workers = workers or os.cpu_count() or 1
+        header_end, ranges = CsvHandler.split_lines(path, workers, block_bytes)
+        if len(ranges) == 1 or workers == 1:
+            return [
+                result
+                for start, end in ranges
+                for result in CsvHandler._parse_range(path, header_end, start, end,
+                                                      parser, chunksize, haplo_column)
+            ]
+
+        # spawn, как у TrainingJobManager: fork процесса с потоками uvicorn небезопасен
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=min(workers, len(ranges)), mp_context=context) as pool:
+            parts = pool.map(
+                CsvHandler._parse_range,
+                *zip(*[(path, header_end, start, end, parser, chunksize, haplo_column)
+                       for start, end in ranges])
+            )
+            results = [result for part in parts for result in part]
+        logging.info(f"Parsed {path} in {len(ranges)} ranges with {min(workers, len(ranges))} workers")
+        return results
+
+    @staticmethod
+    def _update_stats(stats: Optional[DatasetStats], chunks: List[pd.DataFrame], haplo_column: str):
+        """Добавляет обработанные куски в накопитель статистики (если он передан)"""
+        if stats is None:
+            return
+        for chunk in chunks:
+            stats.update(chunk.drop(columns=haplo_column), chunk[haplo_column])
+
+    @staticmethod
+    def load_data(file_path: Union[str, BinaryIO], sample_size: int = None, stratify: bool = False,
+                  chunksize: int = 50000, workers: Optional[int] = 1,
+                  stats: Optional[DatasetStats] = None) -> Tuple[pd.DataFrame, str, List[str]]:
+        """Загрузка данных из CSV
+
+        Файл читается кусками по ``chunksize`` строк. С ``sample_size``
+        сначала за один проход отбирается выборка сырых строк (равномерная
+        или выровненная по гаплогруппам при ``stratify=True``), и
+        обрабатывается только она, поэтому память не зависит от размера файла.
+
+        Полный файл по пути с ``workers`` больше 1 (``None`` - все ядра)
+        разбирается параллельно по диапазонам строк (см. ``parse_parallel``)
+        с тем же результатом.
+
+        ``stats`` (``DatasetStats``) дополняется статистикой загруженных
+        строк по мере обработки кусков, без второго прохода.
+        """
+        haplo_column = 'Haplogroup'
+
+        if sample_size:
+            sample = CsvHandler.sample_stream(file_path, sample_size, stratify=stratify,
+                                              chunksize=chunksize, haplo_column=haplo_column)
+            processed_df = CsvHandler.process_frame(sample, haplo_column)
+            CsvHandler._update_stats(stats, [processed_df], haplo_column)
+        elif workers != 1 and isinstance(file_path, (str, os.PathLike)):
+            chunks = CsvHandler.parse_parallel(str(file_path), 'load_data', workers,
+                                               chunksize, haplo_column)
+            # Нумерация строк каждого диапазона начинается с нуля: перенумеровываем
+            # куски подряд, как при последовательном чтении
+            offset = 0
+            for chunk in chunks:
+                chunk.index = pd.RangeIndex(offset, offset + len(chunk))
+                offset += len(chunk)
+            CsvHandler._update_stats(stats, chunks, haplo_column)
+            processed_df = CsvHandler.concat_chunks(chunks, haplo_column)
+        else:
+            chunks = list(CsvHandler.iter_chunks(file_path, chunksize, haplo_column))
+            CsvHandler._update_stats(stats, chunks, haplo_column)
+            processed_df = CsvHandler.concat_chunks(chunks, haplo_column)
         
         # Получаем список всех маркеров (колонок кроме гаплогруппы)
         markers = [col for col in processed_df.columns if col != haplo_column]
@@ -88,4 +404,69 @@ class CsvHandler:
         logging.info("\nFirst few rows of processed data:")
         logging.info(processed_df.head().to_string())
 
-        return processed_df, haplo_column, markers
\ No newline at end of file
+        return processed_df, haplo_column, markers
+
+    @staticmethod
+    def _training_blocks(stream: BinaryIO, chunksize: int,
+                         haplo_column: str) -> Iterator[Tuple[List[str], np.ndarray, int, np.ndarray]]:
+        """Куски ``read_training_stream``: имена маркеров, компактная матрица, ее масштаб, метки"""
+        for chunk in pd.read_csv(stream, sep=';', dtype=str, chunksize=chunksize):
+            if haplo_column not in chunk.columns:
+                raise ValueError(f"Required column '{haplo_column}' not found")
+            columns = [col for col in chunk.columns if col != haplo_column]
+
+            values = np.empty((len(chunk), len(columns)), dtype=np.float32)
+            for i, col in enumerate(columns):
+                # Векторно отрезаем всё после первого "-"
+                first = chunk[col].str.partition('-')[0].str.strip()
+                values[:, i] = pd.to_numeric(first, errors='coerce')
+
+            valid = ~np.isnan(values).any(axis=1) & chunk[haplo_column].notna().to_numpy()
+            yield (columns, *compact_markers(values[valid]), chunk[haplo_column].to_numpy()[valid])
+
+    @staticmethod
+    def _training_frame(blocks: List[Tuple[List[str], np.ndarray, int, np.ndarray]], haplo_column: str,
+                        stats: Optional[DatasetStats] = None) -> Tuple[pd.DataFrame, pd.Series]:
+        """Склеивает куски ``_training_blocks``; список ``blocks`` освобождается"""
+        if not blocks:
+            raise ValueError("Empty CSV file")
+        columns = blocks[0][0]
+        if stats is not None:
+            for _, block, scale, block_labels in blocks:
+                stats.update(with_scales(pd.DataFrame(block, columns=columns, copy=False), scale),
+                             pd.Series(block_labels))
+        labels = np.concatenate([block_labels for _, _, _, block_labels in blocks])
+        matrix, scale = concat_markers([block for _, block, _, _ in blocks],
+                                       [scale for _, _, scale, _ in blocks])
+        blocks.clear()
+
+        X = with_scales(pd.DataFrame(matrix, columns=columns, copy=False), scale)
+        y = pd.Series(labels, name=haplo_column)
+        return X, y
+
+    @staticmethod
+    def read_training_stream(stream: BinaryIO, chunksize: int = 50000, haplo_column: str = 'Haplogroup',
+                             stats: Optional[DatasetStats] = None) -> Tuple[pd.DataFrame, pd.Series]:
+        """Потоковое чтение обучающего CSV из файлового объекта
+
+        Файл читается кусками по ``chunksize`` строк и сразу переводится
+        в компактную матрицу (``uint8`` или ``int16`` с фиксированной точкой,
+        см. ``models.marker_dtypes``), поэтому в памяти никогда не лежит
+        весь исходный текст или несжатая матрица. У мультизначных ячеек
+        вида ``a-b`` берется первое значение. Строки с пропусками отбрасываются.
+        ``stats`` дополняется статистикой оставшихся строк по кускам.
+        """
+        blocks = list(CsvHandler._training_blocks(stream, chunksize, haplo_column))
+        return CsvHandler._training_frame(blocks, haplo_column, stats)
+
+    @staticmethod
+    def read_training_file(path: str, chunksize: int = 50000, haplo_column: str = 'Haplogroup',
+                           workers: Optional[int] = 1,
+                           stats: Optional[DatasetStats] = None) -> Tuple[pd.DataFrame, pd.Series]:
+        """``read_training_stream`` для файла на диске, с ``workers`` != 1 - параллельно"""
+        if workers == 1:
+            with open(path, 'rb') as f:
+                return CsvHandler.read_training_stream(f, chunksize, haplo_column, stats)
+        blocks = CsvHandler.parse_parallel(str(path), 'read_training_stream', workers,
+                                           chunksize, haplo_column)
+        return CsvHandler._training_frame(blocks, haplo_column, stats)
@@ -0,0 +1,276 @@
+# c:\projects\DNA-utils-universal\ystr_predictor\models\dataset_cache.py
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+from pathlib import Path
+from typing import BinaryIO, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from models.csv_handler import CsvHandler
+from models.dataset_stats import DatasetStats
+from models.marker_dtypes import compact_frame, marker_scales, with_scales
+
+PARSERS = ("read_training_stream", "load_data")
+
+
+class DatasetCache:
+    """Кэш разобранных обучающих наборов
+
+    Ключ - SHA-256 исходного CSV, имя разборщика и ``CsvHandler.PARSER_VERSION``.
+    Запись - каталог ``<root>/<key>/``:
+
+        X.npy       матрица маркеров в компактном типе, по столбцам (Fortran order)
+        labels.npy  коды гаплогрупп (int32)
+        meta.json   имена маркеров и их масштабы (``models.marker_dtypes``),
+                    список гаплогрупп, размеры, источник
+        stats.json  статистика набора (``DatasetStats``), собранная при разборе
+
+    Массивы открываются через ``np.load(mmap_mode='r')``, поэтому повторная
+    загрузка набора занимает миллисекунды. Старые записи вытесняются по
+    времени последнего использования (mtime meta.json), когда превышены
+    ``max_entries`` или ``max_bytes``.
+    """
+
+    META = "meta.json"
+    STATS = "stats.json"
+
+    def __init__(self, root: str = "models/saved/datasets/",
+                 max_entries: int = 20, max_bytes: int = 4 * 1024 ** 3):
+        self.root = Path(root)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def fingerprint(source: Union[str, Path, BinaryIO]) -> str:
+        """SHA-256 содержимого файла; файловый объект возвращается в начало"""
+        digest = hashlib.sha256()
+        if isinstance(source, (str, Path)):
+            with open(source, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(block)
+        else:
+            start = source.tell()
+            for block in iter(lambda: source.read(1 << 20), b""):
+                digest.update(block)
+            source.seek(start)
+        return digest.hexdigest()
+
+    @staticmethod
+    def key(fingerprint: str, parser: str) -> str:
+        if parser not in PARSERS:
+            raise ValueError(f"Unknown parser: {parser}")
+        return f"{parser}-v{CsvHandler.PARSER_VERSION}-{fingerprint[:32]}"
+
+    def get(self, fingerprint: str, parser: str) -> Optional[Tuple[pd.DataFrame, pd.Series]]:
+        """Загружает набор из кэша или возвращает None"""
+        entry = self.root / self.key(fingerprint, parser)
+        try:
+            with open(entry / self.META, encoding="utf-8") as f:
+                meta = json.load(f)
+            matrix = np.load(entry / "X.npy", mmap_mode="r")
+            codes = np.load(entry / "labels.npy", mmap_mode="r")
+        except (OSError, ValueError):
+            return None
+        if "scales" not in meta:
+            return None
+
+        # Отметка использования для вытеснения
+        os.utime(entry / self.META)
+
+        X = with_scales(pd.DataFrame(matrix, columns=meta["markers"], copy=False), meta["scales"])
+        y = pd.Series(np.asarray(meta["labels"], dtype=object)[codes], name=meta["label_name"])
+        return X, y
+
+    def get_stats(self, fingerprint: str, parser: str) -> Optional[DatasetStats]:
+        """Статистика записи или None (записи старых версий ее не хранят)"""
+        try:
+            return DatasetStats.load(self.root / self.key(fingerprint, parser) / self.STATS)
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def put(self, fingerprint: str, parser: str, X: pd.DataFrame, y: pd.Series,
+            source: Optional[str] = None, stats: Optional[DatasetStats] = None) -> Path:
+        """Сохраняет разобранный набор и вытесняет лишние записи"""
+        self.root.mkdir(parents=True, exist_ok=True)
+        key = self.key(fingerprint, parser)
+        entry = self.root / key
+        tmp_entry = self.root / f".{key}.tmp-{uuid.uuid4().hex[:8]}"
+        tmp_entry.mkdir()
+
+        codes, labels = pd.factorize(y, sort=True)
+        # Fortran order: каждый маркер лежит в файле непрерывно
+        compact = compact_frame(X)
+        np.save(tmp_entry / "X.npy", np.asfortranarray(compact.to_numpy()))
+        np.save(tmp_entry / "labels.npy", codes.astype(np.int32))
+        meta = {
+            "key": key,
+            "fingerprint": fingerprint,
+            "parser": parser,
+            "parser_version": CsvHandler.PARSER_VERSION,
+            "source": source,
+            "rows": len(X),
+            "markers": [str(col) for col in X.columns],
+            # Масштаб хранится явно: по типу int16 его не восстановить
+            "scales": marker_scales(compact),
+            "labels": [str(label) for label in labels],
+            "label_name": y.name,
+            "created_at": time.time(),
+        }
+        with open(tmp_entry / self.META, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        if stats is not None:
+            stats.save(tmp_entry / self.STATS)
+
+        if entry.exists():
+            shutil.rmtree(entry, ignore_errors=True)
+        tmp_entry.rename(entry)
+        logging.info(f"Cached dataset {key}: {len(X)} rows, {len(X.columns)} markers")
+
+        self.evict(keep=key)
+        return entry
+
+    def load(self, source: Union[str, Path, BinaryIO], parser: str = "read_training_stream",
+             name: Optional[str] = None, workers: Optional[int] = 1,
+             stats: Optional[DatasetStats] = None) -> Tuple[pd.DataFrame, pd.Series]:
+        """Набор из кэша, а при промахе - разбор CSV и сохранение результата
+
+        ``load_data`` возвращает маркеры вместе со столбцом гаплогрупп;
+        в кэш попадает матрица маркеров с общим компактным типом и метки отдельно.
+        Файл на диске с ``workers`` != 1 разбирается в пуле процессов
+        (``CsvHandler.parse_parallel``), результат и ключ те же.
+
+        Статистика набора собирается при разборе и хранится в записи;
+        ``stats`` дополняется ею и при попадании в кэш.
+        """
+        fingerprint = self.fingerprint(source)
+        cached = self.get(fingerprint, parser)
+        if cached is not None:
+            logging.info(f"Dataset cache hit: {self.key(fingerprint, parser)}")
+            if stats is not None:
+                cached_stats = self.get_stats(fingerprint, parser)
+                stats.merge(cached_stats or DatasetStats.from_frame(*cached))
+            return cached
+
+        if name is None and isinstance(source, (str, Path)):
+            name = str(source)
+        parsed_stats = DatasetStats()
+        if parser == "load_data":
+            if not isinstance(source, (str, Path)):
+                raise ValueError("load_data parser needs a file path")
+            df, haplo_column, markers = CsvHandler.load_data(str(source), workers=workers,
+                                                             stats=parsed_stats)
+            X = df[markers]
+            y = df[haplo_column]
+        elif isinstance(source, (str, Path)):
+            X, y = CsvHandler.read_training_file(str(source), workers=workers, stats=parsed_stats)
+        else:
+            X, y = CsvHandler.read_training_stream(source, stats=parsed_stats)
+
+        self.put(fingerprint, parser, X, y, source=name, stats=parsed_stats)
+        if stats is not None:
+            stats.merge(parsed_stats)
+        # Отдаем данные из mmap, как при попадании
+        return self.get(fingerprint, parser) or (X, y)
+
+    def entries(self) -> List[Dict]:
+        """Записи кэша, последние использованные первыми"""
+        result = []
+        if not self.root.exists():
+            return result
+        for entry in self.root.iterdir():
+            meta_path = entry / self.META
+            if entry.name.startswith(".") or not meta_path.exists():
+                continue
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            meta["haplogroups"] = len(meta.pop("labels", []))
+            meta["bytes"] = sum(p.stat().st_size for p in entry.iterdir())
+            meta["last_used_at"] = meta_path.stat().st_mtime
+            meta["current"] = meta.get("parser_version") == CsvHandler.PARSER_VERSION
+            result.append(meta)
+        return sorted(result, key=lambda meta: meta["last_used_at"], reverse=True)
+
+    def remove(self, key: str):
+        shutil.rmtree(self.root / key)
+        logging.info(f"Removed cached dataset {key}")
+
+    def evict(self, keep: Optional[str] = None) -> List[str]:
+        """Удаляет записи устаревших версий разбора и самые давние сверх лимитов"""
+        removed = []
+        entries = self.entries()
+        for meta in [m for m in entries if not m["current"]]:
+            self.remove(meta["key"])
+            removed.append(meta["key"])
+        entries = [m for m in entries if m["current"]]
+
+        total = sum(meta["bytes"] for meta in entries)
+        while entries and (len(entries) > self.max_entries or total > self.max_bytes):
+            oldest = entries.pop()
+            if oldest["key"] == keep:
+                break
+            self.remove(oldest["key"])
+            removed.append(oldest["key"])
+            total -= oldest["bytes"]
+        return removed
+
+
+def main(argv: Optional[List[str]] = None):
+    """python -m models.dataset_cache {build,list,show,remove,prune,clear}"""
+    parser = argparse.ArgumentParser(description="Processed training dataset cache")
+    parser.add_argument("--root", default="models/saved/datasets/")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build = commands.add_parser("build", help="Parse CSV files into the cache")
+    build.add_argument("files", nargs="+")
+    build.add_argument("--parser", choices=PARSERS, default="read_training_stream")
+    build.add_argument("--workers", type=int, default=None,
+                       help="Parser processes (default: all cores, 1 - serial)")
+
+    commands.add_parser("list", help="List cached datasets")
+    show = commands.add_parser("show", help="Show metadata of an entry")
+    show.add_argument("key")
+    remove = commands.add_parser("remove", help="Remove an entry")
+    remove.add_argument("key")
+    commands.add_parser("prune", help="Apply the eviction policy now")
+    commands.add_parser("clear", help="Remove all entries")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    cache = DatasetCache(args.root)
+
+    if args.command == "build":
+        for file in args.files:
+            start = time.perf_counter()
+            X, y = cache.load(file, parser=args.parser, workers=args.workers)
+            print(f"{file}: {len(X)} rows, {len(X.columns)} markers, "
+                  f"{y.nunique()} haplogroups in {time.perf_counter() - start:.2f} s")
+    elif args.command == "list":
+        for meta in cache.entries():
+            stale = "" if meta["current"] else " (stale parser version)"
+            print(f"{meta['key']}  {meta['rows']:>9} rows  {meta['bytes'] / 2 ** 20:8.1f} MB  "
+                  f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(meta['last_used_at']))}  "
+                  f"{meta['source'] or ''}{stale}")
+    elif args.command == "show":
+        with open(cache.root / args.key / DatasetCache.META, encoding="utf-8") as f:
+            meta = json.load(f)
+        meta["labels"] = f"{len(meta['labels'])} haplogroups"
+        print(json.dumps(meta, indent=2))
+    elif args.command == "remove":
+        cache.remove(args.key)
+    elif args.command == "prune":
+        for key in cache.evict():
+            print(f"evicted {key}")
+    elif args.command == "clear":
+        for meta in cache.entries():
+            cache.remove(meta["key"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+# c:\projects\DNA-utils-universal\ystr_predictor\models\dataset_stats.py
+import json
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+from models.marker_dtypes import marker_values
+
+# Гистограмма по целому числу повторов 0..255 (микроаллель 17.2 - в корзине 17);
+# большие значения попадают в последнюю корзину
+HISTOGRAM_BINS = 256
+
+
+class DatasetStats:
+    """Однопроходная статистика набора по маркерам
+
+    Для каждого маркера копятся число значений и пропусков (NaN), минимум,
+    максимум, среднее и сумма квадратов отклонений по Уэлфорду, гистограмма
+    значений; для меток - число образцов каждой гаплогруппы. Куски
+    добавляются через ``update`` по мере чтения, накопители разных кусков
+    или процессов складываются ``merge``, поэтому второй проход по данным
+    не нужен. Значения компактных типов раскодируются (см. ``models.marker_dtypes``).
+
+    Статистика обучающего набора сохраняется рядом с моделью и служит
+    эталоном для поиска дрейфа (``psi``, ``class_shift``).
+    """
+
+    def __init__(self, markers: Optional[Sequence[str]] = None):
+        self.markers: Optional[List[str]] = None
+        self.rows = 0
+        self.class_counts: Dict[str, int] = {}
+        if markers is not None:
+            self._allocate(markers)
+
+    def _allocate(self, markers: Sequence[str]):
+        k = len(markers)
+        self.markers = list(markers)
+        self.count = np.zeros(k, dtype=np.int64)
+        self.missing = np.zeros(k, dtype=np.int64)
+        self.minimum = np.full(k, np.inf)
+        self.maximum = np.full(k, -np.inf)
+        self.mean = np.zeros(k)
+        self.m2 = np.zeros(k)
+        self.histogram = np.zeros((k, HISTOGRAM_BINS), dtype=np.int64)
+
+    @classmethod
+    def from_frame(cls, X: pd.DataFrame, y: Optional[pd.Series] = None,
+                   chunksize: int = 50000) -> 'DatasetStats':
+        """Статистика таблицы в памяти; раскодируется по ``chunksize`` строк"""
+        stats = cls(list(X.columns))
+        for start in range(0, len(X), chunksize):
+            stats.update(X.iloc[start:start + chunksize],
+                         y.iloc[start:start + chunksize] if y is not None else None)
+        return stats
+
+    def _combine(self, count: np.ndarray, mean: np.ndarray, m2: np.ndarray):
+        """Складывает моменты другой части (формула Чана для параллельного Уэлфорда)"""
+        total = self.count + count
+        delta = mean - self.mean
+        with np.errstate(invalid="ignore", divide="ignore"):
+            share = np.where(total > 0, count / total, 0.0)
+        self.mean = self.mean + delta * share
+        self.m2 = self.m2 + m2 + delta ** 2 * self.count * share
+        self.count = total
+
+    def update(self, X: Union[pd.DataFrame, np.ndarray],
+               y: Optional[pd.Series] = None) -> 'DatasetStats':
+        """Добавляет кусок: маркеры (столбцы по именам) и, если есть, метки"""
+        if isinstance(X, pd.DataFrame):
+            if self.markers is None:
+                self._allocate(list(X.columns))
+            X = X[self.markers]
+        elif self.markers is None:
+            raise ValueError("Marker names are required for array input")
+
+        values = marker_values(X)
+        n = len(values)
+        self.rows += n
+        present = ~np.isnan(values)
+        count = present.sum(axis=0)
+        self.missing += n - count
+
+        if n:
+            filled = np.where(present, values, 0.0)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                mean = np.where(count > 0, filled.sum(axis=0) / count, 0.0)
+            m2 = (np.where(present, values - mean, 0.0) ** 2).sum(axis=0)
+            self._combine(count, mean, m2)
+
+            self.minimum = np.minimum(self.minimum, np.where(present, values, np.inf).min(axis=0))
+            self.maximum = np.maximum(self.maximum, np.where(present, values, -np.inf).max(axis=0))
+
+            # Корзины всех столбцов в одном bincount: столбец * HISTOGRAM_BINS + корзина
+            rows, columns = np.nonzero(present)
+            bins = np.clip(np.floor(values[rows, columns]), 0, HISTOGRAM_BINS - 1).astype(np.int64)
+            self.histogram += np.bincount(
+                columns * HISTOGRAM_BINS + bins, minlength=self.histogram.size
+            ).reshape(self.histogram.shape)
+
+        if y is not None:
+            self.update_classes(y)
+        return self
+
+    def update_classes(self, y: pd.Series) -> 'DatasetStats':
+        for label, count in y.value_counts(sort=False).items():
+            self.class_counts[label] = self.class_counts.get(label, 0) + int(count)
+        return self
+
+    def reindex(self, markers: Sequence[str]) -> 'DatasetStats':
+        """Копия статистики с маркерами ``markers`` в заданном порядке (по именам)
+
+        У маркеров, которых здесь нет, накопители пусты: все строки набора
+        для них считаются пропусками.
+        """
+        result = DatasetStats(markers)
+        result.rows = self.rows
+        result.class_counts = dict(self.class_counts)
+        positions = {marker: i for i, marker in enumerate(self.markers or [])}
+        source = np.array([positions.get(marker, -1) for marker in markers], dtype=np.int64)
+        found = source >= 0
+        result.missing[~found] = self.rows
+        if found.any():
+            source = source[found]
+            result.count[found] = self.count[source]
+            result.missing[found] = self.missing[source]
+            result.minimum[found] = self.minimum[source]
+            result.maximum[found] = self.maximum[source]
+            result.mean[found] = self.mean[source]
+            result.m2[found] = self.m2[source]
+            result.histogram[found] = self.histogram[source]
+        return result
+
+    def merge(self, other: 'DatasetStats') -> 'DatasetStats':
+        """Добавляет накопитель другой части того же набора
+
+        Маркеры сопоставляются по именам: порядок столбцов частей может
+        различаться. Маркеры, которых нет в одной из частей, добавляются
+        к статистике, а строки этой части для них считаются пропусками.
+        """
+        if other.markers is not None:
+            if self.markers is None:
+                self._allocate(other.markers)
+            elif self.markers != other.markers:
+                known = set(self.markers)
+                extra = [marker for marker in other.markers if marker not in known]
+                if extra:
+                    self.__dict__.update(self.reindex(self.markers + extra).__dict__)
+                other = other.reindex(self.markers)
+            self.missing += other.missing
+            self._combine(other.count, other.mean, other.m2)
+            self.minimum = np.minimum(self.minimum, other.minimum)
+            self.maximum = np.maximum(self.maximum, other.maximum)
+            self.histogram += other.histogram
+        self.rows += other.rows
+        for label, count in other.class_counts.items():
+            self.class_counts[label] = self.class_counts.get(label, 0) + count
+        return self
+
+    def std(self, ddof: int = 1) -> np.ndarray:
+        """Стандартное отклонение (как у pandas, ``ddof=1``); NaN при нехватке значений"""
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(self.count > ddof, np.sqrt(self.m2 / (self.count - ddof)), np.nan)
+
+    def marker_ranges(self) -> Dict[str, Dict[str, float]]:
+        """Минимум, максимум, среднее и std каждого маркера"""
+        if self.markers is None:
+            return {}
+        empty = self.count == 0
+        std = self.std()
+        return {
+            marker: {
+                "min": float("nan") if empty[i] else float(self.minimum[i]),
+                "max": float("nan") if empty[i] else float(self.maximum[i]),
+                "mean": float("nan") if empty[i] else float(self.mean[i]),
+                "std": float(std[i]),
+            }
+            for i, marker in enumerate(self.markers)
+        }
+
+    def missing_fractions(self) -> Dict[str, float]:
+        if self.markers is None:
+            return {}
+        rows = max(self.rows, 1)
+        return {marker: float(self.missing[i] / rows) for i, marker in enumerate(self.markers)}
+
+    def class_distribution(self) -> Dict[str, int]:
+        """Число образцов гаплогрупп по убыванию (как ``value_counts``)"""
+        return dict(sorted(self.class_counts.items(), key=lambda item: -item[1]))
+
+    def psi(self, current: 'DatasetStats', epsilon: float = 1e-4) -> Dict[str, float]:
+        """Индекс стабильности популяции (PSI) гистограмм ``current`` относительно этой
+
+        Сравниваются общие маркеры; маркеры без значений в одной из
+        статистик пропускаются. PSI выше 0.2 обычно считают заметным сдвигом.
+        """
+        positions = {marker: i for i, marker in enumerate(current.markers or [])}
+        result = {}
+        for i, marker in enumerate(self.markers or []):
+            j = positions.get(marker)
+            if j is None or not self.count[i] or not current.count[j]:
+                continue
+            expected = np.maximum(self.histogram[i] / self.count[i], epsilon)
+            actual = np.maximum(current.histogram[j] / current.count[j], epsilon)
+            result[marker] = float(np.sum((actual - expected) * np.log(actual / expected)))
+        return result
+
+    def class_shift(self, current: 'DatasetStats') -> float:
+        """Расстояние полной вариации между долями гаплогрупп (0 - совпадают, 1 - не пересекаются)"""
+        total, current_total = sum(self.class_counts.values()), sum(current.class_counts.values())
+        if not total or not current_total:
+            return 0.0
+        labels = set(self.class_counts) | set(current.class_counts)
+        return 0.5 * sum(
+            abs(self.class_counts.get(label, 0) / total - current.class_counts.get(label, 0) / current_total)
+            for label in labels
+        )
+
+    def summary(self) -> Dict:
+        """Сводка для API: размеры, диапазоны и пропуски маркеров, гаплогруппы (NaN -> None)"""
+        ranges = self.marker_ranges()
+        missing = self.missing_fractions()
+        return {
+            "rows": self.rows,
+            "markers": {
+                marker: {
+                    **{name: None if value != value else value for name, value in ranges[marker].items()},
+                    "missing": missing[marker],
+                }
+                for marker in ranges
+            },
+            "classes": self.class_distribution(),
+        }
+
+    def to_dict(self) -> Dict:
+        data = {"rows": self.rows, "class_counts": self.class_counts, "markers": self.markers}
+        if self.markers is not None:
+            data.update(
+                count=self.count.tolist(),
+                missing=self.missing.tolist(),
+                min=self.minimum.tolist(),
+                max=self.maximum.tolist(),
+                mean=self.mean.tolist(),
+                m2=self.m2.tolist(),
+                # Гистограммы разрежены: {корзина: число} для каждого маркера
+                histogram=[
+                    {int(b): int(row[b]) for b in np.flatnonzero(row)} for row in self.histogram
+                ],
+            )
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'DatasetStats':
+        stats = cls(data["markers"])
+        stats.rows = data["rows"]
+        stats.class_counts = dict(data["class_counts"])
+        if stats.markers is not None:
+            stats.count = np.array(data["count"], dtype=np.int64)
+            stats.missing = np.array(data["missing"], dtype=np.int64)
+            stats.minimum = np.array(data["min"], dtype=np.float64)
+            stats.maximum = np.array(data["max"], dtype=np.float64)
+            stats.mean = np.array(data["mean"], dtype=np.float64)
+            stats.m2 = np.array(data["m2"], dtype=np.float64)
+            for i, row in enumerate(data["histogram"]):
+                for b, count in row.items():
+                    stats.histogram[i, int(b)] = count
+        return stats
+
+    def save(self, path: Union[str, Path]):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f)
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> 'DatasetStats':
+        with open(path, encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
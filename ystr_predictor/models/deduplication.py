@@ -0,0 +1,58 @@
+# c:\projects\DNA-utils-universal\ystr_predictor\models\deduplication.py
+"""Схлопывание одинаковых образцов обучающего набора
+
+В открытых базах Y-STR много одинаковых строк (гаплотип + гаплогруппа):
+родственники, повторно загруженные киты. ``deduplicate`` оставляет одну
+строку на каждую такую пару и возвращает число повторов, которое модели
+получают как ``sample_weight``. StandardScaler с весами совпадает с
+обучением на полной выборке; случайный лес с весами - стандартная замена
+повторов (бутстрэп идет по уникальным строкам, веса умножают их вклад).
+"""
+from typing import Dict, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+def deduplicate(X: pd.DataFrame, y: pd.Series) -> Tuple[pd.DataFrame, pd.Series, np.ndarray]:
+    """Уникальные пары (маркеры, гаплогруппа) и число их повторов
+
+    Строки сравниваются по хранимым значениям (компактные типы не
+    раскодируются). Уникальные строки идут в порядке первого появления,
+    индексы сбрасываются. Возвращает ``(X_unique, y_unique, counts)``,
+    ``counts`` - ``int64``, ``counts.sum() == len(X)``.
+    """
+    if len(X) != len(y):
+        raise ValueError("X and y must have the same length")
+    if len(X) == 0:
+        return X.reset_index(drop=True), y.reset_index(drop=True), np.empty(0, dtype=np.int64)
+
+    codes, _ = pd.factorize(y, use_na_sentinel=False)
+    values = np.ascontiguousarray(X.to_numpy())
+    # Строка как последовательность байтов: маркеры и код гаплогруппы
+    rows = np.hstack([
+        values.view(np.uint8).reshape(len(X), -1),
+        codes.astype(np.int32).view(np.uint8).reshape(len(X), -1),
+    ])
+    keys = np.ascontiguousarray(rows).view(np.dtype((np.void, rows.shape[1]))).ravel()
+    _, first, counts = np.unique(keys, return_index=True, return_counts=True)
+
+    order = np.argsort(first)
+    first = first[order]
+    return (
+        X.iloc[first].reset_index(drop=True),
+        y.iloc[first].reset_index(drop=True),
+        counts[order].astype(np.int64),
+    )
+
+
+def compression_stats(counts: np.ndarray) -> Dict[str, float]:
+    """Сводка для логов и отчетов: строки до и после, степень сжатия"""
+    rows = int(counts.sum())
+    unique = len(counts)
+    return {
+        "rows": rows,
+        "unique_rows": unique,
+        "compression_ratio": rows / unique if unique else 1.0,
+        "max_count": int(counts.max()) if unique else 0,
+    }
@@ -1,4 +1,5 @@
 # c:\projects\DNA-utils-universal\ystr_predictor\models\ensemble_predictor.py
+# -*- coding: cp1251 -*-
 from sklearn.ensemble import RandomForestClassifier, GradientBoostingClassifier
 from sklearn.neural_network import MLPClassifier
 import xgboost as xgb
@@ -13,6 +14,7 @@ from typing import Dict, List, Tuple
 import logging
 from joblib import dump, load
 from pathlib import Path
+from models.marker_dtypes import decode_markers
 
 class EnsemblePredictor:
     def __init__(self):
@@ -101,7 +103,7 @@ class EnsemblePredictor:
             
             #  
             scaler = StandardScaler()
-            X_scaled = scaler.fit_transform(X)
+            X_scaled = scaler.fit_transform(decode_markers(X))
             self.scalers[level] = scaler
             
             #   
@@ -153,7 +155,7 @@ class EnsemblePredictor:
             raise Exception("Model is not trained yet")
             
         #  
-        X_scaled = self.scalers[level].transform(X)
+        X_scaled = self.scalers[level].transform(decode_markers(X))
         
         #    
         S_test = self._get_stacking_predictions(
@@ -170,7 +172,7 @@ class EnsemblePredictor:
             raise Exception("Model is not trained yet")
             
         #  
-        X_scaled = self.scalers[level].transform(X)
+        X_scaled = self.scalers[level].transform(decode_markers(X))
         
         #    
         S_test = self._get_stacking_predictions(
@@ -0,0 +1,303 @@
+# c:\projects\DNA-utils-universal\ystr_predictor\models\genetic_distance.py
+"""Генетическая дистанция Y-STR по матрице гаплотипов
+
+Правила как у ``calculateGeneticDistance`` в str-matcher/src/utils/calculations.ts:
+
+- сравниваются локусы панели (``PANEL_TIERS``), заполненные у запроса;
+  локус засчитывается, если он заполнен у обоих гаплотипов;
+- однокопийный маркер дает ``min(|a - b|, 2)`` (в режиме ``extended`` без
+  ограничения), значения сравниваются целой частью (как ``parseInt``);
+- палиндром (``CsvHandler.MULTI_VALUE_MARKERS``) сравнивается по копиям
+  в порядке возрастания, сумма ограничивается двумя; при разном числе
+  копий локус засчитывается с дистанцией 0;
+- совпадением считается гаплотип, у которого сравнено не меньше 80%
+  локусов запроса; запрос без заполненных локусов панели совпадений не
+  дает (в TS с ним совпадает любой профиль).
+
+Матрица хранится по столбцам ``uint8`` (0 - пусто), и вклад столбца
+считается несколькими поэлементными операциями в ``uint8`` без ветвлений
+и приведения типов. Строки идут блоками, которые помещаются в кэш;
+после каждой панели строки, уже превысившие ``max_distance``,
+отбрасываются (дистанция только растет), и дальше читаются только
+оставшиеся.
+"""
+import math
+from typing import Any, List, Mapping, NamedTuple, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from models.csv_handler import CsvHandler
+from models.marker_dtypes import marker_scales
+from models.marker_schema import FTDNA_PANEL, PANEL_TIERS, MarkerSchema
+
+# Ограничение дистанции одного локуса в режиме standard
+STEP_CAP = 2
+# Доля локусов запроса, которая должна быть сравнена (как minRequired)
+MIN_COMPARED = 0.8
+# Строк в блоке: столбцы блока и промежуточные массивы помещаются в кэш
+BLOCK_ROWS = 1 << 16
+# Проверять отсечение по max_distance через столько локусов
+STAGE_LOCI = 8
+# Сжимать список строк-кандидатов, когда их остается меньше этой доли
+COMPACT_FRACTION = 0.25
+
+
+class Matches(NamedTuple):
+    """Совпадения одного запроса, по возрастанию дистанции"""
+    rows: np.ndarray
+    distance: np.ndarray
+    compared: np.ndarray
+
+
+class _Plan:
+    """Локусы панели, заполненные у запроса, по ступеням ``PANEL_TIERS``"""
+
+    def __init__(self, stages, active: int, cap: Optional[int]):
+        self.stages = stages
+        self.active = active
+        self.cap = cap
+        # Дистанция standard (не больше 2 * 102) помещается в uint8
+        self.dtype = np.uint8 if cap is not None else np.uint16
+        self.min_compared = 0
+
+
+class _Workspace:
+    """Промежуточные массивы блока, выделяются один раз на вызов"""
+
+    def __init__(self, size: int, cap: Optional[int]):
+        self.diff = np.empty(size, dtype=np.uint8)
+        self.other = np.empty(size, dtype=np.uint8)
+        self.present = np.empty(size, dtype=np.uint8)
+        self.copies = np.empty(size, dtype=np.uint8)
+        self.total = np.empty(size, dtype=np.uint16)
+        # Операции со скаляром заметно медленнее поэлементных, поэтому
+        # константы тоже массивы
+        self.ones = np.ones(size, dtype=np.uint8)
+        self.caps = np.full(size, cap or 0, dtype=np.uint8)
+
+
+class HaplotypeMatrix:
+    """Гаплотипы набора в порядке панели FTDNA для поиска по дистанции
+
+    Столбцы - ``MarkerSchema.ftdna()`` (копии палиндромов - ``DYS385_1``,
+    ``DYS385_2``...), строки - гаплотипы; ``ids`` - необязательные номера
+    китов в том же порядке.
+    """
+
+    def __init__(self, values: np.ndarray, ids: Optional[Sequence] = None):
+        self.schema = MarkerSchema.ftdna()
+        values = np.asarray(values)
+        if values.ndim != 2 or values.shape[1] != len(self.schema):
+            raise ValueError(f"Expected a matrix with {len(self.schema)} marker columns")
+        # По столбцам: вклад локуса считается по непрерывному массиву
+        self.columns = np.ascontiguousarray(self._to_steps(values).T)
+        self.ids = np.asarray(ids) if ids is not None else None
+        if self.ids is not None and len(self.ids) != len(self):
+            raise ValueError("ids and values must have the same length")
+
+        # Локус -> позиции его столбцов в схеме
+        self.loci = {}
+        for marker in FTDNA_PANEL:
+            count = CsvHandler.MULTI_VALUE_MARKERS.get(marker)
+            names = [f"{marker}_{i + 1}" for i in range(count)] if count else [marker]
+            self.loci[marker] = [self.schema.position(name) for name in names]
+
+    def __len__(self) -> int:
+        return self.columns.shape[1]
+
+    @staticmethod
+    def _to_steps(values: np.ndarray) -> np.ndarray:
+        """Целое число повторов в ``uint8``; пропуски, нули и мусор - 0"""
+        if values.dtype == np.uint8:
+            return values
+        values = np.floor(np.nan_to_num(values.astype(np.float64), nan=0.0))
+        values[(values < 0) | (values > np.iinfo(np.uint8).max)] = 0
+        return values.astype(np.uint8)
+
+    @classmethod
+    def from_frame(cls, X: pd.DataFrame, ids: Optional[Sequence] = None) -> 'HaplotypeMatrix':
+        """Матрица из таблицы маркеров; лишние столбцы пропускаются
+
+        Подходят и разобранные таблицы (``CsvHandler.load_data``, копии в
+        ``DYS385_1``...), и сырые профили со строками вида ``"11-14"``.
+        """
+        schema = MarkerSchema.ftdna()
+        values = np.zeros((len(X), len(schema)), dtype=np.uint8)
+        scales = marker_scales(X)
+        for column in X.columns:
+            position = schema.position(column)
+            series = X[column]
+            if position is None:
+                slots = schema.copies.get(schema.normalize(column))
+                if slots is None:
+                    continue
+                if not pd.api.types.is_numeric_dtype(series):
+                    copies = CsvHandler.parse_multi_value_column(series, len(slots))
+                    values[:, list(slots)] = cls._to_steps(copies.astype(np.float64))
+                    continue
+                # Числовой столбец палиндрома хранит только первую копию
+                position = slots[0]
+            scale = scales.get(str(column), 1)
+            if series.dtype == np.uint8 and scale == 1:
+                values[:, position] = series.to_numpy()
+                continue
+            if not pd.api.types.is_numeric_dtype(series):
+                series = pd.to_numeric(series, errors="coerce")
+            column_values = series.to_numpy(dtype=np.float64, na_value=np.nan)
+            values[:, position] = cls._to_steps(column_values / scale if scale != 1 else column_values)
+        return cls(values, ids)
+
+    @classmethod
+    def from_markers(cls, samples: Sequence[Mapping[str, Any]],
+                     ids: Optional[Sequence] = None) -> 'HaplotypeMatrix':
+        """Матрица из словарей маркеров (палиндромы - строкой ``"11-14"`` или по копиям)"""
+        return cls(MarkerSchema.ftdna().encode_batch(samples), ids)
+
+    def encode_query(self, markers: Mapping[str, Any]) -> np.ndarray:
+        """Строка запроса в порядке столбцов матрицы"""
+        return self._to_steps(self.schema.encode(markers)[None, :])[0]
+
+    def _plan(self, query: np.ndarray, panel: str, mode: str) -> _Plan:
+        if mode not in ("standard", "extended"):
+            raise ValueError(f"Unknown distance mode: {mode}")
+        if panel not in PANEL_TIERS:
+            raise ValueError(f"Unknown panel: {panel}")
+
+        # Ступени по STAGE_LOCI локусов внутри каждой панели
+        bounds, start = [0], 0
+        for stop in sorted(PANEL_TIERS.values()):
+            if stop > PANEL_TIERS[panel]:
+                break
+            bounds.extend(range(start + STAGE_LOCI, stop, STAGE_LOCI))
+            bounds.append(stop)
+            start = stop
+
+        stages, active = [], 0
+        for start, stop in zip(bounds, bounds[1:]):
+            single, palindromes = [], []
+            for marker in FTDNA_PANEL[start:stop]:
+                positions = self.loci[marker]
+                copies = query[positions]
+                if not copies.any():
+                    continue
+                if len(positions) == 1:
+                    single.append((positions[0], copies[0]))
+                else:
+                    palindromes.append((list(zip(positions, copies)), np.count_nonzero(copies)))
+                active += 1
+            if single or palindromes:
+                stages.append((single, palindromes))
+        return _Plan(stages, active, STEP_CAP if mode == "standard" else None)
+
+    def _steps(self, column: np.ndarray, q: np.uint8, ws: _Workspace, cap: Optional[int]):
+        """Шаги ``|column - q|`` (0 у пустых ячеек) и признак заполненности, ``uint8``"""
+        n = len(column)
+        diff, other, present = ws.diff[:n], ws.other[:n], ws.present[:n]
+        # max - min не переполняется в uint8 (меньшая из двух разностей по
+        # модулю 256 - круговое расстояние, оно неверно при |a - b| > 127)
+        np.maximum(column, q, out=diff)
+        np.minimum(column, q, out=other)
+        np.subtract(diff, other, out=diff)
+        if cap is not None:
+            np.minimum(diff, ws.caps[:n], out=diff)
+        np.minimum(column, ws.ones[:n], out=present)
+        np.multiply(diff, present, out=diff)
+        return diff, present
+
+    def _match_block(self, plan: _Plan, start: int, stop: int,
+                     max_distance: Optional[int], ws: _Workspace) -> Matches:
+        """Дистанции запроса до строк ``start:stop`` с отсечением по ``max_distance``"""
+        rows = None
+        distance = np.zeros(stop - start, dtype=plan.dtype)
+        compared = np.zeros(stop - start, dtype=np.uint8)
+
+        for single, palindromes in plan.stages:
+            for position, q in single:
+                column = self.columns[position, start:stop] if rows is None else self.columns[position, rows]
+                diff, present = self._steps(column, q, ws, plan.cap)
+                np.add(distance, diff, out=distance)
+                np.add(compared, present, out=compared)
+
+            for copies_of_query, present_copies in palindromes:
+                n = len(distance)
+                total, copies = ws.total[:n], ws.copies[:n]
+                total.fill(0)
+                copies.fill(0)
+                for position, q in copies_of_query:
+                    column = self.columns[position, start:stop] if rows is None else self.columns[position, rows]
+                    diff, present = self._steps(column, q, ws, plan.cap)
+                    np.add(total, diff, out=total)
+                    np.add(copies, present, out=copies)
+                if plan.cap is not None:
+                    np.minimum(total, ws.caps[:n], out=total)
+                # При разном числе копий локус сравнен, но дистанции не дает
+                total *= copies == present_copies
+                np.add(distance, total, out=distance, casting="unsafe")
+                np.add(compared, np.minimum(copies, ws.ones[:n]), out=compared)
+
+            if max_distance is not None:
+                keep = distance <= max_distance
+                kept = np.count_nonzero(keep)
+                if kept < COMPACT_FRACTION * len(distance):
+                    rows = (np.flatnonzero(keep) + start) if rows is None else rows[keep]
+                    distance, compared = distance[keep], compared[keep]
+                    if not kept:
+                        break
+
+        if rows is None:
+            rows = np.arange(start, stop)
+        keep = compared >= plan.min_compared
+        if max_distance is not None:
+            keep &= distance <= max_distance
+        return Matches(rows[keep], distance[keep], compared[keep])
+
+    def match_many(self, queries: Sequence[Mapping[str, Any]], panel: str = "Y37",
+                   max_distance: Optional[int] = None, mode: str = "standard",
+                   min_compared: float = MIN_COMPARED,
+                   limit: Optional[int] = None) -> List[Matches]:
+        """Совпадения для каждого запроса (словари маркеров или строки ``encode_query``)
+
+        Строки матрицы идут блоками ``BLOCK_ROWS``, и блок проверяется всеми
+        запросами, пока его столбцы в кэше. ``limit`` - не больше стольких
+        ближайших совпадений на запрос (как ``max_results`` в find_matches_batch).
+        """
+        plans = []
+        for query in queries:
+            if isinstance(query, Mapping):
+                query = self.encode_query(query)
+            plan = self._plan(self._to_steps(np.asarray(query)[None, :])[0], panel, mode)
+            plan.min_compared = math.ceil(plan.active * min_compared)
+            plans.append(plan)
+
+        workspaces = {
+            plan.cap: _Workspace(min(BLOCK_ROWS, len(self)), plan.cap) for plan in plans
+        }
+        parts: List[List[Matches]] = [[] for _ in plans]
+        for start in range(0, len(self), BLOCK_ROWS):
+            stop = min(start + BLOCK_ROWS, len(self))
+            for plan, found in zip(plans, parts):
+                if plan.active:
+                    found.append(self._match_block(plan, start, stop, max_distance, workspaces[plan.cap]))
+
+        results = []
+        for found in parts:
+            if not found:
+                empty = np.empty(0, dtype=np.int64)
+                results.append(Matches(empty, empty, empty))
+                continue
+            rows, distance, compared = (np.concatenate(arrays) for arrays in zip(*found))
+            # Для uint8/uint16 устойчивая сортировка - поразрядная
+            order = np.argsort(distance, kind="stable")
+            if limit is not None:
+                order = order[:limit]
+            results.append(Matches(
+                rows[order], distance[order].astype(np.int64), compared[order].astype(np.int64)
+            ))
+        return results
+
+    def match(self, query: Mapping[str, Any], panel: str = "Y37",
+              max_distance: Optional[int] = None, mode: str = "standard",
+              min_compared: float = MIN_COMPARED, limit: Optional[int] = None) -> Matches:
+        """Совпадения одного запроса; ``max_distance`` отсекает строки по ходу расчета"""
+        return self.match_many([query], panel, max_distance, mode, min_compared, limit)[0]
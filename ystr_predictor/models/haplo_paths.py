@@ -0,0 +1,173 @@
+# c:\projects\DNA-utils-universal\ystr_predictor\models\haplo_paths.py
+"""Пути гаплогрупп из сервиса ftdna_haplo с дисковым кэшем
+
+``HaploPathResolver`` запрашивает ``GET {api_url}/search/{haplogroup}``
+одним клиентом httpx с keep-alive соединениями: не больше
+``concurrency`` запросов одновременно, при ошибках сети, 429 и 5xx -
+повтор с экспоненциальной задержкой. Ответы (и 404 - неизвестная
+группа) складываются в JSON-файл ``cache_path``, поэтому при повторном
+обучении запрашиваются только новые гаплогруппы. Кэш привязан к
+формату файла, адресу сервиса и ``tree_version`` - версии дерева
+гаплогрупп; при несовпадении он не используется и перезаписывается.
+Неизвестные группы перезапрашиваются через ``missing_ttl`` секунд:
+их могут добавить в дерево.
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import quote
+
+import httpx
+
+CACHE_FORMAT = 1
+# Ответы, после которых запрос повторяется
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def combined_path(data: Optional[Dict]) -> List[str]:
+    """Путь FTDNA, дополненный узлами пути YFull, которых в нем нет"""
+    if not data:
+        return []
+    path = list(data.get('ftdna_path') or [])
+    path.extend(p for p in data.get('yfull_path') or [] if p not in path)
+    return path
+
+
+class HaploPathResolver:
+    """Ответы ``/search/{haplogroup}`` для многих гаплогрупп сразу
+
+    Без ``cache_path`` ответы хранятся только в памяти объекта. Клиент
+    создается на каждый вызов ``search``: он привязан к event loop, а
+    обучение запускает свой ``asyncio.run``.
+    """
+
+    def __init__(self, api_url: str = "http://localhost:9003/api",
+                 cache_path: Optional[str] = None, tree_version: str = "",
+                 concurrency: int = 16, retries: int = 3, backoff: float = 0.5,
+                 timeout: float = 30.0, missing_ttl: float = 24 * 3600):
+        self.api_url = api_url.rstrip("/")
+        self.cache_path = Path(cache_path) if cache_path else None
+        self.tree_version = tree_version
+        self.concurrency = max(1, concurrency)
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.missing_ttl = missing_ttl
+        # Гаплогруппа -> {"data": ответ или None для 404, "fetched_at": время}
+        self._entries: Optional[Dict[str, Dict]] = None
+
+    def _header(self) -> Dict:
+        return {"format": CACHE_FORMAT, "api_url": self.api_url, "tree_version": self.tree_version}
+
+    def _read_cache(self) -> Dict[str, Dict]:
+        if self.cache_path is None or not self.cache_path.exists():
+            return {}
+        try:
+            with open(self.cache_path, encoding="utf-8") as f:
+                cache = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable haplogroup path cache {self.cache_path}: {str(e)}")
+            return {}
+        if any(cache.get(key) != value for key, value in self._header().items()):
+            logging.info(f"Haplogroup path cache {self.cache_path} is for another "
+                         f"service or tree version, starting a new one")
+            return {}
+        return cache.get("entries", {})
+
+    def _write_cache(self):
+        if self.cache_path is None:
+            return
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        # Другой процесс мог дописать кэш, пока шли запросы
+        entries = {**self._read_cache(), **self._entries}
+        tmp_path = self.cache_path.with_name(f"{self.cache_path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({**self._header(), "entries": entries}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.cache_path)
+        self._entries = entries
+
+    def _is_fresh(self, haplogroup: str, now: float) -> bool:
+        entry = self._entries.get(haplogroup)
+        if entry is None:
+            return False
+        return entry["data"] is not None or now - entry["fetched_at"] < self.missing_ttl
+
+    async def search(self, haplogroups: Iterable[str]) -> Dict[str, Optional[Dict]]:
+        """Ответы сервиса по гаплогруппам (None - группа неизвестна или не получена)
+
+        Запрашиваются только гаплогруппы, которых нет в кэше.
+        """
+        if self._entries is None:
+            self._entries = self._read_cache()
+        haplogroups = list(dict.fromkeys(haplogroups))
+        now = time.time()
+        missing = [hg for hg in haplogroups if not self._is_fresh(hg, now)]
+        if missing:
+            await self._fetch_all(missing)
+
+        result = {}
+        for haplogroup in haplogroups:
+            entry = self._entries.get(haplogroup)
+            result[haplogroup] = entry["data"] if entry is not None else None
+        return result
+
+    async def resolve(self, haplogroups: Iterable[str]) -> Dict[str, List[str]]:
+        """Пути гаплогрупп (пустой список, если пути нет)"""
+        documents = await self.search(haplogroups)
+        return {haplogroup: combined_path(data) for haplogroup, data in documents.items()}
+
+    async def _fetch_all(self, haplogroups: List[str]):
+        start = time.perf_counter()
+        limits = httpx.Limits(max_connections=self.concurrency,
+                              max_keepalive_connections=self.concurrency)
+        pending = iter(haplogroups)
+        failed = []
+
+        async def worker(client: httpx.AsyncClient):
+            # Итератор общий: каждая группа достается одному обработчику
+            for haplogroup in pending:
+                fetched, data = await self._fetch(client, haplogroup)
+                if fetched:
+                    self._entries[haplogroup] = {"data": data, "fetched_at": time.time()}
+                else:
+                    failed.append(haplogroup)
+
+        async with httpx.AsyncClient(timeout=self.timeout, limits=limits) as client:
+            workers = min(self.concurrency, len(haplogroups))
+            await asyncio.gather(*(worker(client) for _ in range(workers)))
+
+        logging.info(f"Fetched {len(haplogroups) - len(failed)} of {len(haplogroups)} "
+                     f"haplogroups in {time.perf_counter() - start:.1f}s")
+        if failed:
+            logging.warning(f"Could not fetch {len(failed)} haplogroups, e.g. {failed[:5]}")
+        self._write_cache()
+
+    async def _fetch(self, client: httpx.AsyncClient, haplogroup: str) -> Tuple[bool, Optional[Dict]]:
+        """(получен ли ответ, ответ или None для 404)"""
+        url = f"{self.api_url}/search/{quote(haplogroup, safe='')}"
+        for attempt in range(self.retries + 1):
+            delay = self.backoff * 2 ** attempt
+            try:
+                response = await client.get(url)
+                if response.status_code == 200:
+                    return True, response.json()
+                if response.status_code == 404:
+                    return True, None
+                if response.status_code not in RETRY_STATUSES:
+                    logging.error(f"Error getting path for {haplogroup}: HTTP {response.status_code}")
+                    return False, None
+                error = f"HTTP {response.status_code}"
+                retry_after = response.headers.get("Retry-After", "")
+                if retry_after.isdigit():
+                    delay = max(delay, float(retry_after))
+            except (httpx.TransportError, ValueError) as e:
+                error = str(e) or type(e).__name__
+            if attempt < self.retries:
+                await asyncio.sleep(delay * random.uniform(0.5, 1.5))
+        logging.error(f"Error getting path for {haplogroup} after {self.retries + 1} attempts: {error}")
+        return False, None
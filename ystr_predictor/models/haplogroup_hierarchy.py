@@ -1,9 +1,12 @@
-import httpx
-from typing import List, Dict
+from typing import List, Dict, Optional
+
+from models.haplo_paths import HaploPathResolver
 
 class HaplogroupHierarchy:
     def __init__(self):
         self.ftdna_api_url = "http://localhost:9003/api"
+        #  /search   ; None -  ,  ftdna_api_url
+        self.path_resolver: Optional[HaploPathResolver] = None
         self.haplogroup_map = {}
         self.reverse_map = {}
         self.haplogroup_details = {}
@@ -13,17 +16,14 @@ class HaplogroupHierarchy:
         self.haplogroup_map = {hg: idx for idx, hg in enumerate(sorted(haplogroups))}
         self.reverse_map = {idx: hg for hg, idx in self.haplogroup_map.items()}
         
-        #     
-        async with httpx.AsyncClient() as client:
-            for haplogroup in haplogroups:
-                try:
-                    response = await client.get(
-                        f"{self.ftdna_api_url}/search/{haplogroup}"
-                    )
-                    if response.status_code == 200:
-                        self.haplogroup_details[haplogroup] = response.json()
-                except Exception as e:
-                    print(f"Error fetching details for {haplogroup}: {e}")
+        #   ,      
+        if self.path_resolver is None:
+            #   :     
+            self.path_resolver = HaploPathResolver(self.ftdna_api_url)
+        documents = await self.path_resolver.search(haplogroups)
+        self.haplogroup_details.update(
+            (haplogroup, data) for haplogroup, data in documents.items() if data is not None
+        )
     
     def encode_haplogroups(self, haplogroups: List[str]) -> List[int]:
         return [self.haplogroup_map[hg] for hg in haplogroups]
@@ -5,10 +5,14 @@ import numpy as np
 import pandas as pd
 from typing import List, Dict, Optional
 import logging
-import httpx
-import asyncio
-from itertools import islice
+import time
 from sklearn.metrics import classification_report
+from models.haplo_paths import HaploPathResolver
+from models.marker_dtypes import decode_markers
+from models.node_fingerprint import changed_keys, config_digest, node_fingerprint, sample_ids
+
+# Входит в отпечатки моделей: увеличивается при изменении их настроек
+MODEL_VERSION = 1
 
 class HierarchicalHaploPredictor:
     def __init__(self, haplo_api_url: str = "http://localhost:9003/api"):
@@ -18,42 +22,39 @@ class HierarchicalHaploPredictor:
         self.subclade_models = {}  # Модели для каждой базовой гаплогруппы
         self.subclade_scalers = {}
         self.haplo_paths = {}
+        # Запросы путей и их кэш; по умолчанию HaploPathResolver(haplo_api_url),
+        # создается при первом запросе и дальше переиспользуется
+        self.path_resolver: Optional[HaploPathResolver] = None
+        # Отпечатки данных моделей и время их обучения (fit_seconds): модель с
+        # прежним отпечатком при следующем обучении не переобучается
+        self.base_fingerprint: Optional[Dict] = None
+        self.subclade_fingerprints: Dict[str, Dict] = {}
+        self.training_report: Optional[Dict] = None
         self.is_trained = False
 
-    async def get_haplo_paths_batch(self, haplogroups: List[str], batch_size: int = 50):
+    async def get_haplo_paths_batch(self, haplogroups: List[str]):
         """Получает пути для партии гаплогрупп"""
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            for i in range(0, len(haplogroups), batch_size):
-                batch = haplogroups[i:i + batch_size]
-                tasks = []
-                for hg in batch:
-                    tasks.append(client.get(f"{self.haplo_api_url}/search/{hg}"))
-                
-                responses = await asyncio.gather(*tasks, return_exceptions=True)
+        if self.path_resolver is None:
+            self.path_resolver = HaploPathResolver(self.haplo_api_url)
+        documents = await self.path_resolver.search(haplogroups)
+        for hg, data in documents.items():
+            if data:
+                path = []
+                # Добавляем базовую гаплогруппу
+                root = hg.split('-')[0]
+                path.append({'name': root})
                 
-                for hg, response in zip(batch, responses):
-                    if not isinstance(response, Exception) and response.status_code == 200:
-                        data = response.json()
-                        # Извлекаем путь из ответа
-                        if data:
-                            path = []
-                            # Добавляем базовую гаплогруппу
-                            root = hg.split('-')[0]
-                            path.append({'name': root})
+                # Добавляем промежуточные уровни
+                if '-' in hg:
+                    path.append({'name': hg})
+                    
+                # Добавляем дополнительную информацию из ответа API
+                if 'subclade_info' in data:
+                    for subclade in data['subclade_info']:
+                        if subclade.get('parent_id') and subclade.get('name'):
+                            path.append({'name': subclade['name']})
                             
-                            # Добавляем промежуточные уровни
-                            if '-' in hg:
-                                path.append({'name': hg})
-                                
-                            # Добавляем дополнительную информацию из ответа API
-                            if 'subclade_info' in data:
-                                for subclade in data['subclade_info']:
-                                    if subclade.get('parent_id') and subclade.get('name'):
-                                        path.append({'name': subclade['name']})
-                                        
-                            self.haplo_paths[hg] = path
-                
-                await asyncio.sleep(0.1)
+                self.haplo_paths[hg] = path
 
     async def _build_haplo_hierarchy(self, haplogroups: List[str]):
         """Строит иерархию гаплогрупп батчами"""
@@ -116,30 +117,62 @@ class HierarchicalHaploPredictor:
                 random_state=42
             )
 
-    async def train(self, X: pd.DataFrame, y: pd.Series):
-        """Обучает иерархическую модель"""
+    async def train(self, X: pd.DataFrame, y: pd.Series, sample_weight=None):
+        """Обучает иерархическую модель
+
+        ``sample_weight`` - веса строк (число повторов после дедупликации).
+        Модели, данные которых не изменились с прошлого обучения (того же
+        объекта или загруженного ``load_model``), не переобучаются; что
+        обучено заново, а что взято, - в ``training_report``.
+        """
+        if sample_weight is not None:
+            sample_weight = np.asarray(sample_weight, dtype=np.float64)
         try:
+            start = time.perf_counter()
             await self._build_haplo_hierarchy(y.unique())
             
             # Готовим данные для базового уровня
             base_haplogroups = y.apply(lambda x: x.split('-')[0])
             unique_base = base_haplogroups.unique()
-            
-            logging.info(f"Training base model for {len(unique_base)} haplogroups")
-            
-            # Обучаем базовую модель
-            self.base_scaler = StandardScaler()
-            X_scaled = self.base_scaler.fit_transform(X)
-            
-            self.base_model = RandomForestClassifier(
-                n_estimators=200,
-                max_depth=15,
-                min_samples_split=5,
-                n_jobs=-1,
-                class_weight='balanced',
-                random_state=42
-            )
-            self.base_model.fit(X_scaled, base_haplogroups)
+
+            ids = sample_ids(X)
+            config = config_digest(features=list(X.columns), version=MODEL_VERSION)
+            report = {"nodes": 1, "rebuilt": [], "reused": [], "saved_seconds": 0.0}
+
+            def reusable(name: str, fingerprint: Dict, previous: Optional[Dict], model) -> bool:
+                changed = changed_keys(fingerprint, previous)
+                if model is not None and not changed:
+                    report["reused"].append(name)
+                    report["saved_seconds"] += previous.get("fit_seconds") or 0.0
+                    fingerprint["fit_seconds"] = previous.get("fit_seconds")
+                    return True
+                report["rebuilt"].append({"node": name, "changed": changed})
+                return False
+
+            codes, classes = pd.factorize(base_haplogroups)
+            base_fingerprint = node_fingerprint(ids, codes, list(classes), sample_weight, config)
+            if reusable("ROOT", base_fingerprint, self.base_fingerprint, self.base_model):
+                logging.info("Base model data unchanged, reusing it")
+                X_scaled = self.base_scaler.transform(decode_markers(X))
+            else:
+                logging.info(f"Training base model for {len(unique_base)} haplogroups")
+
+                # Обучаем базовую модель
+                fit_start = time.perf_counter()
+                self.base_scaler = StandardScaler()
+                X_scaled = self.base_scaler.fit_transform(decode_markers(X), sample_weight=sample_weight)
+
+                self.base_model = RandomForestClassifier(
+                    n_estimators=200,
+                    max_depth=15,
+                    min_samples_split=5,
+                    n_jobs=-1,
+                    class_weight='balanced',
+                    random_state=42
+                )
+                self.base_model.fit(X_scaled, base_haplogroups, sample_weight=sample_weight)
+                base_fingerprint["fit_seconds"] = time.perf_counter() - fit_start
+            self.base_fingerprint = base_fingerprint
             
             # Оцениваем базовую модель
             y_pred = self.base_model.predict(X_scaled)
@@ -147,20 +180,33 @@ class HierarchicalHaploPredictor:
             logging.info(classification_report(base_haplogroups, y_pred))
 
             # Обучаем модели для субкладов каждой базовой гаплогруппы
+            subclade_models, subclade_scalers, subclade_fingerprints = {}, {}, {}
             for base_haplo in unique_base:
                 mask = base_haplogroups == base_haplo
                 if mask.sum() > 1:  # Если есть хотя бы 2 образца
                     X_sub = X[mask]
                     y_sub = y[mask]
+                    w_sub = sample_weight[mask.to_numpy()] if sample_weight is not None else None
                     
                     # Пропускаем, если все субклады одинаковые
                     if len(y_sub.unique()) > 1:
+                        report["nodes"] += 1
+                        codes, classes = pd.factorize(y_sub)
+                        fingerprint = node_fingerprint(ids[mask.to_numpy()], codes, list(classes), w_sub, config)
+                        subclade_fingerprints[base_haplo] = fingerprint
+                        if reusable(base_haplo, fingerprint, self.subclade_fingerprints.get(base_haplo),
+                                    self.subclade_models.get(base_haplo)):
+                            subclade_models[base_haplo] = self.subclade_models[base_haplo]
+                            subclade_scalers[base_haplo] = self.subclade_scalers[base_haplo]
+                            continue
+
                         logging.info(f"\nTraining subclade model for {base_haplo}")
                         logging.info(f"Samples: {len(X_sub)}, Unique subclades: {len(y_sub.unique())}")
                         
                         # Создаем и обучаем модель для субкладов
+                        fit_start = time.perf_counter()
                         scaler = StandardScaler()
-                        X_scaled = scaler.fit_transform(X_sub)
+                        X_scaled = scaler.fit_transform(decode_markers(X_sub), sample_weight=w_sub)
                         
                         model = RandomForestClassifier(
                             n_estimators=100,
@@ -170,16 +216,26 @@ class HierarchicalHaploPredictor:
                             class_weight='balanced',
                             random_state=42
                         )
-                        model.fit(X_scaled, y_sub)
+                        model.fit(X_scaled, y_sub, sample_weight=w_sub)
+                        fingerprint["fit_seconds"] = time.perf_counter() - fit_start
                         
                         # Сохраняем модель и скейлер
-                        self.subclade_models[base_haplo] = model
-                        self.subclade_scalers[base_haplo] = scaler
+                        subclade_models[base_haplo] = model
+                        subclade_scalers[base_haplo] = scaler
                         
                         # Оцениваем модель субкладов
                         y_pred = model.predict(X_scaled)
                         logging.info(f"\n{base_haplo} subclade model performance:")
                         logging.info(classification_report(y_sub, y_pred))
+
+            # Модели базовых гаплогрупп, которых больше нет в наборе, отбрасываются
+            self.subclade_models = subclade_models
+            self.subclade_scalers = subclade_scalers
+            self.subclade_fingerprints = subclade_fingerprints
+            report["training_seconds"] = time.perf_counter() - start
+            self.training_report = report
+            logging.info(f"Trained {len(report['rebuilt'])} models, reused {len(report['reused'])}, "
+                         f"~{report['saved_seconds']:.0f}s saved")
             
             self.is_trained = True
             
@@ -199,7 +255,7 @@ class HierarchicalHaploPredictor:
             X_sample = X.iloc[[i]]
             
             # Предсказание базовой гаплогруппы
-            X_scaled = self.base_scaler.transform(X_sample)
+            X_scaled = self.base_scaler.transform(decode_markers(X_sample))
             base_probas = self.base_model.predict_proba(X_scaled)[0]
             base_classes = self.base_model.classes_
             
@@ -215,7 +271,7 @@ class HierarchicalHaploPredictor:
                 # Предсказание субкладов если есть модель
                 subclade_predictions = []
                 if base_haplo in self.subclade_models:
-                    X_sub_scaled = self.subclade_scalers[base_haplo].transform(X_sample)
+                    X_sub_scaled = self.subclade_scalers[base_haplo].transform(decode_markers(X_sample))
                     subclade_model = self.subclade_models[base_haplo]
                     subclade_probas = subclade_model.predict_proba(X_sub_scaled)[0]
                     
@@ -252,6 +308,8 @@ class HierarchicalHaploPredictor:
             'subclade_models': self.subclade_models,
             'subclade_scalers': self.subclade_scalers,
             'haplo_paths': self.haplo_paths,
+            'base_fingerprint': self.base_fingerprint,
+            'subclade_fingerprints': self.subclade_fingerprints,
             'is_trained': self.is_trained
         }
         
@@ -266,4 +324,7 @@ class HierarchicalHaploPredictor:
         self.subclade_models = model_data['subclade_models']
         self.subclade_scalers = model_data['subclade_scalers']
         self.haplo_paths = model_data['haplo_paths']
+        # Модели, сохраненные до отпечатков, при следующем обучении строятся заново
+        self.base_fingerprint = model_data.get('base_fingerprint')
+        self.subclade_fingerprints = model_data.get('subclade_fingerprints', {})
         self.is_trained = model_data['is_trained']
\ No newline at end of file
@@ -0,0 +1,152 @@
+# c:\projects\DNA-utils-universal\ystr_predictor\models\marker_dtypes.py
+"""Компактное хранение значений маркеров
+
+Число повторов STR помещается в ``uint8``. Микроаллели вида ``17.2``
+хранятся в фиксированной точке: значение, умноженное на
+``FIXED_POINT_SCALE``, в ``int16``. Масштаб не выводится из типа
+(``int16`` из другого источника хранит настоящие значения), а
+записывается явно:
+
+    таблицы   ``X.attrs["marker_scales"]`` - {столбец: масштаб} для
+              столбцов с масштабом не 1 (см. ``with_scales``); pandas
+              переносит attrs при срезах, выборе столбцов, reindex,
+              склейке одинаково размеченных таблиц и pickle
+    массивы   масштаб передается рядом: ``compact_markers`` и
+              ``concat_markers`` возвращают его вместе с массивом,
+              ``marker_values`` принимает его аргументом
+    на диске  ``DatasetCache`` хранит масштабы в meta.json
+
+Модели (StandardScaler, леса) получают настоящие значения во float64:
+``decode_markers`` и ``marker_values`` вызываются только на границе
+с моделью и только для нужных ей строк.
+"""
+from typing import Dict, Iterable, List, Mapping, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+FIXED_POINT_SCALE = 10
+# Ключ DataFrame.attrs с масштабами столбцов
+SCALES_ATTR = "marker_scales"
+# Погрешность float32 при проверке, что значение кратно 0.1
+_FIXED_POINT_TOLERANCE = 1e-3
+
+
+def marker_scales(X: pd.DataFrame) -> Dict[str, int]:
+    """Масштабы столбцов таблицы, отличные от 1 (столбцы без записи - 1)"""
+    return dict(X.attrs.get(SCALES_ATTR, {}))
+
+
+def with_scales(X: pd.DataFrame, scales: Union[int, Mapping[str, int]]) -> pd.DataFrame:
+    """Записывает масштабы столбцов ``X`` (один на все или по именам) и возвращает ``X``"""
+    if not isinstance(scales, Mapping):
+        scales = dict.fromkeys(X.columns, scales)
+    X.attrs[SCALES_ATTR] = {
+        str(column): int(scale) for column, scale in scales.items()
+        if scale != 1 and column in X.columns
+    }
+    return X
+
+
+def _column_divisors(columns: Iterable, scales: Mapping[str, int]) -> np.ndarray:
+    return np.array([scales.get(str(column), 1) for column in columns], dtype=np.float64)
+
+
+def compact_markers(values: np.ndarray, scale: int = 1) -> Tuple[np.ndarray, int]:
+    """Переводит значения маркеров в самый узкий подходящий тип
+
+    ``values`` хранятся с масштабом ``scale`` (1 - настоящие значения).
+    Массив любой формы получает один общий тип: ``uint8``, если все
+    значения целые от 0 до 255, иначе ``int16`` в фиксированной точке,
+    если все значения кратны 0.1 и помещаются в диапазон. Пропуски (NaN)
+    и прочие значения оставляют массив в ``float32``. Возвращает массив
+    и его масштаб; уже компактный массив возвращается без изменений.
+    """
+    values = np.asarray(values)
+    if (values.dtype, scale) in ((np.uint8, 1), (np.int16, FIXED_POINT_SCALE)):
+        return values, scale
+    if scale != 1:
+        values = values.astype(np.float64) / scale
+    if values.size == 0:
+        return values.astype(np.uint8), 1
+    if values.dtype.kind in "iub":
+        low, high = values.min(), values.max()
+        if low >= 0 and high <= np.iinfo(np.uint8).max:
+            return values.astype(np.uint8), 1
+        values = values.astype(np.float64)
+    elif values.dtype.kind != "f" or not np.isfinite(values).all():
+        return values.astype(np.float32), 1
+
+    low, high = values.min(), values.max()
+    if low >= 0 and high <= np.iinfo(np.uint8).max and (values == np.floor(values)).all():
+        return values.astype(np.uint8), 1
+
+    scaled = np.rint(values.astype(np.float64) * FIXED_POINT_SCALE)
+    limits = np.iinfo(np.int16)
+    if (scaled.min() >= limits.min and scaled.max() <= limits.max
+            and np.abs(scaled - values * FIXED_POINT_SCALE).max() <= _FIXED_POINT_TOLERANCE):
+        return scaled.astype(np.int16), FIXED_POINT_SCALE
+    return values.astype(np.float32), 1
+
+
+def marker_values(X: Union[pd.DataFrame, np.ndarray], scale: Union[int, Sequence[int]] = 1) -> np.ndarray:
+    """Настоящие значения маркеров в виде матрицы float64
+
+    Масштабы таблицы берутся из ее attrs (``with_scales``), массива -
+    из ``scale`` (один на все столбцы или по столбцам).
+    """
+    if isinstance(X, pd.DataFrame):
+        divisors = _column_divisors(X.columns, X.attrs.get(SCALES_ATTR, {}))
+        values = X.to_numpy(dtype=np.float64)
+    else:
+        divisors = np.asarray(scale, dtype=np.float64)
+        values = np.asarray(X).astype(np.float64)
+    if (divisors != 1).any():
+        # Не на месте: to_numpy может вернуть память самой таблицы
+        values = values / divisors
+    return values
+
+
+def decode_markers(X: pd.DataFrame) -> pd.DataFrame:
+    """Таблица с настоящими значениями во float64 для sklearn
+
+    Имена и порядок столбцов сохраняются (на них опирается проверка
+    ``feature_names_in_``). Таблица, уже целиком во float64 и без
+    масштабов, возвращается как есть.
+    """
+    if not X.attrs.get(SCALES_ATTR) and all(dtype == np.float64 for dtype in X.dtypes):
+        return X
+    return pd.DataFrame(marker_values(X), columns=X.columns, index=X.index, copy=False)
+
+
+def concat_markers(blocks: List[np.ndarray], scales: Sequence[int]) -> Tuple[np.ndarray, int]:
+    """Склеивает по строкам блоки, сжатые ``compact_markers`` по отдельности
+
+    ``scales`` - масштабы блоков. Блоки разных типов приводятся к общему
+    без потери масштаба: ``uint8`` и ``int16`` в фиксированной точке - к
+    фиксированной точке, остальное - к ``float32`` с настоящими значениями.
+    Возвращает матрицу и ее масштаб.
+    """
+    kinds = {(block.dtype, scale) for block, scale in zip(blocks, scales)}
+    if len(kinds) <= 1:
+        return np.concatenate(blocks), (kinds.pop()[1] if kinds else 1)
+    if kinds <= {(np.dtype(np.uint8), 1), (np.dtype(np.int16), FIXED_POINT_SCALE)}:
+        return np.concatenate([
+            block if scale == FIXED_POINT_SCALE else block.astype(np.int16) * FIXED_POINT_SCALE
+            for block, scale in zip(blocks, scales)
+        ]), FIXED_POINT_SCALE
+    return np.concatenate([
+        marker_values(block, scale).astype(np.float32) for block, scale in zip(blocks, scales)
+    ]), 1
+
+
+def compact_frame(X: pd.DataFrame) -> pd.DataFrame:
+    """Таблица маркеров с одним компактным типом и масштабом для всех столбцов"""
+    dtypes = set(X.dtypes)
+    scales = set(_column_divisors(X.columns, X.attrs.get(SCALES_ATTR, {})))
+    if len(dtypes) == 1 and len(scales) == 1:
+        dtype, scale = dtypes.pop(), int(scales.pop())
+        if (dtype, scale) in ((np.uint8, 1), (np.int16, FIXED_POINT_SCALE)):
+            return X
+    values, scale = compact_markers(marker_values(X))
+    return with_scales(pd.DataFrame(values, columns=X.columns, index=X.index, copy=False), scale)
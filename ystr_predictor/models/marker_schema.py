@@ -0,0 +1,178 @@
+# c:\projects\DNA-utils-universal\ystr_predictor\models\marker_schema.py
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from models.csv_handler import CsvHandler
+from models.marker_dtypes import marker_scales
+
+# Порядок маркеров панели FTDNA Y-111 (как markers в str-matcher/src/utils/constants.ts)
+FTDNA_PANEL = (
+    "DYS393", "DYS390", "DYS19", "DYS391", "DYS385",
+    "DYS426", "DYS388", "DYS439", "DYS389i", "DYS392",
+    "DYS389ii", "DYS458", "DYS459", "DYS455", "DYS454",
+    "DYS447", "DYS437", "DYS448", "DYS449", "DYS464",
+    "DYS460", "Y-GATA-H4", "YCAII", "DYS456", "DYS607",
+    "DYS576", "DYS570", "CDY", "DYS442", "DYS438",
+    "DYS531", "DYS578", "DYF395S1", "DYS590", "DYS537",
+    "DYS641", "DYS472", "DYF406S1", "DYS511", "DYS425",
+    "DYS413", "DYS557", "DYS594", "DYS436", "DYS490",
+    "DYS534", "DYS450", "DYS444", "DYS481", "DYS520",
+    "DYS446", "DYS617", "DYS568", "DYS487", "DYS572",
+    "DYS640", "DYS492", "DYS565", "DYS710", "DYS485",
+    "DYS632", "DYS495", "DYS540", "DYS714", "DYS716",
+    "DYS717", "DYS505", "DYS556", "DYS549", "DYS589",
+    "DYS522", "DYS494", "DYS533", "DYS636", "DYS575",
+    "DYS638", "DYS462", "DYS452", "DYS445", "Y-GATA-A10",
+    "DYS463", "DYS441", "Y-GGAAT-1B07", "DYS525", "DYS712",
+    "DYS593", "DYS650", "DYS532", "DYS715", "DYS504",
+    "DYS513", "DYS561", "DYS552", "DYS726", "DYS635",
+    "DYS587", "DYS643", "DYS497", "DYS510", "DYS434",
+    "DYS461", "DYS435",
+)
+
+# Панели FTDNA: сколько первых локусов FTDNA_PANEL в них входит (как markerGroups)
+PANEL_TIERS = {"Y12": 11, "Y25": 20, "Y37": 30, "Y67": 58, "Y111": 102}
+
+
+class MarkerSchema:
+    """Фиксированные позиции маркеров в векторе признаков
+
+    Схема строится по списку признаков модели и переводит входные данные
+    в матрицу этого порядка по индексам: словари маркеров из запроса
+    записываются прямо в заранее выделенную матрицу, у таблиц столбцы
+    переносятся по позициям. Отсутствующие маркеры остаются нулями
+    (как ``fillna(0)`` при обучении), неизвестные отбрасываются. Имена
+    сравниваются без учета регистра (``DYS389i`` и ``DYS389I`` - один маркер).
+
+    Мультикопийный маркер можно прислать одной строкой (``"DYS385": "11-14"``),
+    она раскладывается по столбцам ``DYS385_1``, ``DYS385_2`` как в ``CsvHandler``.
+    Если у схемы один столбец ``DYS385`` (модель ``read_training_stream``),
+    в него идет первая копия, как при обучении.
+    """
+
+    def __init__(self, names: Sequence[str]):
+        self.names: Tuple[str, ...] = tuple(names)
+        self.positions: Dict[str, int] = {name: i for i, name in enumerate(self.names)}
+        self._lookup = {self.normalize(name): i for i, name in reversed(list(enumerate(self.names)))}
+        self._lookup.update(self.positions)
+
+        # Копии мультикопийных маркеров: базовое имя -> позиции столбцов _1.._n
+        self.copies: Dict[str, Tuple[int, ...]] = {}
+        for marker, count in CsvHandler.MULTI_VALUE_MARKERS.items():
+            slots = tuple(self._lookup.get(self.normalize(f"{marker}_{i + 1}")) for i in range(count))
+            if all(slot is not None for slot in slots):
+                self.copies[self.normalize(marker)] = slots
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    @staticmethod
+    def normalize(name: str) -> str:
+        return str(name).strip().upper()
+
+    @classmethod
+    def for_features(cls, names: Sequence[str]) -> 'MarkerSchema':
+        """Схема для списка признаков модели; одинаковые списки делят один объект"""
+        return _schema_for(tuple(names))
+
+    @classmethod
+    def ftdna(cls, extra: Iterable[str] = (), tier: Optional[str] = None) -> 'MarkerSchema':
+        """Каноническая схема: панель FTDNA с развернутыми копиями и ``extra`` в конце
+
+        С ``tier`` (ключ ``PANEL_TIERS``) схема ограничена маркерами этой панели.
+        """
+        loci = FTDNA_PANEL[:PANEL_TIERS[tier]] if tier is not None else FTDNA_PANEL
+        names = []
+        for marker in loci:
+            count = CsvHandler.MULTI_VALUE_MARKERS.get(marker)
+            names.extend([f"{marker}_{i + 1}" for i in range(count)] if count else [marker])
+        known = {cls.normalize(name) for name in names}
+        names.extend(name for name in extra if cls.normalize(name) not in known)
+        return cls(names)
+
+    def position(self, name: str) -> Optional[int]:
+        position = self.positions.get(name)
+        if position is None:
+            position = self._lookup.get(self.normalize(name))
+        return position
+
+    def sort_columns(self, columns: Iterable[str]) -> List[str]:
+        """Столбцы в порядке схемы; неизвестные - в конце в исходном порядке"""
+        columns = list(columns)
+        rank = {column: self.position(column) for column in columns}
+        return sorted(columns, key=lambda column: (rank[column] is None, rank[column] or 0))
+
+    def _put(self, row: np.ndarray, name: str, value: Any, scale: int):
+        position = self.position(name)
+        if position is None:
+            slots = self.copies.get(self.normalize(name))
+            if slots is not None and value is not None:
+                for slot, copy in zip(slots, CsvHandler.parse_multi_values(str(value))):
+                    row[slot] = copy * scale
+            return
+        if isinstance(value, str):
+            # Как при обучении (``CsvHandler.read_training_stream``): в столбец
+            # без копий идет значение до первого "-", "11-14" -> 11
+            text = value.partition('-')[0].strip()
+            if not text:
+                return
+            try:
+                value = float(text)
+            except ValueError:
+                raise ValueError(f"Invalid value for marker {name}: {value!r}") from None
+        if value is None or value != value:
+            return
+        row[position] = round(value * scale) if scale != 1 else value
+
+    def encode(self, markers: Mapping[str, Any], out: Optional[np.ndarray] = None,
+               dtype=np.float32, scale: int = 1) -> np.ndarray:
+        """Записывает словарь маркеров в строку ``out`` (или в новую нулевую строку)
+
+        Строка, из которой не читается число, вызывает ``ValueError``.
+
+        Значения умножаются на ``scale``, например ``FIXED_POINT_SCALE``
+        для фиксированной точки в ``int16`` (см. ``models.marker_dtypes``).
+        """
+        if out is None:
+            out = np.zeros(len(self.names), dtype=dtype)
+        for name, value in markers.items():
+            self._put(out, name, value, scale)
+        return out
+
+    def encode_batch(self, samples: Sequence[Mapping[str, Any]], dtype=np.float32,
+                     scale: int = 1) -> np.ndarray:
+        """Матрица ``(len(samples), len(schema))`` из словарей маркеров"""
+        matrix = np.zeros((len(samples), len(self.names)), dtype=dtype)
+        for row, markers in zip(matrix, samples):
+            self.encode(markers, out=row, scale=scale)
+        return matrix
+
+    def align(self, X: pd.DataFrame) -> np.ndarray:
+        """Настоящие значения столбцов таблицы в порядке схемы, float64
+
+        Масштабы столбцов берутся из attrs таблицы (``models.marker_dtypes``).
+        """
+        values = np.zeros((len(X), len(self.names)), dtype=np.float64)
+        scales = marker_scales(X)
+        for column in X.columns:
+            position = self.position(column)
+            if position is None:
+                continue
+            series = X[column]
+            values[:, position] = series.to_numpy(dtype=np.float64, na_value=0)
+            scale = scales.get(str(column), 1)
+            if scale != 1:
+                values[:, position] /= scale
+        return values
+
+    def frame(self, values: np.ndarray) -> pd.DataFrame:
+        """Таблица с именами признаков схемы (для sklearn с ``feature_names_in_``)"""
+        return pd.DataFrame(values, columns=list(self.names), copy=False)
+
+
+@lru_cache(maxsize=32)
+def _schema_for(names: Tuple[str, ...]) -> MarkerSchema:
+    return MarkerSchema(names)
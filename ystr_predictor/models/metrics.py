@@ -0,0 +1,108 @@
+# c:\projects\DNA-utils-universal\ystr_predictor\models\metrics.py
+import os
+import threading
+from typing import Callable, Dict, Iterator, Optional, Sequence, Tuple
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client import multiprocess
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily, Metric
+
+# Секунды: от 50 мкс (скомпилированный узел на один образец) до 10 с
+LATENCY_BUCKETS = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+SIZE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 5000)
+
+# Значения метрики обратного вызова: метки -> число (None - не выдавать)
+CallbackValues = Dict[Tuple[str, ...], Optional[float]]
+
+
+class CallbackCollector:
+    """Значения, которые считываются из объекта в момент выдачи /metrics
+
+    Подходит для того, что уже подсчитано в другом месте (статистика
+    кэша, версия модели), без повторного учета на горячем пути. Значения
+    берутся у ответившего процесса и между воркерами не суммируются.
+    """
+
+    FAMILIES = {"gauge": GaugeMetricFamily, "counter": CounterMetricFamily}
+
+    def __init__(self):
+        self._callbacks: Dict[str, Tuple[str, str, Callable[[], CallbackValues], Tuple[str, ...]]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, name: str, documentation: str, kind: str,
+            callback: Callable[[], CallbackValues], labelnames: Sequence[str] = ()):
+        if kind not in self.FAMILIES:
+            raise ValueError(f"Unsupported callback metric type: {kind}")
+        with self._lock:
+            self._callbacks.setdefault(name, (documentation, kind, callback, tuple(labelnames)))
+
+    def collect(self) -> Iterator[Metric]:
+        with self._lock:
+            callbacks = list(self._callbacks.items())
+        for name, (documentation, kind, callback, labelnames) in callbacks:
+            family = self.FAMILIES[kind](name, documentation, labels=labelnames)
+            for labels, value in callback().items():
+                if value is not None:
+                    family.add_metric(list(labels), value)
+            yield family
+
+
+class MetricsRegistry:
+    """Метрики приложения в текстовом формате Prometheus (prometheus_client)
+
+    Без ``directory`` метрики живут в памяти процесса. Под gunicorn
+    (``PROMETHEUS_MULTIPROC_DIR``, см. gunicorn_conf.py) prometheus_client
+    сам пишет счетчики и гистограммы каждого процесса в файлы каталога, а
+    ``/metrics`` любого воркера отдает их сумму через
+    ``MultiProcessCollector``. Каталог задается до импорта
+    prometheus_client и очищается до запуска сервера.
+    """
+
+    CONTENT_TYPE = CONTENT_TYPE_LATEST
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory
+        self.registry = CollectorRegistry()
+        self.callbacks = CallbackCollector()
+        self.registry.register(self.callbacks)
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, name: str, factory: Callable[[], object]):
+        # Повторное объявление (например, при повторном импорте модуля) - та же метрика
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = factory()
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(name, lambda: Counter(
+            name, documentation, labelnames, registry=self.registry
+        ))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(name, lambda: Histogram(
+            name, documentation, labelnames, registry=self.registry, buckets=buckets
+        ))
+
+    def callback(self, name: str, documentation: str, kind: str,
+                 callback: Callable[[], CallbackValues], labelnames: Sequence[str] = ()):
+        self.callbacks.add(name, documentation, kind, callback, labelnames)
+
+    def render(self) -> bytes:
+        if self.directory is None:
+            return generate_latest(self.registry)
+        # Значения счетчиков и гистограмм - сумма файлов всех процессов каталога
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry, path=self.directory)
+        registry.register(self.callbacks)
+        return generate_latest(registry)
+
+
+# Под gunicorn каталог задает gunicorn_conf.py; без него - метрики процесса
+REGISTRY = MetricsRegistry(os.environ.get("PROMETHEUS_MULTIPROC_DIR") or None)
@@ -1,4 +1,5 @@
 # c:\projects\DNA-utils-universal\ystr_predictor\models\model_monitor.py
+# -*- coding: cp1251 -*-
 from sklearn.metrics import roc_auc_score, precision_score, recall_score, f1_score
 import numpy as np
 import pandas as pd
@@ -8,8 +9,29 @@ from datetime import datetime
 import json
 import logging
 from pathlib import Path
+import re
 import sqlite3
 
+from models.dataset_stats import DatasetStats
+from models.tree_artifact import TreeArtifact
+
+# : "1d", "12h", "30m"  "7 days", "2 hours", "15 minutes"
+_WINDOW_PATTERN = re.compile(r'^(\d+)\s*(?:(d|days?)|(h|hours?)|(m|minutes?))$')
+
+
+def window_modifier(window_size: str) -> str:
+    """ SQLite  ``datetime('now', 'localtime', ?)``   ``window_size``
+
+       ,      SQL.
+       - ``ValueError``.
+    """
+    match = _WINDOW_PATTERN.match(str(window_size).strip())
+    if match is None:
+        raise ValueError(f"Invalid window: {window_size!r} (expected e.g. '1d', '12h', '30 minutes')")
+    unit = 'days' if match.group(2) else 'hours' if match.group(3) else 'minutes'
+    return f"-{int(match.group(1))} {unit}"
+
+
 @dataclass
 class PredictionRecord:
     timestamp: datetime
@@ -25,6 +47,8 @@ class ModelMonitor:
         self.db_path = db_path
         self.initialize_db()
         self.baseline_stats = {}
+        #     (DatasetStats) -   
+        self.baseline_dataset: Optional[DatasetStats] = None
         self.drift_thresholds = {
             'prediction_drift': 0.1,
             'feature_drift': 0.2,
@@ -90,16 +114,87 @@ class ModelMonitor:
     def set_baseline_stats(self, stats: Dict):
         """     """
         self.baseline_stats = stats
+
+    def set_baseline_dataset(self, stats: DatasetStats):
+        """    (   )"""
+        self.baseline_dataset = stats
+
+    def load_baseline_dataset(self, model_path: str) -> bool:
+        """    dataset_stats.json   ``model_path``
+
+         False,        .
+        """
+        path = Path(model_path) / TreeArtifact.STATS
+        if not path.exists():
+            return False
+        self.set_baseline_dataset(DatasetStats.load(path))
+        return True
+
+    def window_stats(self, window_size: str = '1d') -> DatasetStats:
+        """         """
+        with sqlite3.connect(self.db_path) as conn:
+            # log_prediction     ISO- ( "T")
+            df = pd.read_sql(
+                """
+                SELECT features, prediction FROM predictions
+                WHERE datetime(timestamp) >= datetime('now', 'localtime', ?)
+                """,
+                conn,
+                params=(window_modifier(window_size),)
+            )
+
+        markers = self.baseline_dataset.markers if self.baseline_dataset is not None else None
+        features = pd.DataFrame([json.loads(f) for f in df['features']])
+        if markers is not None:
+            #      
+            features = features.reindex(columns=markers)
+        features = features.apply(pd.to_numeric, errors='coerce')
+        return DatasetStats(markers).update(features, df['prediction'])
+
+    def detect_feature_drift(self, current: DatasetStats) -> List[Dict]:
+        """     
+
+         -  PSI   ( ``feature_drift``),
+         -      (``prediction_drift``).
+        """
+        alerts = []
+        if self.baseline_dataset is None:
+            return alerts
+
+        threshold = self.drift_thresholds['feature_drift']
+        for marker, psi in self.baseline_dataset.psi(current).items():
+            if psi > threshold:
+                alerts.append({
+                    'timestamp': datetime.now().isoformat(),
+                    'alert_type': 'feature_drift',
+                    'description': f'Distribution of {marker} shifted (PSI {psi:.3f})',
+                    'severity': 'high' if psi > 2 * threshold else 'medium'
+                })
+
+        shift = self.baseline_dataset.class_shift(current)
+        threshold = self.drift_thresholds['prediction_drift']
+        if shift > threshold:
+            alerts.append({
+                'timestamp': datetime.now().isoformat(),
+                'alert_type': 'prediction_drift',
+                'description': f'Haplogroup distribution shifted (distance {shift:.3f})',
+                'severity': 'high' if shift > 2 * threshold else 'medium'
+            })
+
+        self._log_alerts(alerts)
+        return alerts
         
     def calculate_metrics(self, window_size: str = '1d') -> Dict:
         """    """
         with sqlite3.connect(self.db_path) as conn:
+            # log_prediction     ISO- ( "T")
             df = pd.read_sql(
-                f"""
-                SELECT * FROM predictions 
-                WHERE timestamp >= datetime('now', '-{window_size}')
+                """
+                SELECT * FROM predictions
+                WHERE datetime(timestamp) >= datetime('now', 'localtime', ?)
                 """,
-                conn
+                conn,
+                params=(window_modifier(window_size),)
             )
             
         if len(df) == 0:
@@ -145,7 +240,11 @@ class ModelMonitor:
                         'severity': 'high' if drift > 2 * self.drift_thresholds['performance_drop'] else 'medium'
                     })
                     
-        #  
+        self._log_alerts(alerts)
+        return alerts
+
+    def _log_alerts(self, alerts: List[Dict]):
+        """    """
         with sqlite3.connect(self.db_path) as conn:
             for alert in alerts:
                 conn.execute(
@@ -160,8 +259,6 @@ class ModelMonitor:
                         alert['severity']
                     )
                 )
-                
-        return alerts
 
 class ABTesting:
     def __init__(self, experiment_name: str):
@@ -0,0 +1,141 @@
+# c:\projects\DNA-utils-universal\ystr_predictor\models\model_store.py
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Optional
+
+from models.tree_artifact import TreeArtifact
+from models.tree_predictor import TreeHaploPredictor
+
+
+def resident_memory_bytes() -> Optional[int]:
+    """Текущий RSS процесса (Linux), иначе пиковый из resource"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        import os
+        return pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        import sys
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    except ImportError:
+        return None
+
+
+class ModelHandle:
+    """Неизменяемая опубликованная версия модели
+
+    Запрос берет ссылку на handle через ``ModelStore.acquire`` и работает
+    с ней до конца, даже если тем временем опубликована новая версия.
+    Снятая с публикации версия освобождается, когда уходит последний запрос.
+    """
+
+    def __init__(self, version: str, predictor: TreeHaploPredictor):
+        self.version = version
+        self.predictor = predictor
+        self.loaded_at = time.time()
+        self.load_seconds: Optional[float] = None
+        self.rss_bytes: Optional[int] = None
+        self._refs = 0
+        self._retired = False
+
+    def release(self):
+        logging.info(f"Released model version {self.version}")
+        self.predictor = None
+
+
+class ModelStore:
+    """Хранилище обслуживаемой модели с атомарной горячей заменой"""
+
+    def __init__(self, path: str = "models/saved/",
+                 haplo_api_url: str = "http://localhost:9003/api"):
+        self.path = path
+        self.haplo_api_url = haplo_api_url
+        self._current: Optional[ModelHandle] = None
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._listeners: List[Callable[[ModelHandle], None]] = []
+
+    @property
+    def current(self) -> Optional[ModelHandle]:
+        return self._current
+
+    def add_listener(self, callback: Callable[[ModelHandle], None]):
+        """Регистрирует обработчик, вызываемый после публикации версии"""
+        self._listeners.append(callback)
+
+    @contextmanager
+    def acquire(self) -> Iterator[Optional[ModelHandle]]:
+        """Выдает текущую версию модели на время обработки запроса"""
+        with self._lock:
+            handle = self._current
+            if handle is not None:
+                handle._refs += 1
+        try:
+            yield handle
+        finally:
+            if handle is not None:
+                with self._lock:
+                    handle._refs -= 1
+                    drained = handle._retired and handle._refs == 0
+                if drained:
+                    handle.release()
+
+    def load(self, path: Optional[str] = None) -> ModelHandle:
+        """Загружает и прогревает модель, не публикуя ее"""
+        start_time = time.time()
+        predictor = TreeHaploPredictor(haplo_api_url=self.haplo_api_url)
+        predictor.load_model(path or self.path)
+        predictor.warm_up()
+
+        handle = ModelHandle(predictor.version, predictor)
+        handle.load_seconds = time.time() - start_time
+        handle.rss_bytes = resident_memory_bytes()
+        rss = f"{handle.rss_bytes / 2 ** 20:.1f} MB" if handle.rss_bytes else "unknown"
+        logging.info(
+            f"Loaded model version {predictor.version} "
+            f"in {handle.load_seconds:.2f} seconds, RSS {rss}"
+        )
+        return handle
+
+    def publish(self, handle: ModelHandle) -> Optional[ModelHandle]:
+        """Делает версию текущей одной заменой ссылки и возвращает прежнюю"""
+        with self._lock:
+            previous = self._current
+            self._current = handle
+            drained = False
+            if previous is not None:
+                previous._retired = True
+                drained = previous._refs == 0
+        if drained:
+            previous.release()
+
+        logging.info(f"Published model version {handle.version}")
+        for callback in self._listeners:
+            callback(handle)
+        return previous
+
+    def reload(self, path: Optional[str] = None) -> ModelHandle:
+        """Загружает артефакт в фоне и публикует его без остановки обслуживания"""
+        with self._reload_lock:
+            handle = self.load(path)
+            self.publish(handle)
+            return handle
+
+    def reload_if_changed(self) -> Optional[ModelHandle]:
+        """Перезагружает модель, если на диске лежит другая версия артефакта
+
+        Нужна при нескольких воркерах: новую модель публикует один процесс,
+        остальные замечают ее по версии в манифесте.
+        """
+        stored = TreeArtifact.read_version(f"{self.path}tree_model")
+        current = self._current
+        if stored is None or (current is not None and current.version == stored):
+            return None
+        logging.info(f"Model artifact changed on disk: {stored}")
+        return self.reload()
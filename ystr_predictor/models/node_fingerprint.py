@@ -0,0 +1,77 @@
+# c:\projects\DNA-utils-universal\ystr_predictor\models\node_fingerprint.py
+"""Отпечатки обучающих данных моделей узлов
+
+Модель узла определяется его строками (значения маркеров и веса),
+метками этих строк в узле и настройками обучения. Отпечаток узла -
+три хеша: ``config`` (маркеры, число деревьев, версия
+кода обучения), ``samples`` (идентификаторы строк вместе с их метками и
+весами, без учета порядка) и ``labels`` (распределение меток). Если
+отпечаток узла не изменился, его модель из прошлого артефакта можно
+взять без обучения; отличающийся ключ показывает причину переобучения.
+
+Идентификатор строки - хеш настоящих значений маркеров, поэтому он не
+зависит от компактного типа столбцов, порядка строк и индекса.
+"""
+import hashlib
+import json
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from models.marker_dtypes import marker_scales
+
+FINGERPRINT_KEYS = ("config", "samples", "labels")
+# Множитель для смешивания 64-битных хешей (золотое сечение)
+_MIX = np.uint64(0x9E3779B97F4A7C15)
+
+
+def _digest(*parts: bytes) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part)
+    return digest.hexdigest()[:16]
+
+
+def sample_ids(X: pd.DataFrame) -> np.ndarray:
+    """64-битный идентификатор каждой строки по настоящим значениям маркеров"""
+    ids = np.zeros(len(X), dtype=np.uint64)
+    scales = marker_scales(X)
+    with np.errstate(over="ignore"):
+        for name, column in X.items():
+            values = column.to_numpy(dtype=np.float64)
+            scale = scales.get(str(name), 1)
+            if scale != 1:
+                values = values / scale
+            ids = ids * _MIX + pd.util.hash_array(values)
+    return ids
+
+
+def config_digest(**settings) -> str:
+    """Хеш настроек обучения (значения должны сериализоваться в JSON)"""
+    return _digest(json.dumps(settings, sort_keys=True).encode("utf-8"))
+
+
+def node_fingerprint(ids: np.ndarray, codes: np.ndarray, classes: Sequence[str],
+                     weights: Optional[np.ndarray], config: str) -> Dict[str, str]:
+    """Отпечаток данных узла: ``ids`` и ``weights`` - строк узла, ``codes`` - их метки в ``classes``"""
+    class_hashes = pd.util.hash_array(np.asarray(classes, dtype=object))
+    with np.errstate(over="ignore"):
+        keys = ids * _MIX + class_hashes[codes]
+    weights = np.ones(len(ids)) if weights is None else np.asarray(weights, dtype=np.float64)
+    order = np.lexsort((weights, keys))
+
+    counts = np.bincount(codes, weights=weights, minlength=len(classes))
+    distribution = sorted(zip(map(str, classes), counts.tolist()))
+    return {
+        "config": config,
+        "samples": _digest(keys[order].tobytes(), weights[order].tobytes()),
+        "labels": _digest(json.dumps(distribution).encode("utf-8")),
+    }
+
+
+def changed_keys(current: Dict[str, str], previous: Optional[Dict[str, str]]) -> List[str]:
+    """Ключи отпечатка, по которым узел отличается от прошлого обучения"""
+    if not previous:
+        return ["new"]
+    return [key for key in FINGERPRINT_KEYS if current.get(key) != previous.get(key)]
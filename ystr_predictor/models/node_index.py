@@ -0,0 +1,81 @@
+# c:\projects\DNA-utils-universal\ystr_predictor\models\node_index.py
+"""Строки обучающего набора для каждого узла дерева гаплогрупп
+
+Узлу принадлежат образцы, в пути гаплогруппы которых он стоит (корню -
+все образцы), метка образца в узле - следующий узел его пути или сам
+узел, если путь на нем кончается. ``NodeIndex`` строится за один проход
+по уникальным гаплогруппам: каждая проходит свой путь по дереву, и
+узлы получают ее код. Строки гаплогруппы - непрерывный отрезок
+сортировки по кодам, поэтому строки узла собираются склейкой отрезков
+без сравнений строк.
+"""
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Метка строки, путь которой кончается в самом узле
+OWN_LABEL = -1
+
+
+class NodeIndex:
+    """Отсортированные номера строк (``int32``) и метки дочерних узлов для каждого узла"""
+
+    def __init__(self, root, y: pd.Series, paths: Dict[str, Sequence[str]]):
+        codes, haplogroups = pd.factorize(y)
+        self.n_rows = len(codes)
+        # Строки каждой гаплогруппы подряд: order[starts[u]:starts[u + 1]]
+        order = np.argsort(codes, kind="stable").astype(np.int32)
+        starts = np.searchsorted(codes[order], np.arange(len(haplogroups) + 1))
+
+        # Узел -> коды его гаплогрупп и номера дочерних узлов в их путях
+        members: Dict[int, Tuple[object, List[int], List[int]]] = {}
+
+        def add(node, code: int, child: int):
+            entry = members.get(id(node))
+            if entry is None:
+                entry = members[id(node)] = (node, [], [])
+            entry[1].append(code)
+            entry[2].append(child)
+
+        positions: Dict[int, Dict[str, int]] = {}
+        for code, haplogroup in enumerate(haplogroups):
+            node = root
+            for name in paths.get(haplogroup) or ():
+                if name not in node.children:
+                    break
+                if id(node) not in positions:
+                    positions[id(node)] = {child: i for i, child in enumerate(node.children)}
+                add(node, code, positions[id(node)][name])
+                node = node.children[name]
+            add(node, code, OWN_LABEL)
+
+        self._nodes: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+        for node, node_codes, children in members.values():
+            lengths = starts[np.asarray(node_codes) + 1] - starts[np.asarray(node_codes)]
+            rows = np.concatenate([order[starts[c]:starts[c + 1]] for c in node_codes])
+            labels = np.repeat(np.asarray(children, dtype=np.int32), lengths)
+            ordered = np.argsort(rows, kind="stable")
+            self._nodes[id(node)] = (rows[ordered], labels[ordered])
+
+    def rows(self, node) -> np.ndarray:
+        """Номера строк узла по возрастанию"""
+        entry = self._nodes.get(id(node))
+        return entry[0] if entry is not None else np.empty(0, dtype=np.int32)
+
+    def size(self, node) -> int:
+        return len(self.rows(node))
+
+    def labels(self, node) -> Tuple[np.ndarray, List[str]]:
+        """Метки строк узла: коды (в порядке ``rows``) и имена классов
+
+        Классы - только встретившиеся метки: имена дочерних узлов и самого
+        узла, если на нем кончаются пути.
+        """
+        entry = self._nodes.get(id(node))
+        if entry is None:
+            return np.empty(0, dtype=np.int32), []
+        children = list(node.children)
+        present, codes = np.unique(entry[1], return_inverse=True)
+        names = [children[i] if i != OWN_LABEL else node.name for i in present]
+        return codes.astype(np.int32), names
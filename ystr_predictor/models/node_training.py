@@ -0,0 +1,366 @@
+# c:\projects\DNA-utils-universal\ystr_predictor\models\node_training.py
+"""Параллельное обучение моделей узлов дерева гаплогрупп
+
+Узлы обучаются независимо: каждому нужны только его строки X и метки
+дочерних узлов. ``NodeTrainer`` готовит задания (номера строк и метки
+из ``NodeIndex``) в основном процессе и раздает их пулу процессов,
+начиная с самых больших узлов, чтобы долгие задания не остались
+в хвосте. Матрица маркеров один
+раз пишется в ``.npy`` и открывается воркерами через ``mmap``: они делят
+ее через page cache, в задание уходят только номера строк. Число
+одновременно обучаемых узлов ограничено числом процессов и оценкой
+памяти (``memory_bytes``).
+
+С прошлым артефактом (``previous``) узлы, чей отпечаток данных
+(``models.node_fingerprint``) не изменился, берут его модели без обучения.
+"""
+import logging
+import multiprocessing
+import shutil
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.preprocessing import StandardScaler
+
+from models.marker_dtypes import compact_frame, decode_markers, marker_scales, with_scales
+from models.node_fingerprint import changed_keys, config_digest, node_fingerprint, sample_ids
+from models.node_index import NodeIndex
+
+# Матрица маркеров, открытая в воркере (см. _init_worker)
+_SHARED: Dict[str, object] = {}
+# Входит в отпечаток узлов: увеличивается при изменении кода обучения узла
+TRAINING_VERSION = 3
+
+
+class NodeTask:
+    """Обучение одного узла: его строки в общей матрице и метки дочерних узлов"""
+
+    def __init__(self, node, rows: np.ndarray, codes: np.ndarray, classes: List[str],
+                 weights: Optional[np.ndarray]):
+        self.node = node
+        self.rows = rows
+        self.codes = codes
+        self.classes = classes
+        self.weights = weights
+        self.fingerprint: Optional[Dict[str, str]] = None
+        # Почему узел обучается заново (см. changed_keys)
+        self.changed: List[str] = []
+
+    @property
+    def samples(self) -> float:
+        """Вес строк узла (число строк, если весов нет)"""
+        return float(self.weights.sum()) if self.weights is not None else float(len(self.rows))
+
+    def payload(self) -> Tuple:
+        return self.node.name, self.rows, self.codes, self.classes, self.weights
+
+
+def fit_node(values: pd.DataFrame, labels: np.ndarray, weights: Optional[np.ndarray],
+             n_estimators: int):
+    """StandardScaler и RandomForest узла (общий код для процесса и пула)
+
+    Лес обучается одним ``fit`` на всех строках узла: каждое из
+    ``n_estimators`` деревьев видит всю выборку узла. Пакетами лес
+    только дообучается (``update_node``).
+    """
+    scaler = StandardScaler()
+    # Компактные значения маркеров переводятся во float64 только для строк узла
+    X_scaled = scaler.fit_transform(decode_markers(values), sample_weight=weights)
+
+    model = RandomForestClassifier(
+        n_estimators=n_estimators,
+        max_depth=None,
+        min_samples_split=2,
+        min_samples_leaf=1,
+        n_jobs=1,  # Параллельность - по узлам, а не по деревьям леса
+        random_state=42
+    )
+    model.fit(X_scaled, labels, sample_weight=weights)
+    return model, scaler
+
+
+def grow_forest(model: RandomForestClassifier, X_scaled: np.ndarray, labels: np.ndarray,
+                weights: Optional[np.ndarray], n_trees: int, batch_size: int,
+                classes: np.ndarray):
+    """Добавляет в лес ровно ``n_trees`` деревьев, обучая их по пакетам строк
+
+    Строки перемешиваются и делятся на пакеты примерно по ``batch_size``,
+    деревья делятся между пакетами поровну. Пакетов не больше, чем
+    деревьев: при большой порции пакеты укрупняются, а не добавляют
+    деревья сверх ``n_trees``. Каждое дерево видит все ``classes`` леса:
+    к пакету добавляется по строке каждого класса с нулевым весом, иначе
+    ``warm_start`` пересчитал бы ``classes_`` по пакету и старые деревья
+    разошлись бы с новыми.
+    """
+    n_rows = len(X_scaled)
+    n_batches = max(1, min(-(-n_rows // batch_size), n_trees))
+    order = np.random.default_rng(len(getattr(model, "estimators_", ()))).permutation(n_rows)
+    trees = np.diff(np.linspace(0, n_trees, n_batches + 1).round().astype(int))
+
+    X_classes = np.zeros((len(classes), X_scaled.shape[1]))
+    w_classes = np.zeros(len(classes))
+    grown = len(getattr(model, "estimators_", ()))
+    model.warm_start = True
+    for rows, batch_trees in zip(np.array_split(order, n_batches), trees):
+        w_batch = weights[rows] if weights is not None else np.ones(len(rows))
+        grown += batch_trees
+        model.n_estimators = grown
+        model.fit(
+            np.vstack([X_scaled[rows], X_classes]),
+            np.concatenate([labels[rows], classes]),
+            sample_weight=np.concatenate([w_batch, w_classes])
+        )
+    return model
+
+
+def update_node(model: RandomForestClassifier, scaler: StandardScaler, values: pd.DataFrame,
+                labels: np.ndarray, weights: Optional[np.ndarray], n_trees: int, batch_size: int):
+    """Дообучает лес узла на новых строках: скейлер и старые деревья не меняются
+
+    Метки должны быть из ``model.classes_``.
+    """
+    X_scaled = scaler.transform(decode_markers(values))
+    return grow_forest(model, X_scaled, labels, weights, n_trees, batch_size, model.classes_)
+
+
+def _init_worker(matrix_path: str, columns: List[str], scales: Dict[str, int], n_estimators: int):
+    _SHARED.update(
+        matrix=np.load(matrix_path, mmap_mode="r"),
+        columns=columns,
+        scales=scales,
+        n_estimators=n_estimators,
+    )
+
+
+def _fit_shared(payload: Tuple):
+    """Задание пула: строки узла читаются из общей матрицы"""
+    _, rows, codes, classes, weights = payload
+    start = time.perf_counter()
+    values = with_scales(pd.DataFrame(_SHARED["matrix"][rows], columns=_SHARED["columns"], copy=False),
+                         _SHARED["scales"])
+    labels = np.asarray(classes, dtype=object)[codes]
+    model, scaler = fit_node(values, labels, weights, _SHARED["n_estimators"])
+    return model, scaler, time.perf_counter() - start
+
+
+class NodeTrainer:
+    """Обучает модели всех внутренних узлов дерева
+
+    ``workers`` - число процессов (1 - в текущем процессе, без пула),
+    ``memory_bytes`` - сколько памяти могут занять одновременно
+    обучаемые узлы по оценке ``estimate_bytes``; самый большой узел
+    запускается, даже если один не укладывается в бюджет.
+    """
+
+    def __init__(self, n_estimators: int = 100, workers: int = 1,
+                 memory_bytes: Optional[int] = None, work_dir: Optional[str] = None):
+        self.n_estimators = n_estimators
+        self.workers = max(1, workers)
+        self.memory_bytes = memory_bytes
+        self.work_dir = work_dir
+
+    def tasks(self, root, index: NodeIndex, sample_weight: Optional[np.ndarray] = None,
+              ids: Optional[np.ndarray] = None, config: str = "") -> Tuple[List[NodeTask], int]:
+        """Задания для узлов с детьми, от больших к меньшим, и число таких узлов
+
+        Строки и метки узлов берутся из ``NodeIndex``. Узлы, где меньше
+        двух строк или меньше двух меток, заданий не получают. С ``ids``
+        (``sample_ids`` строк) заданиям считается отпечаток.
+        """
+        tasks, trainable = [], 0
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            stack.extend(node.children.values())
+            if not node.children:
+                continue
+            trainable += 1
+
+            rows = index.rows(node)
+            if len(rows) < 2:
+                continue
+            codes, classes = index.labels(node)
+            if len(classes) < 2:
+                continue
+
+            weights = sample_weight[rows] if sample_weight is not None else None
+            task = NodeTask(node, rows, codes, classes, weights)
+            if ids is not None:
+                task.fingerprint = node_fingerprint(ids[rows], codes, classes, weights, config)
+            tasks.append(task)
+
+        tasks.sort(key=lambda task: len(task.rows), reverse=True)
+        return tasks, trainable
+
+    def estimate_bytes(self, task: NodeTask, n_features: int) -> int:
+        """Грубая оценка памяти узла: строки во float64 дважды (до и после
+        масштабирования) и лес (до двух узлов дерева на строку)"""
+        rows = len(task.rows)
+        tree_node_bytes = 64 + 8 * len(task.classes)
+        return rows * n_features * 8 * 2 + self.n_estimators * 2 * rows * tree_node_bytes
+
+    def config(self, columns: Sequence[str]) -> str:
+        """Хеш настроек, от которых зависит модель узла"""
+        return config_digest(features=list(columns), n_estimators=self.n_estimators,
+                             version=TRAINING_VERSION)
+
+    def reuse(self, tasks: List[NodeTask], previous) -> List[NodeTask]:
+        """Берет из артефакта ``previous`` модели узлов с прежним отпечатком
+
+        Возвращает задания, которые нужно обучать; у них заполнено ``changed``.
+        """
+        paths = previous.node_paths()
+        remaining = []
+        for task in tasks:
+            index = paths.get(_node_path(task.node))
+            forest = previous.nodes[index]["forest"] if index is not None else None
+            task.changed = changed_keys(task.fingerprint, forest.get("fingerprint") if forest else None)
+            if not task.changed:
+                try:
+                    task.node.model, task.node.scaler = previous.estimators(index)
+                    task.node.n_samples = task.samples
+                    task.node.fingerprint = task.fingerprint
+                    task.node.fit_seconds = forest.get("fit_seconds")
+                    continue
+                except Exception as e:
+                    logging.warning(f"Could not reuse model of {task.node.name}: {str(e)}")
+                    task.changed = ["unreadable"]
+            remaining.append(task)
+        return remaining
+
+    def train(self, root, X: pd.DataFrame, y: pd.Series, paths: Dict[str, Sequence[str]],
+              sample_weight: Optional[np.ndarray] = None,
+              on_node: Optional[Callable[[int, int], None]] = None,
+              previous=None) -> Dict:
+        """Обучает узлы дерева ``root`` и записывает в них ``model`` и ``scaler``
+
+        ``paths`` - пути гаплогрупп, по которым построено дерево.
+        ``on_node(done, total)`` вызывается после каждого узла (пропущенные
+        и взятые из ``previous`` узлы засчитываются сразу). ``previous`` -
+        ``TreeArtifact`` прошлого обучения.
+
+        Returns:
+            Dict: ``rebuilt`` (узлы и причины), ``reused``, ``training_seconds``
+            и ``saved_seconds`` - время обучения взятых узлов в прошлый раз
+        """
+        start = time.perf_counter()
+        values = compact_frame(X)
+        tasks, total = self.tasks(root, NodeIndex(root, y, paths), sample_weight,
+                                  ids=sample_ids(values), config=self.config(X.columns))
+        fitted = self.reuse(tasks, previous) if previous is not None else tasks
+        fitted_ids = {id(task) for task in fitted}
+        reused = [task for task in tasks if id(task) not in fitted_ids]
+        report = {
+            "nodes": total,
+            "rebuilt": [{"node": task.node.name, "changed": task.changed} for task in fitted],
+            "reused": [task.node.name for task in reused],
+            "saved_seconds": sum(task.node.fit_seconds or 0.0 for task in reused),
+        }
+        if reused:
+            logging.info(f"Reusing {len(reused)} node models, training {len(fitted)}")
+
+        done = total - len(fitted)
+        if on_node:
+            on_node(done, total)
+        if fitted:
+            self._fit(fitted, values, list(X.columns), done, total, on_node)
+        report["training_seconds"] = time.perf_counter() - start
+        return report
+
+    def _fit(self, tasks: List[NodeTask], values: pd.DataFrame, columns: List[str],
+             done: int, total: int, on_node: Optional[Callable[[int, int], None]]):
+        # Масштабы столбцов передаются вместе с матрицей (в .npy их нет)
+        scales = marker_scales(values)
+        if self.workers == 1 or len(tasks) == 1:
+            matrix = values.to_numpy()
+            for task in tasks:
+                self._log_start(task)
+                try:
+                    start = time.perf_counter()
+                    labels = np.asarray(task.classes, dtype=object)[task.codes]
+                    frame = with_scales(pd.DataFrame(matrix[task.rows], columns=columns, copy=False), scales)
+                    model, scaler = fit_node(frame, labels, task.weights, self.n_estimators)
+                    self._set_model(task, model, scaler, time.perf_counter() - start)
+                except Exception as e:
+                    self._log_failure(task, e)
+                done += 1
+                if on_node:
+                    on_node(done, total)
+            return
+
+        work_dir = Path(tempfile.mkdtemp(prefix="node-training-", dir=self.work_dir))
+        try:
+            matrix_path = work_dir / "markers.npy"
+            np.save(matrix_path, values.to_numpy())
+            n_features = len(columns)
+            # spawn, как у TrainingJobManager: fork процесса с потоками небезопасен
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(
+                max_workers=min(self.workers, len(tasks)), mp_context=context,
+                initializer=_init_worker,
+                initargs=(str(matrix_path), columns, scales, self.n_estimators)
+            ) as pool:
+                pending = list(tasks)
+                running = {}
+                reserved = 0
+                while pending or running:
+                    # Самые большие задания, которые помещаются в бюджет памяти
+                    for task in list(pending):
+                        if len(running) >= self.workers:
+                            break
+                        estimate = self.estimate_bytes(task, n_features)
+                        if (self.memory_bytes is not None and running
+                                and reserved + estimate > self.memory_bytes):
+                            continue
+                        pending.remove(task)
+                        self._log_start(task)
+                        running[pool.submit(_fit_shared, task.payload())] = (task, estimate)
+                        reserved += estimate
+
+                    finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        task, estimate = running.pop(future)
+                        reserved -= estimate
+                        try:
+                            self._set_model(task, *future.result())
+                        except Exception as e:
+                            self._log_failure(task, e)
+                        done += 1
+                        if on_node:
+                            on_node(done, total)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    @staticmethod
+    def _set_model(task: NodeTask, model, scaler, seconds: float):
+        task.node.model, task.node.scaler = model, scaler
+        task.node.n_samples = task.samples
+        task.node.fingerprint = task.fingerprint
+        task.node.fit_seconds = seconds
+
+    @staticmethod
+    def _log_start(task: NodeTask):
+        logging.info(f"Training model for {task.node.name}")
+        logging.info(f"Samples: {len(task.rows)}, Children: {len(task.classes)}")
+
+    @staticmethod
+    def _log_failure(task: NodeTask, error: Exception):
+        logging.error(f"Error training node {task.node.name}: {str(error)}")
+        task.node.model = None
+        task.node.scaler = None
+        task.node.fingerprint = None
+
+
+def _node_path(node) -> Tuple[str, ...]:
+    """Имена узлов от корня до ``node``"""
+    names = []
+    while node is not None:
+        names.append(node.name)
+        node = node.parent
+    return tuple(reversed(names))
@@ -1,4 +1,5 @@
 # c:\projects\DNA-utils-universal\ystr_predictor\models\optimized_predictor.py
+# -*- coding: cp1251 -*-
 from sklearn.model_selection import KFold, cross_validate
 from sklearn.metrics import make_scorer, f1_score, accuracy_score
 import optuna
@@ -10,6 +11,8 @@ import numpy as np
 import pandas as pd
 from typing import Dict, List, Tuple
 import logging
+from models.marker_dtypes import decode_markers
+from models.marker_schema import MarkerSchema
 
 class OptimizedHierarchicalPredictor:
     def __init__(self):
@@ -137,6 +140,7 @@ class OptimizedHierarchicalPredictor:
     def train(self, X: pd.DataFrame, haplo_column: str) -> Dict[str, Dict[str, float]]:
         """   """
         self.feature_names = X.drop(haplo_column, axis=1).columns.tolist()
+        features = decode_markers(X.drop(haplo_column, axis=1))
         metrics = {}
         
         for level in ['root', 'major', 'terminal']:
@@ -148,7 +152,7 @@ class OptimizedHierarchicalPredictor:
             
             #     
             model = self._optimize_hyperparameters(
-                X.drop(haplo_column, axis=1),
+                features,
                 y_level,
                 level
             )
@@ -156,13 +160,13 @@ class OptimizedHierarchicalPredictor:
             #  
             metrics[level] = self._evaluate_model(
                 model,
-                X.drop(haplo_column, axis=1),
+                features,
                 y_level,
                 level
             )
             
             #      
-            model.fit(X.drop(haplo_column, axis=1), y_level)
+            model.fit(features, y_level)
             self.level_models[level] = model
             
         self.is_trained = True
@@ -175,12 +179,9 @@ class OptimizedHierarchicalPredictor:
             
         results = []
         
-        #  
-        missing_features = [f for f in self.feature_names if f not in X.columns]
-        if missing_features:
-            for feature in missing_features:
-                X[feature] = 0
-        X = X[self.feature_names]
+        #     ,    
+        schema = MarkerSchema.for_features(self.feature_names)
+        X = schema.frame(schema.align(X))
         
         #     
         for level in ['root', 'major', 'terminal']:
@@ -0,0 +1,147 @@
+# c:\projects\DNA-utils-universal\ystr_predictor\models\prediction_cache.py
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Mapping, Optional
+
+import numpy as np
+
+from models.marker_schema import MarkerSchema
+
+
+class PredictionCache:
+    """LRU-кэш предсказаний с TTL и ограничением по числу записей и байтам
+
+    Ключ строится из версии модели и вектора признаков, который из
+    запроса получит модель, поэтому одинаковые гаплотипы, присланные в
+    разном порядке, с лишними полями, другим регистром имен или
+    мультикопийным маркером одной строкой, попадают в одну запись.
+
+    ``events`` - счетчик ``REGISTRY.counter`` с меткой события: попадания,
+    промахи, вытеснения, истечения и сбросы учитываются в нем, и под
+    gunicorn ``/metrics`` отдает их сумму по всем воркерам.
+    """
+
+    MISSING = "_"
+
+    def __init__(self, max_entries: int = 10000, max_bytes: int = 64 * 1024 * 1024,
+                 ttl_seconds: float = 3600.0, events=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.events = events
+
+    @classmethod
+    def _normalize_value(cls, value: Any) -> str:
+        if value is None:
+            return cls.MISSING
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            return str(value).strip() or cls.MISSING
+        if number != number:  # NaN
+            return cls.MISSING
+        return str(int(number)) if number.is_integer() else repr(number)
+
+    @classmethod
+    def make_key(cls, markers: Mapping[str, Any], schema: Optional[MarkerSchema],
+                 model_version: str) -> str:
+        """Канонический ключ: версия модели и хеш строки ``schema.encode(markers)``
+
+        Строка схемы - ровно то, что увидит модель (``predict_markers``),
+        поэтому запросы с разным ключом не могут получить одно
+        предсказание, а с одинаковым - разные. Без схемы (модель без
+        имен признаков) берутся все присланные маркеры вместе с именами.
+        """
+        if schema is not None:
+            # float64, как в predict_markers: различимые моделью значения не сливаются
+            row = schema.encode(markers, dtype=np.float64)
+            return f"{model_version}|{hashlib.blake2b(row.tobytes(), digest_size=16).hexdigest()}"
+        normalized = {str(name).strip(): value for name, value in markers.items()}
+        parts = [
+            f"{name}={cls._normalize_value(normalized[name])}"
+            for name in sorted(normalized)
+        ]
+        return f"{model_version}|{','.join(parts)}"
+
+    def _count(self, event: str, amount: int = 1):
+        if self.events is not None and amount:
+            self.events.labels(event).inc(amount)
+
+    def get(self, key: str) -> Optional[Any]:
+        value, expired = None, False
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, size, value = entry
+                if expires_at < time.monotonic():
+                    self._remove(key)
+                    self.expirations += 1
+                    entry, value, expired = None, None, True
+            if entry is None:
+                self.misses += 1
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        if expired:
+            self._count("expirations")
+        self._count("hits" if entry is not None else "misses")
+        return value
+
+    def put(self, key: str, value: Any):
+        size = len(key) + len(json.dumps(value, default=str))
+        if size > self.max_bytes:
+            return
+
+        evicted = 0
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, size, value)
+            self._bytes += size
+
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                evicted += 1
+            self.evictions += evicted
+        self._count("evictions", evicted)
+
+    def _remove(self, key: str):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def invalidate(self):
+        """Сбрасывает все записи, например после публикации новой модели"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.invalidations += 1
+        self._count("invalidations")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else None,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
@@ -6,6 +6,8 @@ import numpy as np
 import pandas as pd
 from typing import List, Dict
 import logging
+from models.marker_dtypes import decode_markers
+from models.marker_schema import MarkerSchema
 
 class HaplogroupPredictor:
     def __init__(self):
@@ -26,19 +28,23 @@ class HaplogroupPredictor:
         self.is_trained = False
         self.feature_names = None
 
-    def train(self, X: pd.DataFrame, y: pd.Series):
+    def train(self, X: pd.DataFrame, y: pd.Series, sample_weight=None):
+        # sample_weight -   (   )
         try:
             self.feature_names = X.columns.tolist()
             logging.info(f"Training with {len(self.feature_names)} features")
             
             #  
-            X_scaled = self.scaler.fit_transform(X)
+            X_scaled = self.scaler.fit_transform(decode_markers(X), sample_weight=sample_weight)
             
             #  
-            self.classifier.fit(X_scaled, y)
+            self.classifier.fit(X_scaled, y, sample_weight=sample_weight)
             
             #       SVM
-            feature_importance = np.abs(self.classifier.calibrated_classifiers_[0].base_estimator.coef_).mean(axis=0)
+            calibrated = self.classifier.calibrated_classifiers_[0]
+            # sklearn >= 1.2 renamed base_estimator to estimator
+            base_estimator = getattr(calibrated, 'estimator', None) or calibrated.base_estimator
+            feature_importance = np.abs(base_estimator.coef_).mean(axis=0)
             feature_importance = feature_importance / np.sum(feature_importance)
             
             #    
@@ -66,16 +72,12 @@ class HaplogroupPredictor:
             raise Exception("Model is not trained yet")
             
         try:
-            #     
-            missing_features = [f for f in self.feature_names if f not in X.columns]
-            if missing_features:
-                for feature in missing_features:
-                    X[feature] = 0
-                    
-            X = X[self.feature_names]
+            #     ,    
+            schema = MarkerSchema.for_features(self.feature_names)
+            X = schema.frame(schema.align(X))
                 
             #   
-            X_scaled = self.scaler.transform(X)
+            X_scaled = self.scaler.transform(decode_markers(X))
             
             #     
             probabilities = self.classifier.predict_proba(X_scaled)
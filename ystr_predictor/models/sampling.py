@@ -0,0 +1,89 @@
+# c:\projects\DNA-utils-universal\ystr_predictor\models\sampling.py
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+
+class ReservoirSampler:
+    """Однопроходная случайная выборка строк из потока кусков таблицы
+
+    Каждой строке присваивается случайный ключ, в выборке остаются строки
+    с наименьшими ключами. Результат равен выборке из всей таблицы сразу,
+    а в памяти держатся только текущий кусок и ``sample_size`` строк.
+
+    Со ``stratify=True`` выборка выравнивается по группам (гаплогруппам):
+    каждой группе достается не больше общего порога, а порог выбирается
+    наибольшим, при котором сумма не превышает ``sample_size``. Малые
+    группы попадают в выборку целиком, крупные урезаются до порога.
+    Порог с новыми данными только убывает, поэтому отброшенные строки
+    не могли бы попасть в выборку и при чтении всего файла.
+
+    Строки выборки идут в исходном порядке и сохраняют индекс.
+    """
+
+    def __init__(self, sample_size: int, stratify: bool = False, seed: int = 42):
+        if sample_size <= 0:
+            raise ValueError("sample_size must be positive")
+        self.sample_size = sample_size
+        self.stratify = stratify
+        self.rows_seen = 0
+        self._rng = np.random.default_rng(seed)
+        self._rows: Optional[pd.DataFrame] = None
+        self._keys = np.empty(0)
+        self._groups = np.empty(0, dtype=object)
+
+    @staticmethod
+    def group_cap(counts: np.ndarray, total: int) -> int:
+        """Наибольший порог ``c``, при котором ``sum(min(counts, c)) <= total``"""
+        sorted_counts = np.sort(counts)
+        below = np.r_[0, np.cumsum(sorted_counts)[:-1]]
+        remaining = len(sorted_counts) - np.arange(len(sorted_counts))
+        # Сумма при пороге, равном очередному размеру группы
+        totals = below + sorted_counts * remaining
+        over = np.flatnonzero(totals > total)
+        if over.size == 0:
+            return int(sorted_counts[-1]) if len(sorted_counts) else 0
+        j = over[0]
+        return int((total - below[j]) // remaining[j])
+
+    def add(self, chunk: pd.DataFrame, groups: Optional[pd.Series] = None):
+        """Добавляет кусок; ``groups`` обязательны для стратифицированной выборки"""
+        if self.stratify and groups is None:
+            raise ValueError("Stratified sampling needs group labels")
+        self.rows_seen += len(chunk)
+
+        keys = np.concatenate([self._keys, self._rng.random(len(chunk))])
+        rows = chunk if self._rows is None else pd.concat([self._rows, chunk])
+        if self.stratify:
+            labels = np.concatenate([self._groups, groups.to_numpy(dtype=object)])
+            keep = self._select_stratified(keys, labels)
+            self._groups = labels[keep]
+        else:
+            keep = self._select_uniform(keys)
+
+        self._rows = rows.iloc[keep]
+        self._keys = keys[keep]
+
+    def _select_uniform(self, keys: np.ndarray) -> np.ndarray:
+        if len(keys) <= self.sample_size:
+            return np.arange(len(keys))
+        return np.sort(np.argpartition(keys, self.sample_size - 1)[:self.sample_size])
+
+    def _select_stratified(self, keys: np.ndarray, labels: np.ndarray) -> np.ndarray:
+        codes, _ = pd.factorize(labels, use_na_sentinel=False)
+        counts = np.bincount(codes)
+        cap = self.group_cap(counts, self.sample_size)
+        if cap >= counts.max():
+            return np.arange(len(keys))
+
+        # Ранг строки среди своей группы по возрастанию ключа
+        order = np.lexsort((keys, codes))
+        group_starts = np.r_[0, np.cumsum(counts)[:-1]]
+        rank = np.arange(len(order)) - group_starts[codes[order]]
+        return np.sort(order[rank < cap])
+
+    def sample(self) -> pd.DataFrame:
+        if self._rows is None:
+            raise ValueError("No rows were added")
+        return self._rows
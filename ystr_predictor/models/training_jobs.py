@@ -0,0 +1,466 @@
+# c:\projects\DNA-utils-universal\ystr_predictor\models\training_jobs.py
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import signal
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import pandas as pd
+
+from models.tree_artifact import TreeArtifact, process_alive
+
+try:
+    import fcntl
+except ImportError:  # Windows: лимит задач соблюдается только внутри процесса
+    fcntl = None
+
+ACTIVE_STATUSES = ("queued", "resolving_paths", "training", "training_tiers", "updating")
+# Сколько задача может оставаться "queued" без pid, пока рабочий процесс получает данные
+QUEUED_TIMEOUT = 300
+
+
+# Файл в каталоге задачи: отмену запросили, итог задачи - "cancelled"
+CANCEL_MARKER = "cancel"
+# Сколько завершенных задач (с артефактом, снимком набора и архивом) хранить на диске
+MAX_FINISHED_JOBS = 10
+
+
+def _write_status(job_dir: Path, status: Dict):
+    """Атомарно записывает status.json задачи
+
+    После отмены записывается только статус "cancelled": последний отчет
+    остановленного воркера и итог "failed" от наблюдателя его не затирают.
+    """
+    if status["status"] != "cancelled" and (job_dir / CANCEL_MARKER).exists():
+        return
+    # Пишут воркер, наблюдатель и cancel из разных процессов: у каждого свой временный файл
+    tmp_path = job_dir / f"status.json.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(status, f)
+    os.replace(tmp_path, job_dir / "status.json")
+
+
+def _start_process_group():
+    """Делает рабочий процесс задачи лидером своей группы процессов
+
+    Воркеры пула обучения узлов попадают в ту же группу, и ``cancel``
+    останавливает их вместе с задачей (см. ``_stop_job``).
+    """
+    if hasattr(os, "setsid"):
+        os.setsid()
+
+
+def _stop_job(pid: int, process: Optional[multiprocessing.Process] = None):
+    """Останавливает задачу ``pid`` со всеми процессами ее группы
+
+    Пока рабочий процесс не стал лидером группы (группы ``pid`` нет),
+    пула у него тоже нет, и достаточно остановить сам процесс.
+    """
+    if hasattr(os, "killpg"):
+        try:
+            os.killpg(pid, signal.SIGTERM)
+            return
+        except ProcessLookupError:
+            pass
+        except PermissionError:
+            return
+    if process is not None:
+        process.terminate()
+        return
+    try:
+        os.kill(pid, signal.SIGTERM)
+    except OSError:
+        pass
+
+
+def _snapshot_artifact(path: str, job_dir: Path) -> Path:
+    """Снимок артефакта ``path`` в каталоге задачи для чтения во время обучения
+
+    Файлы связываются жесткими ссылками (копируются, если нельзя), поэтому
+    снимок остается целым, даже если рабочую версию за время обучения
+    заменят и удалят.
+    """
+    def link(source, target):
+        try:
+            os.link(source, target)
+        except OSError:
+            shutil.copy2(source, target)
+
+    snapshot = job_dir / "previous_model"
+    shutil.copytree(Path(path).resolve(), snapshot, copy_function=link,
+                    ignore=shutil.ignore_patterns(TreeArtifact.LEASES))
+    return snapshot
+
+
+def _run_training_job(job_dir: str, X: pd.DataFrame, y: pd.Series,
+                      haplo_api_url: str, status: Dict, panel_tiers: bool = True,
+                      deduplicate_samples: bool = True, stats=None,
+                      train_workers: int = 1, train_memory_bytes: Optional[int] = None,
+                      path_resolver=None, model_path: Optional[str] = None,
+                      incremental: bool = False):
+    """Точка входа рабочего процесса: обучает дерево (и деревья панелей) и сохраняет артефакт
+
+    ``model_path`` - каталог рабочей модели. С ``incremental`` дерево не
+    обучается заново: модель загружается и дообучается образцами X
+    (``update``). Иначе узлы, данные которых не изменились, берут модели
+    из рабочего артефакта.
+    """
+    from models.dataset_stats import DatasetStats
+    from models.deduplication import compression_stats, deduplicate
+    from models.tree_predictor import TreeHaploPredictor
+
+    _start_process_group()
+    logging.basicConfig(level=logging.INFO)
+    job_dir = Path(job_dir)
+
+    # Обучение не должно отнимать процессор у обслуживания запросов
+    if hasattr(os, "nice"):
+        os.nice(10)
+
+    status.update(status="resolving_paths", pid=os.getpid(), started_at=time.time())
+    _write_status(job_dir, status)
+    # Отмену могли запросить, пока pid еще не был записан
+    if (job_dir / CANCEL_MARKER).exists():
+        return
+
+    def on_progress(nodes_trained: int, nodes_total: int):
+        status.update(status="training", nodes_trained=nodes_trained, nodes_total=nodes_total)
+        _write_status(job_dir, status)
+
+    try:
+        # Статистика исходных строк (до дедупликации); обычно собрана при разборе CSV
+        if stats is None:
+            stats = DatasetStats.from_frame(X, y)
+        weights = None
+        if deduplicate_samples:
+            # Одинаковые образцы обучаются один раз с весом - числом повторов
+            X, y, weights = deduplicate(X, y)
+            compression = compression_stats(weights)
+            logging.info(f"Deduplicated {compression['rows']} samples to {compression['unique_rows']} "
+                         f"(x{compression['compression_ratio']:.2f})")
+            status.update(unique_samples=compression["unique_rows"])
+
+        predictor = TreeHaploPredictor(haplo_api_url=haplo_api_url)
+        predictor.path_resolver = path_resolver
+        predictor.train_workers = train_workers
+        predictor.train_memory_bytes = train_memory_bytes
+        # Общая матрица маркеров для пула - в каталоге задачи, а не в /tmp
+        predictor.train_work_dir = str(job_dir)
+        previous = None
+        if model_path is not None and not incremental and TreeArtifact.exists(f"{model_path}tree_model"):
+            try:
+                # Модели узлов читаются и при обучении панелей, много позже начала задачи
+                previous = TreeArtifact(_snapshot_artifact(f"{model_path}tree_model", job_dir))
+            except (OSError, ValueError, KeyError) as e:
+                logging.warning(f"Not reusing node models of {model_path}: {str(e)}")
+        if incremental:
+            status.update(status="updating")
+            _write_status(job_dir, status)
+            predictor.load_model(model_path)
+            # Модели узлов читаем сразу: рабочий каталог могут заменить во время задачи
+            predictor.materialize(estimators=True)
+            base_stats = predictor.dataset_stats
+            predictor.dataset_stats = base_stats.merge(stats) if base_stats is not None else stats
+            report = asyncio.run(predictor.update(X, y, sample_weight=weights))
+            status.update(update=report, tiers=list(predictor.tiers))
+        else:
+            predictor.dataset_stats = stats
+            asyncio.run(predictor.train(X, y, progress_callback=on_progress, sample_weight=weights,
+                                        previous=previous))
+        if panel_tiers and not incremental:
+            status.update(status="training_tiers")
+            _write_status(job_dir, status)
+            asyncio.run(predictor.train_tiers(X, y, sample_weight=weights, previous=previous))
+            status.update(tiers=list(predictor.tiers))
+        if not incremental:
+            status.update(retrain=predictor.retraining_summary())
+        predictor.save_model(f"{job_dir}/")
+        status.update(status="completed", finished_at=time.time())
+    except Exception as e:
+        logging.error(f"Training job failed: {str(e)}")
+        status.update(status="failed", error=str(e), finished_at=time.time())
+    shutil.rmtree(job_dir / "previous_model", ignore_errors=True)
+    _write_status(job_dir, status)
+
+
+class TrainingJobManager:
+    """Запускает обучение TreeHaploPredictor в отдельных процессах
+
+    Состояние каждой задачи хранится в ``<jobs_dir>/<job_id>/status.json``,
+    поэтому прогресс можно читать из любого процесса сервера. Обучение идет
+    вне event loop, и обработка запросов на предсказание не блокируется.
+    """
+
+    def __init__(self, jobs_dir: str = "models/saved/jobs/",
+                 haplo_api_url: str = "http://localhost:9003/api",
+                 on_success: Optional[Callable[[str, Path], None]] = None,
+                 max_active_jobs: int = 1, panel_tiers: bool = True,
+                 deduplicate_samples: bool = True, train_workers: int = 1,
+                 train_memory_bytes: Optional[int] = None, path_resolver=None,
+                 model_path: str = "models/saved/", reuse_nodes: bool = True,
+                 max_finished_jobs: int = MAX_FINISHED_JOBS):
+        self.jobs_dir = Path(jobs_dir)
+        self.jobs_dir.mkdir(parents=True, exist_ok=True)
+        self.haplo_api_url = haplo_api_url
+        self.on_success = on_success
+        self.max_active_jobs = max_active_jobs
+        # Обучать ли уменьшенные деревья для панелей Y12/Y25/...
+        self.panel_tiers = panel_tiers
+        # Схлопывать ли одинаковые образцы в один с весом
+        self.deduplicate_samples = deduplicate_samples
+        # Процессов для обучения узлов дерева и бюджет их памяти
+        self.train_workers = train_workers
+        self.train_memory_bytes = train_memory_bytes
+        # HaploPathResolver с дисковым кэшем путей; None - без кэша, по haplo_api_url
+        self.path_resolver = path_resolver
+        # Рабочая модель, которую дообучают задачи с incremental=True
+        self.model_path = model_path
+        # Брать ли из рабочей модели леса узлов, данные которых не изменились
+        self.reuse_nodes = reuse_nodes
+        # Каталоги завершенных задач сверх лимита удаляются, начиная с самых давних
+        self.max_finished_jobs = max_finished_jobs
+        self._processes: Dict[str, multiprocessing.Process] = {}
+        self._lock = threading.Lock()
+        # spawn безопаснее fork для процесса с потоками uvicorn
+        self._context = multiprocessing.get_context("spawn")
+
+    def _job_dir(self, job_id: str) -> Path:
+        job_dir = self.jobs_dir / job_id
+        if not (job_dir / "status.json").exists():
+            raise KeyError(f"Unknown training job: {job_id}")
+        return job_dir
+
+    def _read_status(self, job_id: str) -> Dict:
+        with open(self._job_dir(job_id) / "status.json", encoding="utf-8") as f:
+            return json.load(f)
+
+    @contextmanager
+    def _submit_lock(self):
+        """Блокировка проверки лимита и создания задачи для всех процессов сервера"""
+        with self._lock, open(self.jobs_dir / ".submit.lock", "a") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _active_jobs(self) -> List[str]:
+        """Задачи в работе по status.json, кем бы из воркеров они ни были запущены
+
+        Задача, процесс которой исчез, не записав итог (например, сервер
+        остановили), в лимит не входит.
+        """
+        active = []
+        now = time.time()
+        for job_dir in self.jobs_dir.iterdir():
+            try:
+                with open(job_dir / "status.json", encoding="utf-8") as f:
+                    status = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if status["status"] not in ACTIVE_STATUSES:
+                continue
+            if status.get("pid") is not None:
+                running = process_alive(status["pid"])
+            else:
+                running = now - status["created_at"] < QUEUED_TIMEOUT
+            if running:
+                active.append(status["job_id"])
+        return active
+
+    def submit(self, X: pd.DataFrame, y: pd.Series, stats=None, incremental: bool = False) -> str:
+        """Ставит обучение в работу и возвращает идентификатор задачи
+
+        ``stats`` - ``DatasetStats`` набора, если он уже собран при загрузке;
+        иначе рабочий процесс посчитает его сам. С ``incremental=True``
+        рабочая модель дообучается только образцами X.
+        """
+        if incremental and not TreeArtifact.exists(f"{self.model_path}tree_model"):
+            raise RuntimeError("No trained model to update")
+        with self._submit_lock():
+            active = self._active_jobs()
+            if len(active) >= self.max_active_jobs:
+                raise RuntimeError(f"Training already in progress: {', '.join(active)}")
+
+            job_id = uuid.uuid4().hex
+            job_dir = self.jobs_dir / job_id
+            job_dir.mkdir(parents=True)
+
+            status = {
+                "job_id": job_id,
+                "status": "queued",
+                "samples": len(X),
+                "unique_samples": None,
+                "haplogroups": int(y.nunique()),
+                "markers": len(X.columns),
+                "incremental": incremental,
+                "nodes_trained": 0,
+                "nodes_total": None,
+                "tiers": [],
+                "created_at": time.time(),
+                "started_at": None,
+                "finished_at": None,
+                "error": None,
+                "pid": None,
+            }
+            _write_status(job_dir, status)
+
+            process = self._context.Process(
+                target=_run_training_job,
+                args=(str(job_dir), X, y, self.haplo_api_url, status,
+                      self.panel_tiers, self.deduplicate_samples, stats,
+                      self.train_workers, self.train_memory_bytes, self.path_resolver,
+                      self.model_path if incremental or self.reuse_nodes else None, incremental),
+                name=f"training-{job_id}"
+            )
+            process.start()
+            self._processes[job_id] = process
+
+        threading.Thread(
+            target=self._watch, args=(job_id, process), daemon=True
+        ).start()
+
+        logging.info(f"Started training job {job_id} (pid {process.pid})")
+        return job_id
+
+    def _watch(self, job_id: str, process: multiprocessing.Process):
+        """Ждет завершения процесса и фиксирует итог задачи"""
+        process.join()
+        job_dir = self.jobs_dir / job_id
+        status = self._read_status(job_id)
+
+        # Итог отмененной задачи пишет cancel, ее артефакт не публикуется
+        cancelled = (job_dir / CANCEL_MARKER).exists()
+        if status["status"] in ACTIVE_STATUSES and not cancelled:
+            # Процесс умер, не успев записать итог
+            status.update(
+                status="failed",
+                error=f"Worker exited with code {process.exitcode}",
+                finished_at=time.time()
+            )
+            _write_status(job_dir, status)
+
+        with self._lock:
+            self._processes.pop(job_id, None)
+
+        if status["status"] == "completed" and not cancelled and self.on_success:
+            try:
+                self.on_success(job_id, self.artifact_path(job_id))
+            except Exception as e:
+                logging.error(f"Error publishing artifact of job {job_id}: {str(e)}")
+        self.prune()
+
+    def get(self, job_id: str) -> Dict:
+        """Возвращает состояние задачи с прошедшим временем и оценкой ETA"""
+        status = self._read_status(job_id)
+
+        elapsed = None
+        eta = None
+        if status["started_at"]:
+            end = status["finished_at"] or time.time()
+            elapsed = end - status["started_at"]
+            trained = status["nodes_trained"]
+            total = status["nodes_total"]
+            if status["status"] == "training" and trained and total:
+                eta = elapsed / trained * (total - trained)
+
+        status.pop("pid", None)
+        status["elapsed_seconds"] = elapsed
+        status["eta_seconds"] = eta
+        return status
+
+    def list(self) -> List[Dict]:
+        jobs = []
+        for job_dir in self.jobs_dir.iterdir():
+            if (job_dir / "status.json").exists():
+                jobs.append(self.get(job_dir.name))
+        return sorted(jobs, key=lambda job: job["created_at"], reverse=True)
+
+    def cancel(self, job_id: str) -> Dict:
+        """Останавливает рабочий процесс задачи вместе с пулом обучения узлов"""
+        status = self._read_status(job_id)
+        if status["status"] not in ACTIVE_STATUSES:
+            return self.get(job_id)
+
+        # Сначала метка: с ней воркер и наблюдатель больше не меняют статус,
+        # а еще не начавший работу воркер сразу выходит
+        (self._job_dir(job_id) / CANCEL_MARKER).touch()
+        status = self._read_status(job_id)
+        with self._lock:
+            process = self._processes.get(job_id)
+        if process is not None:
+            _stop_job(process.pid, process)
+            process.join(timeout=10)
+        elif status.get("pid"):
+            # Задача запущена другим процессом сервера
+            _stop_job(status["pid"])
+
+        status = self._read_status(job_id)
+        status.update(status="cancelled", finished_at=time.time())
+        _write_status(self._job_dir(job_id), status)
+        logging.info(f"Cancelled training job {job_id}")
+        result = self.get(job_id)
+        self.prune()
+        return result
+
+    def artifact_path(self, job_id: str) -> Path:
+        """Каталог сохраненной модели завершенной задачи"""
+        status = self._read_status(job_id)
+        if status["status"] != "completed":
+            raise FileNotFoundError(f"Training job {job_id} has no artifact ({status['status']})")
+        return self._job_dir(job_id) / "tree_model"
+
+    def artifact_archive(self, job_id: str) -> Path:
+        """Zip-архив артефакта завершенной задачи; собирается один раз
+
+        Архив пишется под временным именем и переносится на место
+        ``os.replace``: параллельный запрос видит либо готовый архив, либо
+        никакого и собирает свой, но не читает недописанный.
+        """
+        artifact = self.artifact_path(job_id)
+        archive = artifact.with_suffix(".zip")
+        if not archive.exists():
+            tmp_base = artifact.parent / f"{artifact.name}.{os.getpid()}.{threading.get_ident()}.tmp"
+            tmp_archive = Path(shutil.make_archive(str(tmp_base), "zip", root_dir=artifact))
+            os.replace(tmp_archive, archive)
+        return archive
+
+    def prune(self) -> List[str]:
+        """Удаляет каталоги завершенных задач сверх ``max_finished_jobs``, самые давние первыми
+
+        Задачи в работе и задачи, процесс которых еще жив, не трогаются.
+        """
+        finished = []
+        for job_dir in self.jobs_dir.iterdir():
+            try:
+                with open(job_dir / "status.json", encoding="utf-8") as f:
+                    status = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if status["status"] in ACTIVE_STATUSES:
+                continue
+            with self._lock:
+                if status["job_id"] in self._processes:
+                    continue
+            if status.get("pid") is not None and process_alive(status["pid"]):
+                continue
+            finished.append(status)
+
+        finished.sort(key=lambda status: status["created_at"], reverse=True)
+        removed = []
+        for status in finished[self.max_finished_jobs:]:
+            shutil.rmtree(self.jobs_dir / status["job_id"], ignore_errors=True)
+            removed.append(status["job_id"])
+        if removed:
+            logging.info(f"Removed {len(removed)} finished training jobs")
+        return removed
@@ -0,0 +1,414 @@
+# c:\projects\DNA-utils-universal\ystr_predictor\models\tree_artifact.py
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+import weakref
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import joblib
+import numpy as np
+
+from models.compiled_forest import CompiledForest
+
+FORMAT_VERSION = 1
+
+
+def process_alive(pid: int) -> bool:
+    """Жив ли процесс ``pid`` (на Windows проверки нет - считается живым)"""
+    if os.name != "posix":
+        # os.kill(pid, 0) на Windows завершает процесс
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _release_lease(lease: Path):
+    try:
+        lease.unlink(missing_ok=True)
+    except OSError:
+        pass
+
+
+class TreeArtifact:
+    """Каталог сохраненного дерева TreeHaploPredictor
+
+    Структура::
+
+        manifest.json        узлы дерева, смещения их массивов, версия
+        <array>.npy          массивы CompiledForest всех узлов подряд
+        estimators/<i>.joblib  исходные RandomForest и StandardScaler узла
+        tiers/<panel>/       уменьшенные деревья для панелей FTDNA (тот же формат)
+        dataset_stats.json   статистика обучающего набора (эталон для дрейфа, в версию не входит)
+
+    Большие числовые массивы открываются через ``np.load(mmap_mode='r')``,
+    поэтому воркеры делят их через page cache, а не держат свои копии.
+    Лес узла собирается из срезов по первому обращению, sklearn-модели
+    узла читаются с диска только когда понадобятся.
+
+    Каждая версия сохраняется в свой каталог ``<name>-<version>``, а
+    ``<name>`` - символическая ссылка на текущую. Открытый артефакт
+    запоминает каталог своей версии, поэтому после замены модели
+    сняты с публикации версии и воркеры, еще не заметившие новую,
+    дочитывают модели узлов из своих файлов, а не из чужой версии с
+    другой нумерацией узлов. Кроме текущей хранятся ``KEEP_PREVIOUS``
+    последних версий; более старые удаляются, только когда их не держит
+    ни один живой процесс. Открытый артефакт кладет в каталог версии
+    файл-аренду ``.leases/<pid>-<id>`` и убирает его, когда объект
+    собирается сборщиком мусора (или при ``close``).
+    """
+
+    MANIFEST = "manifest.json"
+    STATS = "dataset_stats.json"
+    KEEP_PREVIOUS = 2
+    LEASES = ".leases"
+
+    def __init__(self, path: str, mmap: bool = True, lease_root: Optional[Path] = None):
+        # Ссылку раскрываем сразу: дальше все файлы читаются из каталога этой версии
+        self.path = Path(path).resolve()
+        # Аренда берется на каталог версии; у панелей это каталог основного дерева
+        self._lease_root = lease_root or self.path
+        self._lease = self._acquire_lease()
+        with open(self.path / self.MANIFEST, encoding="utf-8") as f:
+            manifest = json.load(f)
+
+        if manifest["format_version"] != FORMAT_VERSION:
+            raise ValueError(f"Unsupported tree artifact format: {manifest['format_version']}")
+
+        self.mmap = mmap
+        self.version = manifest["version"]
+        self.feature_names = manifest["feature_names"]
+        self.nodes = manifest["nodes"]
+        # Панель -> {"version", "feature_names"}; в артефактах без панелей пусто
+        self.tiers: Dict[str, Dict] = manifest.get("tiers", {})
+        self.arrays = {
+            name: np.load(self.path / f"{name}.npy", mmap_mode="r" if mmap else None)
+            for name in CompiledForest.ARRAY_NAMES
+        }
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop("_lease", None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lease = self._acquire_lease()
+
+    def _acquire_lease(self) -> Optional[weakref.finalize]:
+        """Файл-аренда версии: пока он есть, ``_prune`` не удаляет каталог
+
+        Модели узлов (``estimators``) читаются с диска лениво, поэтому
+        открытому артефакту нужны файлы его версии, а не только mmap.
+        """
+        lease = self._lease_root / self.LEASES / f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        try:
+            lease.parent.mkdir(exist_ok=True)
+            lease.touch()
+        except OSError as e:
+            logging.warning(f"Cannot lease tree artifact {self._lease_root}: {str(e)}")
+            return None
+        return weakref.finalize(self, _release_lease, lease)
+
+    def close(self):
+        """Отпускает аренду версии (модели узлов больше не будут читаться)"""
+        if self._lease is not None:
+            self._lease()
+
+    @classmethod
+    def _leased(cls, path: Path) -> bool:
+        """Держит ли каталог версии живой процесс; аренды умерших процессов удаляются"""
+        leased = False
+        for lease in (path / cls.LEASES).glob("*"):
+            pid = lease.name.split("-", 1)[0]
+            if pid.isdigit() and not process_alive(int(pid)):
+                lease.unlink(missing_ok=True)
+            else:
+                leased = True
+        return leased
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return (Path(path) / TreeArtifact.MANIFEST).exists()
+
+    @classmethod
+    def read_version(cls, path: str) -> Optional[str]:
+        """Версия артефакта по манифесту, без чтения массивов"""
+        try:
+            with open(Path(path) / cls.MANIFEST, encoding="utf-8") as f:
+                return json.load(f)["version"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def build_tree(self, node_factory: Callable[[str, Optional[object]], object]):
+        """Восстанавливает скелет дерева без загрузки моделей узлов"""
+        built = []
+        for index, entry in enumerate(self.nodes):
+            parent = built[entry["parent"]] if entry["parent"] >= 0 else None
+            node = node_factory(entry["name"], parent)
+            if parent is not None:
+                parent.children[entry["name"]] = node
+            if entry["forest"] is not None:
+                node.artifact_index = index
+                node.n_samples = entry["forest"].get("samples")
+                node.fingerprint = entry["forest"].get("fingerprint")
+                node.fit_seconds = entry["forest"].get("fit_seconds")
+            built.append(node)
+        return built[0]
+
+    def node_paths(self) -> Dict[Tuple[str, ...], int]:
+        """Номера узлов с лесом по пути имен от корня (включая корень)"""
+        paths: List[Tuple[str, ...]] = []
+        for entry in self.nodes:
+            parent = paths[entry["parent"]] if entry["parent"] >= 0 else ()
+            paths.append(parent + (entry["name"],))
+        return {path: index for index, path in enumerate(paths) if self.nodes[index]["forest"] is not None}
+
+    def compiled(self, index: int) -> CompiledForest:
+        """Скомпилированный лес узла как набор срезов общих массивов"""
+        forest = self.nodes[index]["forest"]
+        nodes = slice(*forest["nodes"])
+        n_features = len(self.feature_names)
+        arrays = {
+            "feature": self.arrays["feature"][nodes],
+            "threshold": self.arrays["threshold"][nodes],
+            "children": self.arrays["children"][2 * nodes.start:2 * nodes.stop],
+            "is_leaf": self.arrays["is_leaf"][nodes],
+            "missing_left": self.arrays["missing_left"][nodes],
+            "leaf_proba": self.arrays["leaf_proba"][slice(*forest["leaf_proba"])].reshape(
+                -1, len(forest["classes"])
+            ),
+            "roots": self.arrays["roots"][slice(*forest["roots"])],
+            "mean": self.arrays["mean"][forest["features"] * n_features:(forest["features"] + 1) * n_features],
+            "scale": self.arrays["scale"][forest["features"] * n_features:(forest["features"] + 1) * n_features],
+        }
+        return CompiledForest(
+            arrays,
+            np.asarray(forest["classes"]),
+            tuple(self.feature_names) or None,
+            forest["max_depth"]
+        )
+
+    def estimators(self, index: int) -> Tuple[object, object]:
+        """Читает RandomForest и StandardScaler узла"""
+        return joblib.load(self.path / "estimators" / f"{index}.joblib")
+
+    def read_stats(self) -> Optional[Dict]:
+        """Статистика обучающего набора или None, если артефакт сохранен без нее"""
+        try:
+            with open(self.path / self.STATS, encoding="utf-8") as f:
+                return json.load(f)
+        except OSError:
+            return None
+
+    def tier(self, name: str) -> 'TreeArtifact':
+        """Артефакт дерева панели ``name``"""
+        if name not in self.tiers:
+            raise KeyError(f"Unknown panel tier: {name}")
+        return TreeArtifact(self.path / "tiers" / name, mmap=self.mmap, lease_root=self._lease_root)
+
+    @classmethod
+    def save(cls, root, path: str, tiers: Optional[Dict[str, object]] = None,
+             stats: Optional[Dict] = None) -> str:
+        """Сохраняет дерево в каталог и возвращает версию артефакта
+
+        ``tiers`` - корни деревьев панелей; они пишутся в ``tiers/<panel>/``
+        того же каталога и входят в его версию, поэтому заменяются вместе с ним.
+        ``stats`` - статистика обучающего набора (``DatasetStats.to_dict``).
+        """
+        path = Path(path)
+        tmp_path = path.parent / f".{path.name}.tmp-{uuid.uuid4().hex[:8]}"
+
+        tier_entries = {}
+        for name, tier_root in (tiers or {}).items():
+            tier_manifest = cls._write(tier_root, tmp_path / "tiers" / name)
+            tier_entries[name] = {
+                "version": tier_manifest["version"],
+                "feature_names": tier_manifest["feature_names"],
+            }
+
+        manifest = cls._write(root, tmp_path, tier_entries)
+        if stats is not None:
+            with open(tmp_path / cls.STATS, "w", encoding="utf-8") as f:
+                json.dump(stats, f)
+        cls._swap_into_place(tmp_path, path)
+        return manifest["version"]
+
+    @classmethod
+    def _write(cls, root, tmp_path: Path, tiers: Optional[Dict[str, Dict]] = None) -> Dict:
+        """Пишет дерево в каталог и возвращает его манифест"""
+        (tmp_path / "estimators").mkdir(parents=True)
+
+        nodes: List[Dict] = []
+        chunks: Dict[str, List[np.ndarray]] = {name: [] for name in CompiledForest.ARRAY_NAMES}
+        sizes = {name: 0 for name in CompiledForest.ARRAY_NAMES}
+        feature_names = None
+        forests = 0
+
+        def append(name: str, array: np.ndarray) -> List[int]:
+            chunks[name].append(np.ravel(array))
+            start = sizes[name]
+            sizes[name] += np.size(array)
+            return [start, sizes[name]]
+
+        def visit(node, parent_index: int):
+            nonlocal feature_names, forests
+            index = len(nodes)
+            entry = {"name": node.name, "parent": parent_index, "forest": None}
+            nodes.append(entry)
+
+            model = getattr(node, "model", None)
+            if model is not None:
+                compiled = node.compiled or CompiledForest.from_sklearn(model, node.scaler)
+                if feature_names is None:
+                    feature_names = list(compiled.feature_names or [])
+                node_range = append("feature", compiled.feature)
+                append("threshold", compiled.threshold)
+                append("children", compiled.children)
+                append("is_leaf", compiled.is_leaf)
+                append("missing_left", compiled.missing_left)
+                entry["forest"] = {
+                    "nodes": node_range,
+                    "leaf_proba": append("leaf_proba", compiled.leaf_proba),
+                    "roots": append("roots", compiled.roots),
+                    "features": forests,
+                    "classes": [str(c) for c in compiled.classes],
+                    "max_depth": int(compiled.max_depth),
+                }
+                if getattr(node, "n_samples", None) is not None:
+                    entry["forest"]["samples"] = float(node.n_samples)
+                # Отпечаток данных и время обучения узла - для частичного переобучения
+                if getattr(node, "fingerprint", None) is not None:
+                    entry["forest"]["fingerprint"] = node.fingerprint
+                if getattr(node, "fit_seconds", None) is not None:
+                    entry["forest"]["fit_seconds"] = float(node.fit_seconds)
+                append("mean", compiled.mean)
+                append("scale", compiled.scale)
+                forests += 1
+                joblib.dump((model, node.scaler), tmp_path / "estimators" / f"{index}.joblib")
+
+            for child in node.children.values():
+                visit(child, index)
+
+        visit(root, -1)
+
+        digest = hashlib.sha256()
+        empty = {
+            "feature": np.int32, "threshold": np.float64, "children": np.int32,
+            "is_leaf": bool, "missing_left": bool, "leaf_proba": np.float64,
+            "roots": np.int32, "mean": np.float64, "scale": np.float64,
+        }
+        for name in CompiledForest.ARRAY_NAMES:
+            if chunks[name]:
+                array = np.concatenate(chunks[name])
+            else:
+                array = np.empty(0, dtype=empty[name])
+            np.save(tmp_path / f"{name}.npy", array)
+            digest.update(array.tobytes())
+
+        manifest = {
+            "format_version": FORMAT_VERSION,
+            "feature_names": feature_names or [],
+            "nodes": nodes,
+            "saved_at": time.time(),
+        }
+        # Время обучения в версию не входит: одинаковые модели - одна версия
+        versioned = [
+            {**entry, "forest": {key: value for key, value in entry["forest"].items() if key != "fit_seconds"}}
+            if entry["forest"] is not None else entry
+            for entry in nodes
+        ]
+        digest.update(json.dumps(versioned, sort_keys=True).encode("utf-8"))
+        if tiers:
+            manifest["tiers"] = tiers
+            digest.update(json.dumps(tiers, sort_keys=True).encode("utf-8"))
+        manifest["version"] = digest.hexdigest()[:12]
+        with open(tmp_path / cls.MANIFEST, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        return manifest
+
+    @classmethod
+    def install(cls, source: str, path: str):
+        """Копирует готовый артефакт (например, из задачи обучения) на место рабочего"""
+        path = Path(path)
+        tmp_path = path.parent / f".{path.name}.tmp-{uuid.uuid4().hex[:8]}"
+        shutil.copytree(source, tmp_path, ignore=shutil.ignore_patterns(cls.LEASES))
+        cls._swap_into_place(tmp_path, path)
+
+    @classmethod
+    def _swap_into_place(cls, tmp_path: Path, path: Path):
+        """Переносит готовый каталог в ``<name>-<version>`` и переключает на него ссылку ``path``"""
+        version = cls.read_version(tmp_path)
+        target = path.parent / f"{path.name}-{version}"
+        if target.exists():
+            # Такая версия уже сохранена: одинаковые модели - одна версия
+            shutil.rmtree(tmp_path)
+        else:
+            tmp_path.rename(target)
+        # Время публикации версии - по нему выбираются хранимые прежние версии
+        os.utime(target)
+
+        link = path.parent / f".{path.name}.link-{uuid.uuid4().hex[:8]}"
+        try:
+            os.symlink(target.name, link, target_is_directory=True)
+        except OSError as e:
+            # Нет прав на символические ссылки (Windows без режима разработчика)
+            logging.warning(f"Cannot link {path} to {target.name} ({str(e)}), replacing the directory")
+            cls._replace_directory(target, path)
+            return
+        if path.exists() and not path.is_symlink():
+            # Каталог без версии (прежняя раскладка): убираем его в версионный
+            legacy = path.parent / f"{path.name}-{cls.read_version(path) or uuid.uuid4().hex[:12]}"
+            if legacy.exists():
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                path.rename(legacy)
+        # Замена ссылки атомарна: читатель видит либо старую версию, либо новую
+        os.replace(link, path)
+        logging.info(f"Tree artifact {version} written to {target}")
+        cls._prune(path, target)
+
+    @classmethod
+    def _prune(cls, path: Path, current: Path):
+        """Удаляет версии старше ``KEEP_PREVIOUS`` последних прежних"""
+        previous = sorted(
+            (
+                candidate for candidate in path.parent.glob(f"{path.name}-*")
+                if candidate != current and candidate.is_dir() and not candidate.is_symlink()
+                and (candidate / cls.MANIFEST).exists()
+            ),
+            key=lambda candidate: candidate.stat().st_mtime,
+            reverse=True
+        )
+        for old_path in previous[cls.KEEP_PREVIOUS:]:
+            # Модели узлов открытых артефактов читаются с диска лениво
+            # (``estimators``), поэтому удаляются только версии без аренды;
+            # остальные - при одной из следующих публикаций
+            if cls._leased(old_path):
+                logging.info(f"Keeping {old_path.name}: still used by a running process")
+                continue
+            shutil.rmtree(old_path, ignore_errors=True)
+
+    @staticmethod
+    def _replace_directory(tmp_path: Path, path: Path):
+        # Старые файлы могут быть открыты через mmap у обслуживаемой версии:
+        # каталог переименовываем, а удаляем после того, как новый встал на место
+        old_path = None
+        if path.is_symlink():
+            path.unlink()
+        elif path.exists():
+            old_path = path.parent / f".{path.name}.old-{uuid.uuid4().hex[:8]}"
+            path.rename(old_path)
+        tmp_path.rename(path)
+        if old_path is not None:
+            shutil.rmtree(old_path, ignore_errors=True)
+        logging.info(f"Tree artifact written to {path}")
@@ -1,13 +1,33 @@
 # c:\projects\DNA-utils-universal\ystr_predictor\models\tree_predictor.py
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.preprocessing import StandardScaler
 import numpy as np
 import pandas as pd
-from typing import List, Dict, Set
+from typing import Any, List, Dict, Mapping, Sequence, Set, Callable, Optional, Tuple
 from dataclasses import dataclass
 import logging
-import httpx
-import asyncio
+import time
+from models.compiled_forest import CompiledForest
+from models.dataset_stats import DatasetStats
+from models.haplo_paths import HaploPathResolver
+from models.marker_dtypes import compact_frame, marker_scales, marker_values, with_scales
+from models.marker_schema import PANEL_TIERS, MarkerSchema
+from models.metrics import REGISTRY
+from models.node_index import NodeIndex
+from models.node_training import NodeTrainer, update_node
+from models.tree_artifact import TreeArtifact
+
+LEVEL_SECONDS = REGISTRY.histogram(
+    "ystr_predict_level_seconds",
+    "Time of one level of the batched tree descent (tier: full or panel tree)", ("tier", "level")
+)
+NODE_SECONDS = REGISTRY.histogram(
+    "ystr_predict_node_seconds",
+    "Time of one HaploNode model call (tier: full or panel tree; engine: compiled or sklearn)",
+    ("tier", "node", "engine")
+)
+PANEL_SAMPLES = REGISTRY.counter(
+    "ystr_predict_panel_samples_total",
+    "Samples routed to a panel tier model (full: the model on all markers)", ("panel",)
+)
 
 @dataclass
 class HaploNode:
@@ -16,109 +36,116 @@ class HaploNode:
     parent: 'HaploNode' = None
     model = None
     scaler = None
+    compiled = None
+    # Номер узла в каталоге артефакта, если модель еще не прочитана с диска
+    artifact_index = None
+    # Вес строк, на которых обучен лес узла (для дообучения, см. update)
+    n_samples = None
+    # Отпечаток данных узла и время его обучения (см. models.node_fingerprint)
+    fingerprint = None
+    fit_seconds = None
     
     def __post_init__(self):
         if self.children is None:
             self.children = {}
 
+    def __getstate__(self):
+        # Скомпилированный лес не сохраняем: он строится из model при загрузке
+        state = self.__dict__.copy()
+        state.pop('compiled', None)
+        return state
+
 class TreeHaploPredictor:
     def __init__(self, haplo_api_url: str = "http://localhost:9003/api"):
         self.haplo_api_url = haplo_api_url
+        # Общий клиент сервиса путей с дисковым кэшем (None - без кэша, по haplo_api_url)
+        self.path_resolver: Optional[HaploPathResolver] = None
         self.root = HaploNode(name="ROOT")
         self.is_trained = False
-        self.batch_size = 1000  # Размер батча для обучения
+        self.version = None
+        self._artifact: Optional[TreeArtifact] = None
+        self.batch_size = 1000  # Размер пакета строк при дообучении (update)
+        self.n_estimators = 100  # Деревьев в лесу узла
+        # Во сколько раз лес узла может вырасти от дообучений (update)
+        self.max_tree_growth = 3
+        # Процессов для обучения узлов и бюджет их памяти (None - без ограничения)
+        self.train_workers = 1
+        self.train_memory_bytes: Optional[int] = None
+        self.train_work_dir: Optional[str] = None
+        # Уменьшенные деревья для панелей FTDNA (см. train_tiers)
+        self.tiers: Dict[str, 'TreeHaploPredictor'] = {}
+        # Имя дерева в метриках: "full" или панель (у деревьев из tiers)
+        self.tier_name = "full"
+        self._tier_positions: Optional[List[Tuple[str, np.ndarray]]] = None
+        self.route_panels = True
+        self.min_tier_estimators = 20
+        # Пути гаплогрупп последнего обучения, переиспользуются деревьями панелей
+        self.haplo_paths: Dict[str, List[str]] = {}
+        # Статистика обучающего набора, сохраняется в артефакте (эталон для дрейфа)
+        self.dataset_stats: Optional[DatasetStats] = None
+        # Какие узлы последнее обучение построило заново, а какие взяло из артефакта
+        self.training_report: Optional[Dict] = None
+        # Группы до этого размера считаются скомпилированным лесом,
+        # большие выгоднее отдавать в predict_proba sklearn
+        self.compiled_max_rows = 256
+
+    @property
+    def feature_names(self) -> Optional[List[str]]:
+        """Маркеры, на которых обучено дерево (по скейлеру корня)"""
+        if self._artifact is not None:
+            return list(self._artifact.feature_names) or None
+        scaler = self.root.scaler
+        if scaler is None or not hasattr(scaler, "feature_names_in_"):
+            return None
+        return list(scaler.feature_names_in_)
+
+    @property
+    def schema(self) -> Optional[MarkerSchema]:
+        """Позиции маркеров модели для выравнивания входных данных"""
+        feature_names = self.feature_names
+        return MarkerSchema.for_features(feature_names) if feature_names else None
+
+    def _path_resolver(self) -> HaploPathResolver:
+        # Без заданного - свой, один на предиктор: ответы не запрашиваются повторно
+        if self.path_resolver is None:
+            self.path_resolver = HaploPathResolver(self.haplo_api_url)
+        return self.path_resolver
 
     async def get_haplo_path(self, haplogroup: str) -> List[str]:
         """Получает путь гаплогруппы из сервера"""
-        try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(f"{self.haplo_api_url}/search/{haplogroup}")
-                if response.status_code == 200:
-                    data = response.json()
-                    # Извлекаем FTDNA и YFull пути
-                    ftdna_path = data.get('ftdna_path', [])
-                    yfull_path = data.get('yfull_path', [])
-                    # Объединяем пути
-                    combined_path = []
-                    if ftdna_path:
-                        combined_path.extend(ftdna_path)
-                    if yfull_path:
-                        combined_path.extend([p for p in yfull_path if p not in combined_path])
-                    return combined_path
-                return []
-        except Exception as e:
-            logging.error(f"Error getting path for {haplogroup}: {str(e)}")
-            return []
+        paths = await self._path_resolver().resolve([haplogroup])
+        return paths[haplogroup]
 
-    def _add_path_to_tree(self, path: List[str]):
+    def _add_path_to_tree(self, path: List[str], root: HaploNode):
         """Добавляет путь в дерево"""
-        current = self.root
+        current = root
         for haplo in path:
             if haplo not in current.children:
                 new_node = HaploNode(name=haplo, parent=current)
                 current.children[haplo] = new_node
             current = current.children[haplo]
 
-    def _get_node_samples(self, node: HaploNode, X: pd.DataFrame, y: pd.Series) -> tuple:
-        """Получает образцы для конкретного узла"""
-        mask = y.apply(lambda x: node.name in x)
-        return X[mask], y[mask]
-
-    def _train_node(self, node: HaploNode, X: pd.DataFrame, y: pd.Series):
-        """Обучает модель для узла"""
-        if len(node.children) == 0:
-            return
-
-        # Получаем образцы для текущего узла
-        X_node, y_node = self._get_node_samples(node, X, y)
-        
-        if len(X_node) < 2:
-            return
-
-        # Создаем метки для дочерних узлов
-        child_labels = y_node.apply(lambda x: next(
-            (child for child in node.children.keys() if child in x),
-            node.name
-        ))
-
-        unique_labels = child_labels.unique()
-        if len(unique_labels) < 2:
-            return
-
-        logging.info(f"Training model for {node.name}")
-        logging.info(f"Samples: {len(X_node)}, Children: {len(unique_labels)}")
-
-        try:
-            # Обучаем модель батчами
-            node.scaler = StandardScaler()
-            X_scaled = node.scaler.fit_transform(X_node)
-
-            node.model = RandomForestClassifier(
-                n_estimators=100,
-                max_depth=None,
-                min_samples_split=2,
-                min_samples_leaf=1,
-                n_jobs=1,  # Используем один процесс для экономии памяти
-                random_state=42
-            )
-
-            # Обучаем на батчах
-            for i in range(0, len(X_scaled), self.batch_size):
-                X_batch = X_scaled[i:i + self.batch_size]
-                y_batch = child_labels.iloc[i:i + self.batch_size]
-                if i == 0:
-                    node.model.fit(X_batch, y_batch)
-                else:
-                    node.model.n_estimators += 10
-                    node.model.fit(X_batch, y_batch)
+    async def train(self, X: pd.DataFrame, y: pd.Series,
+                    progress_callback: Optional[Callable[[int, int], None]] = None,
+                    haplo_paths: Optional[Dict[str, List[str]]] = None,
+                    sample_weight: Optional[Sequence[float]] = None,
+                    previous: Optional[TreeArtifact] = None):
+        """Обучает всё дерево
 
-        except Exception as e:
-            logging.error(f"Error training node {node.name}: {str(e)}")
-            node.model = None
-            node.scaler = None
-
-    async def train(self, X: pd.DataFrame, y: pd.Series):
-        """Обучает всё дерево"""
+        Args:
+            progress_callback: вызывается как ``callback(nodes_trained, nodes_total)``
+                после построения дерева и после обработки каждого узла
+            haplo_paths: уже известные пути гаплогрупп; за остальными
+                идем в сервис гаплогрупп
+            sample_weight: веса строк, например число повторов после
+                ``models.deduplication.deduplicate``
+            previous: артефакт прошлого обучения; узлы с прежним отпечатком
+                данных берут модели из него (отчет - в ``training_report``)
+        """
+        if sample_weight is not None:
+            sample_weight = np.asarray(sample_weight, dtype=np.float64)
+            if len(sample_weight) != len(y):
+                raise ValueError("sample_weight must have one value per sample")
         try:
             logging.info(f"Starting training with {len(y)} samples")
             logging.info(f"Unique haplogroups: {y.unique()[:10]}")  # Показываем первые 10
@@ -126,11 +153,21 @@ class TreeHaploPredictor:
             # Получаем пути для всех гаплогрупп
             unique_haplos = y.unique()
             paths_found = 0
+
+            # Строим новое дерево, не трогая обслуживаемое self.root
+            root = HaploNode(name="ROOT")
+            resolved = {}
             
+            known = haplo_paths or {}
+            fetched = await self._path_resolver().resolve(
+                haplo for haplo in unique_haplos if haplo not in known
+            )
+
             for haplo in unique_haplos:
-                path = await self.get_haplo_path(haplo)
+                path = known[haplo] if haplo in known else fetched[haplo]
+                resolved[haplo] = path
                 if path:
-                    self._add_path_to_tree(path)
+                    self._add_path_to_tree(path, root)
                     paths_found += 1
                     logging.info(f"Got path for {haplo}: {path}")
                 else:
@@ -145,25 +182,239 @@ class TreeHaploPredictor:
                     print_tree(child, level + 1)
                 
             logging.info("Tree structure:")
-            print_tree(self.root)
+            print_tree(root)
 
-            # Обучаем модели начиная с корня
-            def train_recursive(node: HaploNode):
-                if node != self.root:
-                    self._train_node(node, X, y)
-                for child in node.children.values():
-                    train_recursive(child)
-
-            train_recursive(self.root)
-            logging.info("Finished training tree")
+            # Узлы независимы: обучаются пулом процессов, большие - первыми
+            trainer = NodeTrainer(
+                n_estimators=self.n_estimators,
+                workers=self.train_workers,
+                memory_bytes=self.train_memory_bytes,
+                work_dir=self.train_work_dir
+            )
+            report = trainer.train(root, X, y, resolved, sample_weight,
+                                   on_node=progress_callback, previous=previous)
+            logging.info(f"Finished training tree: {len(report['rebuilt'])} nodes trained, "
+                         f"{len(report['reused'])} reused, ~{report['saved_seconds']:.0f}s saved")
+            self._compile_tree(root)
+            self.root = root
+            self.haplo_paths = resolved
+            self.training_report = report
+            self.tiers = {}
+            self._artifact = None
+            self.version = None
             self.is_trained = True
 
         except Exception as e:
             logging.error(f"Training error: {str(e)}")
             raise
 
+    def retraining_summary(self, max_nodes: int = 100) -> Dict:
+        """Сколько узлов дерева и деревьев панелей обучено заново и сколько времени сэкономлено
+
+        ``rebuilt_nodes`` - первые ``max_nodes`` переобученных узлов (от
+        больших к меньшим) с ключами отпечатка, которые изменились.
+        """
+        summary = {}
+        for name, tree in [("full", self), *self.tiers.items()]:
+            report = tree.training_report
+            if report is None:
+                continue
+            summary[name] = {
+                "nodes": report["nodes"],
+                "rebuilt": len(report["rebuilt"]),
+                "reused": len(report["reused"]),
+                "training_seconds": report["training_seconds"],
+                "saved_seconds": report["saved_seconds"],
+                "rebuilt_nodes": report["rebuilt"][:max_nodes],
+            }
+        return summary
+
+    def tier_estimators(self, n_features: int, n_total: int) -> int:
+        """Число деревьев леса панели: пропорционально доле ее маркеров"""
+        return max(self.min_tier_estimators, round(self.n_estimators * n_features / n_total))
+
+    async def train_tiers(self, X: pd.DataFrame, y: pd.Series,
+                          tiers: Optional[Sequence[str]] = None,
+                          sample_weight: Optional[Sequence[float]] = None,
+                          previous: Optional[TreeArtifact] = None) -> Dict[str, 'TreeHaploPredictor']:
+        """Обучает уменьшенные деревья для панелей FTDNA (Y12, Y25, ...)
+
+        Дерево панели видит только ее маркеры из X и получает меньше
+        деревьев в лесах узлов. Панель пропускается, если в X нет ее
+        маркеров, если она покрывает все маркеры X (это полная модель) или
+        совпадает по маркерам с меньшей панелью. Вызывается после ``train``:
+        пути гаплогрупп берутся из него. Из ``previous`` берутся модели
+        узлов деревьев тех же панелей.
+        """
+        if not self.is_trained:
+            raise Exception("Model is not trained")
+
+        trained = {}
+        seen = set()
+        for tier in sorted(tiers or PANEL_TIERS, key=PANEL_TIERS.get):
+            panel = MarkerSchema.ftdna(tier=tier)
+            columns = [column for column in X.columns if panel.position(column) is not None]
+            if not columns or len(columns) == len(X.columns) or tuple(columns) in seen:
+                continue
+            seen.add(tuple(columns))
+
+            predictor = TreeHaploPredictor(haplo_api_url=self.haplo_api_url)
+            predictor.tier_name = tier
+            predictor.path_resolver = self.path_resolver
+            predictor.batch_size = self.batch_size
+            predictor.max_tree_growth = self.max_tree_growth
+            predictor.train_workers = self.train_workers
+            predictor.train_memory_bytes = self.train_memory_bytes
+            predictor.train_work_dir = self.train_work_dir
+            predictor.n_estimators = self.tier_estimators(len(columns), len(X.columns))
+            logging.info(f"Training {tier} tier: {len(columns)} markers, "
+                         f"{predictor.n_estimators} trees per node")
+            previous_tier = previous.tier(tier) if previous is not None and tier in previous.tiers else None
+            await predictor.train(X[columns], y, haplo_paths=self.haplo_paths,
+                                  sample_weight=sample_weight, previous=previous_tier)
+            trained[tier] = predictor
+
+        self.tiers = trained
+        self._tier_positions = None
+        self.version = None
+        return trained
+
+    async def update(self, X: pd.DataFrame, y: pd.Series,
+                     sample_weight: Optional[Sequence[float]] = None,
+                     haplo_paths: Optional[Dict[str, List[str]]] = None) -> Dict:
+        """Дообучает обученное дерево на новых образцах
+
+        Узлы, в которые попали новые строки, получают новые деревья в лесу
+        (``warm_start``), обученные только на этих строках; остальные узлы,
+        скейлеры и старые деревья не меняются. Деревьев добавляется
+        пропорционально доле новых строк в узле. Структура дерева остается
+        прежней: если образцу нужен класс, которого нет в лесу узла (новая
+        ветвь или путь, впервые кончающийся в узле), его строка в этом
+        узле пропускается, а узел попадает в ``stale_nodes`` - такие узлы
+        исправляет только полное обучение. Туда же попадает узел, лес
+        которого дорос до ``max_tree_growth * n_estimators`` деревьев:
+        больше деревьев ему не добавляется. Деревья панелей дообучаются так же.
+
+        Returns:
+            Dict: ``samples``, ``updated_nodes``, ``trees_added``, ``stale_nodes``,
+            ``unresolved`` (гаплогруппы без пути) и отчеты панелей в ``tiers``
+        """
+        if not self.is_trained:
+            raise Exception("Model is not trained")
+        if sample_weight is not None:
+            sample_weight = np.asarray(sample_weight, dtype=np.float64)
+            if len(sample_weight) != len(y):
+                raise ValueError("sample_weight must have one value per sample")
+
+        known = {**self.haplo_paths, **(haplo_paths or {})}
+        unique_haplos = y.unique()
+        fetched = await self._path_resolver().resolve(
+            haplo for haplo in unique_haplos if haplo not in known
+        )
+        paths = {haplo: known[haplo] if haplo in known else fetched[haplo] for haplo in unique_haplos}
+
+        report = self._update_nodes(X, y, paths, sample_weight)
+        report["tiers"] = {}
+        for name, tier in self.tiers.items():
+            tier.batch_size, tier.max_tree_growth = self.batch_size, self.max_tree_growth
+            tier_report = tier._update_nodes(X, y, paths, sample_weight)
+            tier.version = None
+            report["tiers"][name] = {
+                key: tier_report[key] for key in ("updated_nodes", "trees_added", "stale_nodes")
+            }
+        self.haplo_paths.update((haplo, path) for haplo, path in paths.items() if path)
+        self.version = None
+        logging.info(f"Updated {len(report['updated_nodes'])} nodes with {report['samples']} samples, "
+                     f"{report['trees_added']} trees added, stale nodes: {report['stale_nodes']}")
+        return report
+
+    def _update_nodes(self, X: pd.DataFrame, y: pd.Series, paths: Dict[str, List[str]],
+                      sample_weight: Optional[np.ndarray]) -> Dict:
+        """Дообучение лесов узлов одного дерева (см. ``update``)"""
+        feature_names = self.feature_names
+        unresolved = sorted(haplo for haplo, path in paths.items() if not path)
+        resolved = ~y.isin(unresolved).to_numpy()
+        X, y = X[resolved], y[resolved]
+        if sample_weight is not None:
+            sample_weight = sample_weight[resolved]
+
+        # Узел, на котором путь гаплогруппы выходит за дерево -> такие гаплогруппы
+        stale: Dict[int, HaploNode] = {}
+        broken: Dict[int, Set[str]] = {}
+        for haplo, path in paths.items():
+            node = self.root
+            for name in path:
+                if name not in node.children:
+                    stale[id(node)] = node
+                    broken.setdefault(id(node), set()).add(haplo)
+                    break
+                node = node.children[name]
+
+        index = NodeIndex(self.root, y, paths)
+        # Недостающие маркеры - нули, как при обучении и предсказании (fillna(0))
+        compact = compact_frame(X.reindex(columns=feature_names, fill_value=0))
+        matrix, scales = compact.to_numpy(), marker_scales(compact)
+        haplos = y.to_numpy()
+        updated, trees_added = [], 0
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            stack.extend(node.children.values())
+            rows = index.rows(node)
+            if not node.children or not len(rows):
+                continue
+            codes, classes = index.labels(node)
+            if not self._has_model(node):
+                # Раньше в узле был один класс, модель не обучалась
+                if len(classes) > 1:
+                    stale[id(node)] = node
+                continue
+
+            self._node_estimators(node)
+            labels = np.asarray(classes, dtype=object)[codes]
+            keep = np.isin(labels, node.model.classes_)
+            if id(node) in broken:
+                keep &= ~np.isin(haplos[rows], list(broken[id(node)]))
+            if not keep.all():
+                stale[id(node)] = node
+            rows, labels = rows[keep], labels[keep]
+            if not len(rows):
+                continue
+
+            weights = sample_weight[rows] if sample_weight is not None else None
+            samples = float(weights.sum()) if weights is not None else float(len(rows))
+            # Артефакты без веса узла: скейлер обучен на тех же строках
+            seen = node.n_samples or float(np.sum(node.scaler.n_samples_seen_))
+            trees = max(1, round(len(node.model.estimators_) * samples / seen))
+            room = self.max_tree_growth * self.n_estimators - len(node.model.estimators_)
+            if trees > room:
+                stale[id(node)] = node
+                trees = room
+                if trees <= 0:
+                    continue
+            frame = with_scales(pd.DataFrame(matrix[rows], columns=feature_names, copy=False), scales)
+            update_node(node.model, node.scaler, frame, labels, weights, trees, self.batch_size)
+            node.n_samples = seen + samples
+            # Старых строк узла нет, поэтому отпечаток не пересчитать: следующее
+            # полное обучение построит узел заново
+            node.fingerprint = None
+            node.compiled = CompiledForest.from_sklearn(node.model, node.scaler)
+            updated.append(node.name)
+            trees_added += trees
+
+        return {
+            "samples": int(len(y)),
+            "updated_nodes": updated,
+            "trees_added": trees_added,
+            "stale_nodes": sorted(node.name for node in stale.values()),
+            "unresolved": unresolved,
+        }
+
     def predict(self, X: pd.DataFrame) -> List[Dict]:
         """Делает предсказания, спускаясь по дереву
+
+        Столбцы X раскладываются по позициям признаков модели
+        (``MarkerSchema``): лишние отбрасываются, отсутствующие считаются нулями.
         
         Returns:
             List[Dict]: Список предсказаний для каждого образца, содержащий:
@@ -172,67 +423,266 @@ class TreeHaploPredictor:
         """
         if not self.is_trained:
             raise Exception("Model is not trained")
+        schema = self.schema
+        return self._predict_routed(schema.align(X) if schema is not None else marker_values(X))
 
-        results = []
-        for i in range(len(X)):
-            X_sample = X.iloc[[i]]
-            
-            # Спускаемся по дереву
-            current_node = self.root
-            path_predictions = []
-            
-            # Проверяем есть ли дети у корня
-            if not current_node.children:
-                logging.warning("No children in root node")
-                results.append({
+    def predict_markers(self, samples: Sequence[Mapping[str, Any]]) -> List[Dict]:
+        """Предсказания для словарей маркеров из запроса без построения DataFrame"""
+        if not self.is_trained:
+            raise Exception("Model is not trained")
+        schema = self.schema
+        if schema is None:
+            return self.predict(pd.DataFrame(list(samples)))
+        # float64, как у predict: результат совпадает до бита
+        return self._predict_routed(schema.encode_batch(samples, dtype=np.float64))
+
+    def _tier_columns(self) -> List[Tuple[str, np.ndarray]]:
+        """Панели от меньшей к большей с позициями их маркеров в полной схеме"""
+        if self._tier_positions is None:
+            schema = self.schema
+            tiers = sorted(self.tiers.items(), key=lambda item: len(item[1].feature_names))
+            self._tier_positions = [
+                (name, np.array([schema.position(feature) for feature in tier.feature_names]))
+                for name, tier in tiers
+            ]
+        return self._tier_positions
+
+    def route(self, values: np.ndarray) -> np.ndarray:
+        """Номер панели (в порядке ``_tier_columns``) для каждой строки, -1 - полная модель
+
+        Маркер считается присланным, если он не равен нулю. Строка идет в
+        наибольшую панель, все маркеры которой присланы, то есть в самую
+        маленькую модель, которая видит все ее маркеры. Строки с полным
+        набором маркеров или без полной даже меньшей панели остаются
+        полной модели.
+        """
+        present = values != 0
+        assignment = np.full(len(values), -1)
+        for i, (_, positions) in enumerate(self._tier_columns()):
+            assignment[present[:, positions].all(axis=1)] = i
+        assignment[present.all(axis=1)] = -1
+        return assignment
+
+    def _predict_routed(self, values: np.ndarray) -> List[Dict]:
+        """Распределяет строки по моделям панелей; в ответ добавляется ``panel``"""
+        if not self.tiers or not self.route_panels:
+            return self._predict_values(values)
+
+        tier_columns = self._tier_columns()
+        assignment = self.route(values)
+        results: List[Optional[Dict]] = [None] * len(values)
+        for index in np.unique(assignment):
+            rows = np.flatnonzero(assignment == index)
+            if index < 0:
+                name, predictions = "full", self._predict_values(values[rows])
+            else:
+                name, positions = tier_columns[index]
+                predictions = self.tiers[name]._predict_values(values[np.ix_(rows, positions)])
+            PANEL_SAMPLES.labels(name).inc(len(rows))
+            for row, prediction in zip(rows, predictions):
+                prediction["panel"] = name
+                results[row] = prediction
+        return results
+
+    def _predict_values(self, values: np.ndarray) -> List[Dict]:
+        """Спуск по дереву для матрицы признаков в порядке ``feature_names``
+
+        Спуск выполняется пакетно: на каждом уровне образцы группируются
+        по узлу, в котором они находятся, и для каждого узла делается один
+        вызов ``scaler.transform`` и ``predict_proba`` на всю группу.
+        """
+        # Проверяем есть ли дети у корня
+        if not self.root.children:
+            logging.warning("No children in root node")
+            return [
+                {
                     "path_predictions": [],
                     "error": "Model has no trained paths"
-                })
-                continue
+                }
+                for _ in range(len(values))
+            ]
 
-            while current_node.children:
-                if current_node.model is None:
-                    break
-                    
-                X_scaled = current_node.scaler.transform(X_sample)
-                probas = current_node.model.predict_proba(X_scaled)[0]
-                classes = current_node.model.classes_
-                
-                # Получаем топ-3 предсказания
-                top_indices = np.argsort(probas)[-3:][::-1]
-                predictions = [
-                    {
-                        "haplogroup": classes[idx],
-                        "probability": float(probas[idx])
-                    }
-                    for idx in top_indices
-                ]
-                
-                path_predictions.append({
-                    "level": len(path_predictions),
-                    "predictions": predictions
-                })
-                
-                # Переходим к следующему узлу по наиболее вероятному пути
-                next_haplo = predictions[0]["haplogroup"]
-                if next_haplo in current_node.children:
-                    current_node = current_node.children[next_haplo]
+        schema = self.schema
+        results = [{"path_predictions": []} for _ in range(len(values))]
+
+        # Фронт спуска: пары (узел, позиции образцов в values)
+        frontier = [(self.root, np.arange(len(values)))]
+        level = 0
+        while frontier:
+            next_frontier = []
+            level_start = time.perf_counter()
+            evaluated = False
+            for node, rows in frontier:
+                if not node.children or not self._has_model(node):
+                    continue
+
+                node_start = time.perf_counter()
+                compiled = self._node_compiled(node)
+                if compiled is not None and len(rows) <= self.compiled_max_rows:
+                    probas = compiled.predict_proba(values[rows])
+                    classes = compiled.classes
+                    engine = "compiled"
                 else:
-                    break
+                    self._node_estimators(node)
+                    batch = values[rows]
+                    # Скейлер обучен на таблице и проверяет имена признаков
+                    X_scaled = node.scaler.transform(schema.frame(batch) if schema is not None else batch)
+                    probas = node.model.predict_proba(X_scaled)
+                    classes = node.model.classes_
+                    engine = "sklearn"
+                NODE_SECONDS.labels(self.tier_name, node.name, engine).observe(time.perf_counter() - node_start)
+                evaluated = True
+
+                # Получаем топ-3 предсказания для каждого образца группы
+                top_indices = np.argsort(probas, axis=1)[:, -3:][:, ::-1]
+                for row, row_probas, row_top in zip(rows, probas, top_indices):
+                    path_predictions = results[row]["path_predictions"]
+                    path_predictions.append({
+                        "level": len(path_predictions),
+                        "predictions": [
+                            {
+                                "haplogroup": classes[idx],
+                                "probability": float(row_probas[idx])
+                            }
+                            for idx in row_top
+                        ]
+                    })
 
-            results.append({
-                "path_predictions": path_predictions
-            })
+                # Переходим к следующему узлу по наиболее вероятному пути
+                best = top_indices[:, 0]
+                for class_idx in np.unique(best):
+                    child = node.children.get(classes[class_idx])
+                    if child is not None:
+                        next_frontier.append((child, rows[best == class_idx]))
+            if evaluated:
+                LEVEL_SECONDS.labels(self.tier_name, str(level)).observe(time.perf_counter() - level_start)
+            frontier = next_frontier
+            level += 1
 
         return results
 
+    @staticmethod
+    def _has_model(node: HaploNode) -> bool:
+        return node.model is not None or node.artifact_index is not None
+
+    def _node_compiled(self, node: HaploNode) -> Optional[CompiledForest]:
+        """Скомпилированный лес узла; из артефакта собирается при первом обращении"""
+        if node.compiled is None and node.artifact_index is not None:
+            node.compiled = self._artifact.compiled(node.artifact_index)
+        return node.compiled
+
+    def _node_estimators(self, node: HaploNode):
+        """Читает sklearn-модель и скейлер узла из артефакта, если их еще нет"""
+        if node.model is None and node.artifact_index is not None:
+            model, scaler = self._artifact.estimators(node.artifact_index)
+            # Скейлер раньше модели: проверка идет по node.model
+            node.scaler = scaler
+            node.model = model
+
+    @staticmethod
+    def _compile_tree(root: HaploNode):
+        """Компилирует лес каждого узла в плоские массивы для быстрого вывода"""
+        def compile_recursive(node: HaploNode):
+            if node.model is not None and node.compiled is None:
+                node.compiled = CompiledForest.from_sklearn(node.model, node.scaler)
+            for child in node.children.values():
+                compile_recursive(child)
+
+        compile_recursive(root)
+
+    @staticmethod
+    def _artifact_version(file_path: str) -> str:
+        """Версия артефакта: префикс SHA-256 его содержимого"""
+        import hashlib
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest()[:12]
+
     def save_model(self, path: str = "models/saved/"):
-        import joblib
+        """Сохраняет дерево каталогом ``tree_model/`` (см. TreeArtifact)"""
         import os
         os.makedirs(path, exist_ok=True)
-        joblib.dump(self.root, f"{path}tree_model.joblib")
+
+        # Узлы, загруженные лениво, перед сохранением читаем целиком
+        for predictor in [self, *self.tiers.values()]:
+            predictor.materialize(estimators=True)
+
+        self.version = TreeArtifact.save(
+            self.root, f"{path}tree_model",
+            tiers={name: tier.root for name, tier in self.tiers.items()},
+            stats=self.dataset_stats.to_dict() if self.dataset_stats is not None else None
+        )
+        if self.tiers:
+            # Версии деревьев панелей - из манифеста, как при загрузке
+            artifact = TreeArtifact(f"{path}tree_model")
+            for name, tier in self.tiers.items():
+                tier.version = artifact.tiers[name]["version"]
         
-    def load_model(self, path: str = "models/saved/"):
+    def load_model(self, path: str = "models/saved/", mmap: bool = True):
+        """Загружает дерево
+
+        Из каталога ``tree_model/`` читается только структура дерева, массивы
+        лесов отображаются в память, модели узлов подгружаются по мере
+        надобности. Старый формат ``tree_model.joblib`` читается целиком.
+        """
+        if TreeArtifact.exists(f"{path}tree_model"):
+            artifact = TreeArtifact(f"{path}tree_model", mmap=mmap)
+            self._use_artifact(artifact)
+            stats = artifact.read_stats()
+            self.dataset_stats = DatasetStats.from_dict(stats) if stats is not None else None
+            tiers = {}
+            for name in artifact.tiers:
+                tier = TreeHaploPredictor(haplo_api_url=self.haplo_api_url)
+                tier.tier_name = name
+                tier._use_artifact(artifact.tier(name))
+                tiers[name] = tier
+            self.tiers, self._tier_positions = tiers, None
+            return
+
         import joblib
-        self.root = joblib.load(f"{path}tree_model.joblib")
-        self.is_trained = True
+        root = joblib.load(f"{path}tree_model.joblib")
+        self._compile_tree(root)
+        version = self._artifact_version(f"{path}tree_model.joblib")
+        self._artifact = None
+        self.tiers, self._tier_positions = {}, None
+        self.dataset_stats = None
+        self.root, self.version, self.is_trained = root, version, True
+
+    def _use_artifact(self, artifact: TreeArtifact):
+        root = artifact.build_tree(lambda name, parent: HaploNode(name=name, parent=parent))
+        self._artifact, self.root = artifact, root
+        self.version, self.is_trained = artifact.version, True
+
+    def materialize(self, estimators: bool = False):
+        """Собирает леса всех узлов сразу, а не по первому запросу
+
+        Вызывается в родительском процессе перед fork, чтобы воркеры
+        получили готовые объекты через copy-on-write. С ``estimators=True``
+        также читаются sklearn-модели узлов.
+        """
+        def materialize_recursive(node: HaploNode):
+            if self._has_model(node):
+                self._node_compiled(node)
+                if estimators:
+                    self._node_estimators(node)
+            for child in node.children.values():
+                materialize_recursive(child)
+
+        materialize_recursive(self.root)
+        for tier in self.tiers.values():
+            tier.materialize(estimators)
+
+    def warm_up(self):
+        """Прогоняет нулевой образец через дерево, чтобы прогреть модели"""
+        feature_names = self.feature_names
+        if not feature_names:
+            return
+        X = pd.DataFrame(
+            np.zeros((1, len(feature_names))),
+            columns=feature_names
+        )
+        self.predict(X)
+        for tier in self.tiers.values():
+            tier.warm_up()
@@ -11,6 +11,8 @@ import plotly.graph_objects as go
 from pathlib import Path
 import logging
 
+from models.dataset_stats import DatasetStats
+
 class HaplogroupVisualizer:
     def __init__(self, save_dir: str = "static/plots"):
         self.save_dir = Path(save_dir)
@@ -157,15 +159,20 @@ class HaplogroupVisualizer:
         return str(plot_path)
 
 class DataAnalyzer:
+    @staticmethod
+    def analyze(X: pd.DataFrame, y: pd.Series = None) -> DatasetStats:
+        """Вся статистика набора за один проход (см. DatasetStats)"""
+        return DatasetStats.from_frame(X, y)
+
     @staticmethod
     def analyze_class_distribution(y: pd.Series) -> Dict[str, int]:
         """Анализирует распределение классов"""
-        return dict(y.value_counts())
+        return DatasetStats().update_classes(y).class_distribution()
     
     @staticmethod
     def analyze_missing_values(X: pd.DataFrame) -> Dict[str, float]:
         """Анализирует пропущенные значения"""
-        return dict(X.isnull().mean())
+        return DatasetStats.from_frame(X).missing_fractions()
     
     @staticmethod
     def find_rare_classes(y: pd.Series, threshold: int = 5) -> List[str]:
@@ -175,12 +182,4 @@ class DataAnalyzer:
     @staticmethod
     def analyze_marker_ranges(X: pd.DataFrame) -> Dict[str, Dict[str, float]]:
         """Анализирует диапазоны значений маркеров"""
-        ranges = {}
-        for col in X.columns:
-            ranges[col] = {
-                'min': X[col].min(),
-                'max': X[col].max(),
-                'mean': X[col].mean(),
-                'std': X[col].std()
-            }
-        return ranges
\ No newline at end of file
+        return DatasetStats.from_frame(X).marker_ranges()
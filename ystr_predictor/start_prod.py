@@ -0,0 +1,10 @@
+# c:\projects\DNA-utils-universal\ystr_predictor\start_prod.py
+# Несколько воркеров с общей предзагруженной моделью (только Linux/macOS).
+# Настройки берутся из gunicorn_conf.py и переменных окружения.
+import sys
+
+from gunicorn.app.wsgiapp import run
+
+if __name__ == "__main__":
+    sys.argv = ["gunicorn", "-c", "gunicorn_conf.py", "app:app"] + sys.argv[1:]
+    run()
@@ -0,0 +1,6 @@
+# c:\projects\DNA-utils-universal\ystr_predictor\tests\conftest.py
+import sys
+from pathlib import Path
+
+# Модули приложения импортируются как models.*, от каталога ystr_predictor
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
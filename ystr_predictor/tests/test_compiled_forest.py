@@ -0,0 +1,63 @@
+# c:\projects\DNA-utils-universal\ystr_predictor\tests\test_compiled_forest.py
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.preprocessing import StandardScaler
+
+from models.compiled_forest import CompiledForest
+
+MARKERS = [f"DYS{i}" for i in range(8)]
+
+
+def _corpus(n_rows: int, seed: int, classes=("R-L21", "R-U106", "I-M253", "J-M172"),
+            missing: float = 0.0):
+    """Классы различимы по сдвигу маркеров; ``missing`` - доля пропусков (NaN)"""
+    rng = np.random.default_rng(seed)
+    labels = rng.choice(np.array(classes, dtype=object), n_rows)
+    shift = pd.Series(labels).map({name: 2 * i for i, name in enumerate(classes)}).to_numpy()
+    values = 12 + shift[:, None] + rng.integers(-2, 3, (n_rows, len(MARKERS))).astype(np.float64)
+    values[rng.random(values.shape) < missing] = np.nan
+    return pd.DataFrame(values, columns=MARKERS), labels
+
+
+def _fit(X: pd.DataFrame, labels: np.ndarray, n_estimators: int = 100):
+    scaler = StandardScaler()
+    model = RandomForestClassifier(n_estimators=n_estimators, random_state=42, n_jobs=1)
+    model.fit(scaler.fit_transform(X), labels)
+    return model, scaler
+
+
+def _assert_bit_identical(model, scaler, X: pd.DataFrame):
+    compiled = CompiledForest.from_sklearn(model, scaler)
+    expected = model.predict_proba(scaler.transform(X))
+    actual = compiled.predict_proba(X.to_numpy(dtype=np.float64))
+    np.testing.assert_array_equal(compiled.classes, model.classes_)
+    assert actual.shape == expected.shape
+    assert np.array_equal(actual, expected)
+
+
+def test_matches_sklearn_bit_for_bit():
+    X, labels = _corpus(500, 0)
+    model, scaler = _fit(X, labels)
+    _assert_bit_identical(model, scaler, _corpus(500, 1)[0])
+
+
+@pytest.mark.parametrize("train_missing", [0.0, 0.1])
+def test_matches_sklearn_on_rows_with_missing_values(train_missing):
+    # Леса, обученные с пропусками, запоминают направление NaN в узлах
+    X, labels = _corpus(500, 0, missing=train_missing)
+    model, scaler = _fit(X, labels)
+    test_X = _corpus(500, 2, missing=0.2)[0]
+    test_X.iloc[:5] = np.nan
+    _assert_bit_identical(model, scaler, test_X)
+
+
+def test_matches_sklearn_for_a_single_class_node():
+    X, labels = _corpus(200, 0, classes=("R-L21",))
+    model, scaler = _fit(X, labels, n_estimators=20)
+    test_X = _corpus(100, 3)[0]
+    _assert_bit_identical(model, scaler, test_X)
+    np.testing.assert_array_equal(
+        CompiledForest.from_sklearn(model, scaler).predict_proba(test_X.to_numpy()), 1.0
+    )
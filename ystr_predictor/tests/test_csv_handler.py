@@ -0,0 +1,33 @@
+# c:\projects\DNA-utils-universal\ystr_predictor\tests\test_csv_handler.py
+import numpy as np
+import pandas as pd
+
+from models.csv_handler import CsvHandler
+
+
+def _write_csv(path, n_rows: int, seed: int = 0):
+    """CSV в формате выгрузки: однокопийные маркеры и ``a-b`` у DYS385"""
+    rng = np.random.default_rng(seed)
+    frame = pd.DataFrame({
+        "Haplogroup": rng.choice(["R-M269", "I-M253", "J-M172"], n_rows),
+        "DYS393": rng.integers(11, 16, n_rows),
+        "DYS390": rng.integers(21, 26, n_rows),
+        "DYS385": [f"{a}-{a + b}" for a, b in zip(rng.integers(10, 15, n_rows),
+                                                rng.integers(0, 5, n_rows))],
+    })
+    frame.to_csv(path, sep=";", index=False)
+
+
+def test_parallel_load_data_equals_serial(tmp_path, monkeypatch):
+    path = tmp_path / "export.csv"
+    _write_csv(path, 4000)
+    # Маленький файл тоже делится на несколько диапазонов
+    monkeypatch.setattr(CsvHandler, "PARALLEL_MIN_BYTES", 1000)
+
+    serial, _, serial_markers = CsvHandler.load_data(str(path), chunksize=500, workers=1)
+    parallel, _, parallel_markers = CsvHandler.load_data(str(path), chunksize=500, workers=2)
+
+    assert parallel_markers == serial_markers
+    assert parallel.index.is_unique
+    np.testing.assert_array_equal(parallel.index, np.arange(4000))
+    assert serial.equals(parallel)
@@ -0,0 +1,52 @@
+# c:\projects\DNA-utils-universal\ystr_predictor\tests\test_dataset_stats.py
+import numpy as np
+import pandas as pd
+
+from models.dataset_stats import DatasetStats
+
+
+def _frame(n_rows: int, seed: int):
+    rng = np.random.default_rng(seed)
+    X = pd.DataFrame({
+        "DYS393": rng.integers(11, 16, n_rows).astype(float),
+        "DYS390": rng.integers(21, 26, n_rows).astype(float),
+        "DYS19": rng.integers(13, 17, n_rows).astype(float),
+    })
+    y = pd.Series(rng.choice(["R-M269", "I-M253"], n_rows))
+    return X, y
+
+
+def _assert_same(actual: DatasetStats, expected: DatasetStats):
+    assert actual.markers == expected.markers
+    assert actual.rows == expected.rows
+    assert actual.class_counts == expected.class_counts
+    for name in ("count", "missing", "minimum", "maximum", "histogram"):
+        np.testing.assert_array_equal(getattr(actual, name), getattr(expected, name))
+    np.testing.assert_allclose(actual.mean, expected.mean)
+    np.testing.assert_allclose(actual.m2, expected.m2)
+
+
+def test_merge_matches_markers_by_name():
+    X1, y1 = _frame(200, 0)
+    X2, y2 = _frame(100, 1)
+    expected = DatasetStats.from_frame(pd.concat([X1, X2], ignore_index=True),
+                                       pd.concat([y1, y2], ignore_index=True))
+
+    base = DatasetStats.from_frame(X1, y1)
+    base.merge(DatasetStats.from_frame(X2[["DYS19", "DYS393", "DYS390"]], y2))
+
+    _assert_same(base, expected)
+
+
+def test_merge_counts_absent_markers_as_missing():
+    X1, y1 = _frame(200, 0)
+    X2, y2 = _frame(100, 1)
+    X2 = X2.drop(columns="DYS390")
+    expected = DatasetStats.from_frame(pd.concat([X1, X2], ignore_index=True),
+                                       pd.concat([y1, y2], ignore_index=True))
+
+    base = DatasetStats.from_frame(X1, y1)
+    base.merge(DatasetStats.from_frame(X2, y2))
+
+    _assert_same(base, expected)
+    assert base.missing[base.markers.index("DYS390")] == 100
@@ -0,0 +1,87 @@
+# c:\projects\DNA-utils-universal\ystr_predictor\tests\test_deduplication.py
+import asyncio
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.preprocessing import StandardScaler
+
+from models import node_training
+from models.deduplication import compression_stats, deduplicate
+from models.marker_dtypes import compact_frame
+from models.tree_predictor import TreeHaploPredictor
+
+PATHS = {
+    "R-L21": ["R", "R-M269", "R-L21"],
+    "R-U106": ["R", "R-M269", "R-U106"],
+    "I-M253": ["I", "I-M253"],
+}
+
+
+def _with_repeats():
+    """Три уникальных пары (гаплотип, гаплогруппа), повторенные 3, 1 и 2 раза"""
+    X = pd.DataFrame({"DYS393": [13, 14, 13, 13, 12, 12],
+                      "DYS390": [24, 23, 24, 24, 25, 25]})
+    y = pd.Series(["R-L21", "I-M253", "R-L21", "R-L21", "R-U106", "R-U106"])
+    return X, y
+
+
+def test_identical_rows_collapse_to_one_weighted_row():
+    X, y = _with_repeats()
+    X_unique, y_unique, counts = deduplicate(X, y)
+
+    assert X_unique.to_dict("list") == {"DYS393": [13, 14, 12], "DYS390": [24, 23, 25]}
+    assert y_unique.tolist() == ["R-L21", "I-M253", "R-U106"]
+    np.testing.assert_array_equal(counts, [3, 1, 2])
+    assert compression_stats(counts)["compression_ratio"] == 2.0
+
+
+def test_same_haplotype_with_another_label_is_kept():
+    X, y = _with_repeats()
+    y.iloc[2] = "R-U106"
+    X_unique, y_unique, counts = deduplicate(compact_frame(X), y)
+
+    assert len(X_unique) == 4 and counts.sum() == len(X)
+    assert y_unique.tolist() == ["R-L21", "I-M253", "R-U106", "R-U106"]
+
+
+def test_weighted_scaler_matches_the_full_sample():
+    X, y = _with_repeats()
+    X_unique, _, counts = deduplicate(X, y)
+    full = StandardScaler().fit(X.astype(np.float64))
+    weighted = StandardScaler().fit(X_unique.astype(np.float64), sample_weight=counts)
+
+    np.testing.assert_allclose(weighted.mean_, full.mean_)
+    np.testing.assert_allclose(weighted.scale_, full.scale_)
+
+
+def test_weights_reach_the_scaler_and_the_forest(monkeypatch):
+    seen = {"scaler": [], "forest": []}
+
+    class Scaler(StandardScaler):
+        def fit_transform(self, X, y=None, **params):
+            seen["scaler"].append(params.get("sample_weight"))
+            return super().fit_transform(X, y, **params)
+
+    class Forest(RandomForestClassifier):
+        def fit(self, X, y, sample_weight=None):
+            seen["forest"].append(sample_weight)
+            return super().fit(X, y, sample_weight=sample_weight)
+
+    monkeypatch.setattr(node_training, "StandardScaler", Scaler)
+    monkeypatch.setattr(node_training, "RandomForestClassifier", Forest)
+
+    X, y = _with_repeats()
+    X_unique, y_unique, counts = deduplicate(pd.concat([X] * 5, ignore_index=True),
+                                             pd.concat([y] * 5, ignore_index=True))
+    predictor = TreeHaploPredictor()
+    predictor.n_estimators = 5
+    asyncio.run(predictor.train(X_unique, y_unique, haplo_paths=PATHS, sample_weight=counts))
+
+    # ROOT видит все уникальные строки с их весами, узел R - строки R-*
+    assert seen["scaler"] and len(seen["scaler"]) == len(seen["forest"])
+    for weights in seen["scaler"] + seen["forest"]:
+        assert weights is not None
+    fitted = [tuple(weights) for weights in seen["forest"]]
+    assert tuple(counts) in fitted
+    assert tuple(counts[y_unique.str.startswith("R").to_numpy()]) in fitted
@@ -0,0 +1,136 @@
+# c:\projects\DNA-utils-universal\ystr_predictor\tests\test_genetic_distance.py
+"""HaplotypeMatrix против построчного порта calculateGeneticDistance
+
+``_reference_distance`` повторяет str-matcher/src/utils/calculations.ts
+по одной паре профилей; векторный поиск должен давать те же строки,
+дистанции и число сравненных локусов при любых блоках и отсечениях.
+"""
+import math
+from typing import Dict, Optional
+
+import numpy as np
+import pytest
+
+from models import genetic_distance
+from models.csv_handler import CsvHandler
+from models.genetic_distance import HaplotypeMatrix
+from models.marker_schema import FTDNA_PANEL, PANEL_TIERS
+
+
+def _marker_difference(value1: str, value2: str, palindrome: bool, extended: bool) -> int:
+    """calculateMarkerDifference"""
+    if not palindrome:
+        diff = abs(int(value2) - int(value1))
+        return diff if extended else min(diff, 2)
+    values1 = [int(v) for v in value1.split("-")]
+    values2 = [int(v) for v in value2.split("-")]
+    if len(values1) != len(values2):
+        return 0
+    total = 0
+    for a, b in zip(values1, values2):
+        total += abs(b - a) if extended else min(abs(b - a), 2)
+    return total if extended else min(total, 2)
+
+
+def _reference_distance(query: Dict[str, str], profile: Dict[str, str], panel: str,
+                        extended: bool) -> Optional[tuple]:
+    """(дистанция, сравнено локусов) или None, если сравнено меньше 80% локусов запроса"""
+    active = [marker for marker in FTDNA_PANEL[:PANEL_TIERS[panel]] if query.get(marker, "").strip()]
+    if not active:
+        # Отличие от TS: там с пустым запросом совпадает любой профиль
+        return None
+    distance = compared = 0
+    for marker in active:
+        value1, value2 = query[marker].strip(), profile.get(marker, "").strip()
+        if not value2:
+            continue
+        compared += 1
+        distance += _marker_difference(
+            value1, value2, marker in CsvHandler.MULTI_VALUE_MARKERS, extended
+        )
+    if compared < math.ceil(len(active) * 0.8):
+        return None
+    return distance, compared
+
+
+def _profiles(n: int, seed: int) -> list:
+    """Родственные гаплотипы с пропусками, крайними значениями и неполными палиндромами"""
+    rng = np.random.default_rng(seed)
+    base = {marker: rng.integers(9, 30, CsvHandler.MULTI_VALUE_MARKERS.get(marker, 1))
+            for marker in FTDNA_PANEL}
+    profiles = []
+    for _ in range(n):
+        missing = rng.choice([0.0, 0.1, 0.3])
+        profile = {}
+        for marker, values in base.items():
+            if rng.random() < missing:
+                continue
+            values = values + rng.choice([-2, -1, 0, 0, 0, 1, 3], len(values))
+            # Значения у границ uint8: разность в uint8 переполняется
+            extreme = rng.random(len(values)) < 0.03
+            values = np.where(extreme, rng.choice([1, 2, 254, 255], len(values)), values)
+            values = np.clip(values, 1, 255)
+            if len(values) > 1 and rng.random() < 0.1:
+                # Другое число копий палиндрома: локус сравнен с дистанцией 0
+                values = values[:-1]
+            profile[marker] = "-".join(str(v) for v in sorted(values))
+        profiles.append(profile)
+    return profiles
+
+
+def _sparse(profile: Dict[str, str], keep: float, seed: int) -> Dict[str, str]:
+    rng = np.random.default_rng(seed)
+    return {marker: value for marker, value in profile.items() if rng.random() < keep}
+
+
+def _expected(queries, profiles, panel: str, extended: bool, max_distance: Optional[int]):
+    expected = []
+    for query in queries:
+        found = []
+        for row, profile in enumerate(profiles):
+            result = _reference_distance(query, profile, panel, extended)
+            if result is not None and (max_distance is None or result[0] <= max_distance):
+                found.append((result[0], row, result[1]))
+        # match_many: по возрастанию дистанции, при равенстве - по номеру строки
+        expected.append(sorted(found))
+    return expected
+
+
+PROFILES = _profiles(400, seed=7)
+QUERIES = (
+    PROFILES[:6]
+    + [_sparse(profile, keep, seed) for seed, (profile, keep) in
+       enumerate([(PROFILES[10], 0.5), (PROFILES[11], 0.2), (PROFILES[12], 0.05)])]
+    + [{"DYS393": "13"}, {}]
+)
+
+
+@pytest.fixture(scope="module")
+def matrix() -> HaplotypeMatrix:
+    return HaplotypeMatrix.from_markers(PROFILES)
+
+
+@pytest.mark.parametrize("block_rows, compact_fraction", [(1 << 16, 0.25), (64, 0.25), (50, 1.0), (64, 0.0)])
+@pytest.mark.parametrize("max_distance", [None, 0, 3, 12])
+@pytest.mark.parametrize("mode", ["standard", "extended"])
+@pytest.mark.parametrize("panel", ["Y12", "Y37", "Y111"])
+def test_match_many_matches_scalar_reference(matrix, monkeypatch, panel, mode, max_distance,
+                                             block_rows, compact_fraction):
+    monkeypatch.setattr(genetic_distance, "BLOCK_ROWS", block_rows)
+    monkeypatch.setattr(genetic_distance, "COMPACT_FRACTION", compact_fraction)
+
+    results = matrix.match_many(QUERIES, panel=panel, max_distance=max_distance, mode=mode)
+    expected = _expected(QUERIES, PROFILES, panel, mode == "extended", max_distance)
+
+    for query, result, wanted in zip(QUERIES, results, expected):
+        got = list(zip(result.distance.tolist(), result.rows.tolist(), result.compared.tolist()))
+        assert got == wanted, f"query with {len(query)} markers"
+
+
+def test_match_and_limit_agree_with_match_many(matrix):
+    many = matrix.match_many(QUERIES, panel="Y37", max_distance=6, limit=5)
+    for query, found in zip(QUERIES, many):
+        one = matrix.match(query, panel="Y37", max_distance=6)
+        assert len(found.rows) <= 5
+        np.testing.assert_array_equal(found.rows, one.rows[:5])
+        np.testing.assert_array_equal(found.distance, one.distance[:5])
@@ -0,0 +1,106 @@
+# c:\projects\DNA-utils-universal\ystr_predictor\tests\test_haplo_paths.py
+import asyncio
+
+import pytest
+
+from benchmarks.haplo_stub import HaploPathStub
+from models.haplo_paths import HaploPathResolver
+from models.haplogroup_hierarchy import HaplogroupHierarchy
+from models.hierarchical_predictor import HierarchicalHaploPredictor
+
+PATHS = {f"R-Y{i}": ["R", "R-M269", f"R-Y{i}"] for i in range(24)}
+
+
+@pytest.fixture
+def stub():
+    with HaploPathStub(PATHS) as stub:
+        yield stub
+
+
+def _resolve(resolver: HaploPathResolver, haplogroups):
+    return asyncio.run(resolver.resolve(haplogroups))
+
+
+def test_fetches_through_a_bounded_pool_of_connections():
+    with HaploPathStub(PATHS, latency=0.05) as stub:
+        resolver = HaploPathResolver(stub.url, concurrency=4)
+        paths = _resolve(resolver, [*PATHS, "Q-UNKNOWN"])
+
+    assert paths == {**PATHS, "Q-UNKNOWN": []}
+    assert stub.requests == len(PATHS) + 1
+    assert 1 < stub.max_in_flight <= 4
+    # keep-alive: соединения переиспользуются, а не открываются на каждый запрос
+    assert stub.connections <= 4
+
+
+def test_retries_server_errors_with_backoff():
+    with HaploPathStub(PATHS, failures=2) as stub:
+        resolver = HaploPathResolver(stub.url, retries=3, backoff=0.01)
+        paths = _resolve(resolver, list(PATHS)[:5])
+
+    assert paths == {hg: PATHS[hg] for hg in list(PATHS)[:5]}
+    assert stub.requests == 3 * 5
+
+
+def test_retries_timeouts():
+    with HaploPathStub(PATHS, stalls=1, stall=0.5) as stub:
+        resolver = HaploPathResolver(stub.url, retries=2, backoff=0.01, timeout=0.1)
+        paths = _resolve(resolver, ["R-Y1", "R-Y2"])
+
+    assert paths == {"R-Y1": PATHS["R-Y1"], "R-Y2": PATHS["R-Y2"]}
+    assert stub.requests == 4
+
+
+def test_groups_that_were_not_fetched_are_not_cached(stub, tmp_path):
+    stub.failures = 10
+    resolver = HaploPathResolver(stub.url, cache_path=str(tmp_path / "paths.json"),
+                                 retries=1, backoff=0.01)
+    assert _resolve(resolver, ["R-Y1"]) == {"R-Y1": []}
+
+    stub.failures = 0
+    stub._attempts.clear()
+    assert _resolve(resolver, ["R-Y1"]) == {"R-Y1": PATHS["R-Y1"]}
+
+
+def test_disk_cache_is_shared_by_new_resolvers(stub, tmp_path):
+    cache_path = str(tmp_path / "paths.json")
+    first = _resolve(HaploPathResolver(stub.url, cache_path=cache_path), ["R-Y1", "R-Y2", "Q-UNKNOWN"])
+    requests = stub.requests
+
+    second = _resolve(HaploPathResolver(stub.url, cache_path=cache_path), ["R-Y1", "R-Y2", "Q-UNKNOWN"])
+    assert second == first
+    assert stub.requests == requests
+
+    # Новые группы запрашиваются, известные - нет
+    _resolve(HaploPathResolver(stub.url, cache_path=cache_path), ["R-Y1", "R-Y3"])
+    assert stub.requests == requests + 1
+
+
+def test_cache_is_dropped_when_the_tree_version_changes(stub, tmp_path):
+    cache_path = str(tmp_path / "paths.json")
+    _resolve(HaploPathResolver(stub.url, cache_path=cache_path, tree_version="2024-01"), ["R-Y1"])
+    requests = stub.requests
+
+    _resolve(HaploPathResolver(stub.url, cache_path=cache_path, tree_version="2024-01"), ["R-Y1"])
+    assert stub.requests == requests
+    _resolve(HaploPathResolver(stub.url, cache_path=cache_path, tree_version="2025-01"), ["R-Y1"])
+    assert stub.requests == requests + 1
+    # Теперь кэш записан для новой версии
+    _resolve(HaploPathResolver(stub.url, cache_path=cache_path, tree_version="2025-01"), ["R-Y1"])
+    assert stub.requests == requests + 1
+
+
+def test_predictors_reuse_one_resolver(stub):
+    predictor = HierarchicalHaploPredictor(haplo_api_url=stub.url)
+    asyncio.run(predictor.get_haplo_paths_batch(["R-Y1", "R-Y2"]))
+    resolver = predictor.path_resolver
+    asyncio.run(predictor.get_haplo_paths_batch(["R-Y1", "R-Y2"]))
+
+    assert resolver is not None and predictor.path_resolver is resolver
+    assert stub.requests == 2
+
+    hierarchy = HaplogroupHierarchy()
+    hierarchy.ftdna_api_url = stub.url
+    asyncio.run(hierarchy.update_haplogroups(["R-Y3"]))
+    asyncio.run(hierarchy.update_haplogroups(["R-Y3"]))
+    assert stub.requests == 3
@@ -0,0 +1,90 @@
+# c:\projects\DNA-utils-universal\ystr_predictor\tests\test_hierarchical_reuse.py
+import asyncio
+
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.haplo_stub import HaploPathStub
+from models.hierarchical_predictor import HierarchicalHaploPredictor
+
+HAPLOGROUPS = ["R-L21", "R-U106", "I-M253", "I-M223", "J-M172", "J-M267"]
+NODES = {"ROOT", "R", "I", "J"}
+
+
+def _samples(n_rows: int = 240, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    y = pd.Series(rng.choice(HAPLOGROUPS, n_rows))
+    shift = y.map({hg: i for i, hg in enumerate(HAPLOGROUPS)}).to_numpy()
+    X = pd.DataFrame(12 + shift[:, None] + rng.integers(-1, 2, (n_rows, 4)),
+                     columns=["DYS393", "DYS390", "DYS19", "DYS391"])
+    return X, y
+
+
+@pytest.fixture
+def stub():
+    # Путей нет (404): иерархия строится по префиксу гаплогруппы
+    with HaploPathStub({}) as stub:
+        yield stub
+
+
+def _train(predictor: HierarchicalHaploPredictor, X, y):
+    asyncio.run(predictor.train(X, y))
+    report = predictor.training_report
+    return {entry["node"] for entry in report["rebuilt"]}, set(report["reused"])
+
+
+def test_second_training_on_the_same_data_reuses_every_model(stub):
+    predictor = HierarchicalHaploPredictor(haplo_api_url=stub.url)
+    X, y = _samples()
+
+    assert _train(predictor, X, y) == (NODES, set())
+    base_model = predictor.base_model
+    assert _train(predictor, X, y) == (set(), NODES)
+    assert predictor.base_model is base_model
+
+
+def test_only_the_subclade_with_changed_rows_is_rebuilt(stub):
+    predictor = HierarchicalHaploPredictor(haplo_api_url=stub.url)
+    X, y = _samples()
+    _train(predictor, X, y)
+    models = dict(predictor.subclade_models)
+
+    # Часть R-L21 переразмечена в R-U106: у ROOT метки (R) и строки прежние
+    y = y.copy()
+    y[y[y == "R-L21"].index[:5]] = "R-U106"
+    rebuilt, reused = _train(predictor, X, y)
+
+    assert rebuilt == {"R"}
+    assert reused == NODES - {"R"}
+    assert predictor.subclade_models["R"] is not models["R"]
+    assert predictor.subclade_models["I"] is models["I"]
+
+
+def test_fingerprints_survive_save_and_load(stub, tmp_path):
+    X, y = _samples()
+    trained = HierarchicalHaploPredictor(haplo_api_url=stub.url)
+    _train(trained, X, y)
+    trained.save_model(f"{tmp_path}/")
+
+    loaded = HierarchicalHaploPredictor(haplo_api_url=stub.url)
+    loaded.load_model(f"{tmp_path}/")
+    assert _train(loaded, X, y) == (set(), NODES)
+
+
+def test_model_saved_without_fingerprints_is_rebuilt(stub, tmp_path):
+    X, y = _samples()
+    trained = HierarchicalHaploPredictor(haplo_api_url=stub.url)
+    _train(trained, X, y)
+    trained.save_model(f"{tmp_path}/")
+
+    # Модель, сохраненная до появления отпечатков
+    path = tmp_path / "hierarchical_model.joblib"
+    model_data = joblib.load(path)
+    del model_data["base_fingerprint"], model_data["subclade_fingerprints"]
+    joblib.dump(model_data, path)
+
+    loaded = HierarchicalHaploPredictor(haplo_api_url=stub.url)
+    loaded.load_model(f"{tmp_path}/")
+    assert _train(loaded, X, y) == (NODES, set())
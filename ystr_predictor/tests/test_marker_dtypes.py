@@ -0,0 +1,67 @@
+# c:\projects\DNA-utils-universal\ystr_predictor\tests\test_marker_dtypes.py
+import io
+
+import numpy as np
+import pandas as pd
+
+from models.csv_handler import CsvHandler
+from models.dataset_cache import DatasetCache
+from models.genetic_distance import HaplotypeMatrix
+from models.marker_dtypes import (
+    FIXED_POINT_SCALE, compact_frame, concat_markers, decode_markers, marker_scales, marker_values
+)
+from models.marker_schema import MarkerSchema
+from models.node_fingerprint import sample_ids
+
+CSV = "Haplogroup;DYS393;DYS390;DYS19\n" + "".join(
+    f"R-M269;13;{24 + i % 2};{'14.2' if i % 3 == 0 else '14'}\n" for i in range(30)
+)
+
+
+def test_int16_frame_without_scales_holds_real_values():
+    # int16 из другого источника: масштаб по типу не выводится
+    X = pd.DataFrame({"DYS393": [13, 14], "DYS390": [24, 25]}, dtype=np.int16)
+    expected = np.array([[13.0, 24.0], [14.0, 25.0]])
+
+    np.testing.assert_array_equal(marker_values(X), expected)
+    np.testing.assert_array_equal(decode_markers(X).to_numpy(), expected)
+    np.testing.assert_array_equal(MarkerSchema(["DYS390", "DYS393"]).align(X), expected[:, ::-1])
+    matrix = HaplotypeMatrix.from_frame(X)
+    assert matrix.columns[matrix.schema.position("DYS390")].tolist() == [24, 25]
+    np.testing.assert_array_equal(sample_ids(X), sample_ids(X.astype(np.float64)))
+
+    compact = compact_frame(X)
+    assert compact.dtypes.iloc[0] == np.uint8 and marker_scales(compact) == {}
+
+
+def test_microalleles_are_stored_with_an_explicit_scale():
+    X, _ = CsvHandler.read_training_stream(io.BytesIO(CSV.encode()))
+
+    assert set(X.dtypes) == {np.dtype(np.int16)}
+    assert marker_scales(X) == dict.fromkeys(X.columns, FIXED_POINT_SCALE)
+    assert decode_markers(X)["DYS19"].iloc[0] == 14.2
+    np.testing.assert_array_equal(marker_values(X[X["DYS393"] > 0][["DYS19"]]).ravel()[:3],
+                                  [14.2, 14.0, 14.0])
+
+
+def test_chunks_of_different_types_concatenate_by_scale():
+    # Первый кусок целиком целый (uint8), второй - с микроаллелью (int16)
+    X, _ = CsvHandler.read_training_stream(io.BytesIO(CSV.encode()), chunksize=3)
+    reference, _ = CsvHandler.read_training_stream(io.BytesIO(CSV.encode()))
+    np.testing.assert_array_equal(marker_values(X), marker_values(reference))
+
+    values, scale = concat_markers(
+        [np.array([14], dtype=np.uint8), np.array([142], dtype=np.int16)], [1, FIXED_POINT_SCALE]
+    )
+    assert scale == FIXED_POINT_SCALE
+    np.testing.assert_array_equal(marker_values(values, scale), [14.0, 14.2])
+
+
+def test_dataset_cache_keeps_the_scale(tmp_path):
+    cache = DatasetCache(str(tmp_path))
+    parsed, _ = cache.load(io.BytesIO(CSV.encode()))
+    cached, _ = cache.load(io.BytesIO(CSV.encode()))
+
+    assert marker_scales(cached) == dict.fromkeys(cached.columns, FIXED_POINT_SCALE)
+    np.testing.assert_array_equal(marker_values(cached), marker_values(parsed))
+    assert marker_values(cached)[0].tolist() == [13.0, 24.0, 14.2]
@@ -0,0 +1,35 @@
+# c:\projects\DNA-utils-universal\ystr_predictor\tests\test_marker_schema.py
+import numpy as np
+import pytest
+
+from models.marker_schema import MarkerSchema
+
+SAMPLE = {"DYS393": 13, "DYS19": "14.2", "DYS385": "11-14", "DYS458": 17.2}
+
+
+def test_encode_splits_multi_copy_strings_and_keeps_microalleles():
+    schema = MarkerSchema.ftdna()
+    row = schema.encode(SAMPLE, dtype=np.float64)
+    values = {name: row[schema.position(name)] for name in ("DYS393", "DYS19", "DYS385_1", "DYS385_2", "DYS458")}
+    assert values == {"DYS393": 13, "DYS19": 14.2, "DYS385_1": 11, "DYS385_2": 14, "DYS458": 17.2}
+
+
+def test_request_models_accept_documented_marker_values():
+    # Запрос из документации не должен получать 422 на этапе валидации
+    from app import Markers, MarkersBatch
+
+    assert Markers(markers=SAMPLE).markers == SAMPLE
+    assert MarkersBatch(samples=[SAMPLE, {"DYS393": 14}]).samples[0] == SAMPLE
+
+
+def test_raw_multi_copy_column_gets_the_first_copy_as_in_training():
+    # Модель read_training_stream: один столбец DYS385 из значения до первого "-"
+    schema = MarkerSchema.for_features(["DYS393", "DYS385", "DYS19"])
+    row = schema.encode({"DYS393": 13, "DYS385": "11-14", "DYS19": "14"}, dtype=np.float64)
+    np.testing.assert_array_equal(row, [13, 11, 14])
+
+
+def test_unparsable_value_is_rejected():
+    schema = MarkerSchema.for_features(["DYS393", "DYS385"])
+    with pytest.raises(ValueError, match="DYS393"):
+        schema.encode({"DYS393": "thirteen"})
@@ -0,0 +1,100 @@
+# c:\projects\DNA-utils-universal\ystr_predictor\tests\test_metrics.py
+import multiprocessing
+
+from prometheus_client.parser import text_string_to_metric_families
+
+from models.metrics import MetricsRegistry
+from models.prediction_cache import PredictionCache
+
+
+def _metrics(registry: MetricsRegistry):
+    return (
+        registry.counter("samples_total", "Samples", ("panel",)),
+        registry.histogram("node_seconds", "Node calls", ("tier", "node"), buckets=(0.01, 0.1)),
+    )
+
+
+def _record(registry: MetricsRegistry, scale: int):
+    """Значения - двоичные дроби: суммы точны при любом порядке файлов"""
+    samples, node_seconds = _metrics(registry)
+    samples.labels("Y12").inc(3 * scale)
+    samples.labels("full").inc(scale)
+    for _ in range(scale):
+        node_seconds.labels("full", "ROOT").observe(0.0078125)
+        node_seconds.labels("Y12", "ROOT").observe(0.0625)
+    node_seconds.labels("full", "R1b").observe(1.0)
+
+
+def _worker(scale: int):
+    # Новый процесс: prometheus_client читает PROMETHEUS_MULTIPROC_DIR при импорте
+    from models.metrics import REGISTRY
+    _record(REGISTRY, scale)
+
+
+def _cache_worker(hits: int):
+    from models.metrics import REGISTRY
+    events = REGISTRY.counter("cache_events_total", "Cache events", ("event",))
+    cache = PredictionCache(max_entries=1, events=events)
+    cache.get("a")
+    cache.put("a", {"haplogroup": "R"})
+    for _ in range(hits):
+        cache.get("a")
+    cache.put("b", {"haplogroup": "I"})
+
+
+def _run_workers(directory, monkeypatch, target, args):
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(directory))
+    context = multiprocessing.get_context("spawn")
+    workers = [context.Process(target=target, args=(arg,)) for arg in args]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+        assert worker.exitcode == 0
+
+
+def _samples(text: bytes) -> dict:
+    """Значения выдачи /metrics по (имени, меткам), без времени создания метрик"""
+    return {
+        (sample.name, tuple(sorted(sample.labels.items()))): sample.value
+        for family in text_string_to_metric_families(text.decode("utf-8"))
+        for sample in family.samples
+        if not sample.name.endswith("_created")
+    }
+
+
+def test_workers_are_summed_across_processes(tmp_path, monkeypatch):
+    _run_workers(tmp_path, monkeypatch, _worker, (1, 2, 3))
+    registry = MetricsRegistry(str(tmp_path))
+
+    expected = MetricsRegistry()
+    _record(expected, 1 + 2 + 3)
+    # Корзина R1b получила по наблюдению от каждого процесса, а не одно
+    for _ in range(2):
+        _metrics(expected)[1].labels("full", "R1b").observe(1.0)
+    assert _samples(registry.render()) == _samples(expected.render())
+
+
+def test_cache_events_are_summed_across_workers(tmp_path, monkeypatch):
+    _run_workers(tmp_path, monkeypatch, _cache_worker, (2, 5))
+    registry = MetricsRegistry(str(tmp_path))
+
+    # Каждый воркер: промах, попадания, вытеснение "a" записью "b"
+    events = {
+        dict(labels)["event"]: value
+        for (name, labels), value in _samples(registry.render()).items()
+        if name == "cache_events_total"
+    }
+    assert events == {"misses": 2, "hits": 7, "evictions": 2}
+
+
+def test_callback_metrics_are_read_from_the_answering_process(tmp_path):
+    state = {"entries": 3}
+    for registry in (MetricsRegistry(), MetricsRegistry(str(tmp_path))):
+        registry.callback("cache_entries", "Entries", "gauge", lambda: {(): state["entries"]})
+        registry.callback("model_info", "Version", "gauge",
+                          lambda: {("abc",): 1, ("old",): None}, ("version",))
+        assert _samples(registry.render()) == {
+            ("cache_entries", ()): 3,
+            ("model_info", (("version", "abc"),)): 1,
+        }
@@ -0,0 +1,41 @@
+# c:\projects\DNA-utils-universal\ystr_predictor\tests\test_model_monitor.py
+from datetime import datetime, timedelta
+
+import pytest
+
+from models.dataset_stats import DatasetStats
+from models.model_monitor import ModelMonitor, PredictionRecord, window_modifier
+
+
+def _record(timestamp: datetime, prediction: str) -> PredictionRecord:
+    return PredictionRecord(timestamp=timestamp, model_version="1",
+                            features={"DYS393": 13, "DYS390": 24},
+                            prediction=prediction, confidence=0.9, latency_ms=1.0)
+
+
+@pytest.mark.parametrize("window, modifier", [
+    ("1d", "-1 days"), ("12h", "-12 hours"), ("30m", "-30 minutes"),
+    ("7 days", "-7 days"), ("1 hour", "-1 hours"),
+])
+def test_window_modifier(window, modifier):
+    assert window_modifier(window) == modifier
+
+
+@pytest.mark.parametrize("window", ["", "1w", "-1d", "1d') OR 1=1 --", "1 day, 'start of day'"])
+def test_window_modifier_rejects_other_input(window):
+    with pytest.raises(ValueError):
+        window_modifier(window)
+
+
+def test_window_contains_only_recent_predictions(tmp_path):
+    monitor = ModelMonitor(db_path=str(tmp_path / "monitoring.db"))
+    monitor.set_baseline_dataset(DatasetStats(["DYS393", "DYS390"]))
+    now = datetime.now()
+    monitor.log_prediction(_record(now - timedelta(minutes=5), "R-M269"))
+    monitor.log_prediction(_record(now - timedelta(hours=3), "I-M253"))
+    monitor.log_prediction(_record(now - timedelta(days=2), "J-M172"))
+
+    assert monitor.calculate_metrics("1d")["prediction_count"] == 2
+    assert monitor.calculate_metrics("1h")["prediction_count"] == 1
+    assert monitor.calculate_metrics("3 days")["prediction_count"] == 3
+    assert monitor.window_stats("1d").rows == 2
@@ -0,0 +1,72 @@
+# c:\projects\DNA-utils-universal\ystr_predictor\tests\test_node_training.py
+import numpy as np
+import pandas as pd
+import pytest
+
+from models.compiled_forest import CompiledForest
+from models.node_training import fit_node, update_node
+
+CLASSES = np.array(["A", "B", "C"], dtype=object)
+
+
+def _node_data(n_rows: int, seed: int = 0, classes=CLASSES):
+    """Три класса, различимых по сдвигу значений маркеров"""
+    rng = np.random.default_rng(seed)
+    labels = rng.choice(classes, n_rows)
+    shift = np.searchsorted(CLASSES, labels).astype(float)
+    values = pd.DataFrame(
+        12 + 2 * shift[:, None] + rng.integers(-1, 2, (n_rows, 5)),
+        columns=[f"DYS{i}" for i in range(5)]
+    )
+    return values, labels
+
+
+def test_full_fit_grows_n_estimators_trees_on_all_rows():
+    values, labels = _node_data(3000)
+    model, _ = fit_node(values, labels, None, n_estimators=7)
+
+    assert len(model.estimators_) == 7
+    # Бутстрэп каждого дерева - из всех строк узла, а не из пакета
+    for tree in model.estimators_:
+        assert tree.tree_.weighted_n_node_samples[0] == pytest.approx(3000)
+
+
+@pytest.mark.parametrize("batch_size", [50, 1000])
+def test_update_with_missing_classes_keeps_classes_and_proba_columns(batch_size):
+    values, labels = _node_data(600)
+    model, scaler = fit_node(values, labels, None, n_estimators=10)
+    classes = model.classes_.copy()
+
+    # В новой порции только класс B: без строк-заглушек с нулевым весом
+    # warm_start оставил бы новым деревьям один класс
+    new_values, new_labels = _node_data(400, seed=1, classes=np.array(["B"], dtype=object))
+    update_node(model, scaler, new_values, new_labels, None, n_trees=4, batch_size=batch_size)
+
+    assert len(model.estimators_) == 14
+    np.testing.assert_array_equal(model.classes_, classes)
+    X_scaled = scaler.transform(values)
+    assert model.predict_proba(X_scaled).shape == (len(values), 3)
+    for tree in model.estimators_[10:]:
+        assert tree.n_classes_ == 3
+        proba = tree.predict_proba(X_scaled)
+        # Столбцы нового дерева совпадают с classes_ леса: все голоса - у B
+        np.testing.assert_array_equal(proba[:, list(classes).index("B")], 1.0)
+
+    compiled = CompiledForest.from_sklearn(model, scaler)
+    np.testing.assert_array_equal(compiled.classes, classes)
+    np.testing.assert_allclose(
+        compiled.predict_proba(values.to_numpy(dtype=np.float64)), model.predict_proba(X_scaled)
+    )
+
+
+def test_update_adds_exactly_n_trees_for_large_batches():
+    values, labels = _node_data(300)
+    model, scaler = fit_node(values, labels, None, n_estimators=5)
+
+    new_values, new_labels = _node_data(5000, seed=2)
+    update_node(model, scaler, new_values, new_labels, None, n_trees=3, batch_size=100)
+
+    # 50 пакетов по 100 строк укрупняются до трех: по дереву на пакет
+    assert len(model.estimators_) == 8
+    for tree in model.estimators_[5:]:
+        assert tree.tree_.weighted_n_node_samples[0] == pytest.approx(5000 / 3, rel=0.01)
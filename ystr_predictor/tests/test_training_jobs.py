@@ -0,0 +1,113 @@
+# c:\projects\DNA-utils-universal\ystr_predictor\tests\test_training_jobs.py
+import json
+import multiprocessing
+import os
+import sys
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from models import training_jobs
+from models.training_jobs import TrainingJobManager
+
+pytestmark = pytest.mark.skipif(not sys.platform.startswith("linux"), reason="reads /proc")
+
+
+def _busy(seconds: float) -> int:
+    time.sleep(seconds)
+    return os.getpid()
+
+
+def _fake_job(job_dir: str, X, y, haplo_api_url, status, *args):
+    """Задача с пулом воркеров, как у NodeTrainer: пишет pid воркеров и ждет"""
+    training_jobs._start_process_group()
+    job_dir = Path(job_dir)
+    status.update(status="training", pid=os.getpid(), started_at=time.time())
+    training_jobs._write_status(job_dir, status)
+
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=2, mp_context=context) as pool:
+        futures = [pool.submit(_busy, 60) for _ in range(2)]
+        pids = [process.pid for process in pool._processes.values()]
+        (job_dir / "pool_pids.json").write_text(json.dumps(pids))
+        for future in futures:
+            future.result()
+
+
+def _running(pid: int) -> bool:
+    """Процесс есть и не зомби"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except FileNotFoundError:
+        return False
+
+
+def _wait(condition, timeout: float = 30) -> bool:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.1)
+    return False
+
+
+def test_cancel_stops_the_node_training_pool(tmp_path, monkeypatch):
+    monkeypatch.setattr(training_jobs, "_run_training_job", _fake_job)
+    manager = TrainingJobManager(jobs_dir=str(tmp_path / "jobs"), model_path=f"{tmp_path}/",
+                                 panel_tiers=False)
+    job_id = manager.submit(pd.DataFrame({"DYS393": [13, 14]}), pd.Series(["R", "I"]))
+    pids_file = tmp_path / "jobs" / job_id / "pool_pids.json"
+    assert _wait(pids_file.exists)
+    pids = json.loads(pids_file.read_text())
+    assert len(pids) == 2 and all(_running(pid) for pid in pids)
+
+    status = manager.cancel(job_id)
+
+    assert status["status"] == "cancelled"
+    assert _wait(lambda: not any(_running(pid) for pid in pids), timeout=10)
+
+
+def _finished_job(jobs_dir: Path, created_at: float, status: str = "completed") -> str:
+    job_id = f"job{created_at:.0f}"
+    job_dir = jobs_dir / job_id
+    (job_dir / "tree_model" / "estimators").mkdir(parents=True)
+    (job_dir / "tree_model" / "estimators" / "0.joblib").write_bytes(os.urandom(1 << 16))
+    training_jobs._write_status(job_dir, {
+        "job_id": job_id, "status": status, "created_at": created_at,
+        "started_at": created_at, "finished_at": created_at + 1, "pid": None,
+        "nodes_trained": 0, "nodes_total": None,
+    })
+    return job_id
+
+
+def test_concurrent_downloads_get_a_complete_archive(tmp_path):
+    manager = TrainingJobManager(jobs_dir=str(tmp_path / "jobs"))
+    job_id = _finished_job(manager.jobs_dir, 1)
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        archives = list(pool.map(manager.artifact_archive, [job_id] * 8))
+
+    for archive in archives:
+        with zipfile.ZipFile(archive) as f:
+            assert f.testzip() is None
+            assert "estimators/0.joblib" in f.namelist()
+    assert not list((manager.jobs_dir / job_id).glob("*.tmp*"))
+
+
+def test_prune_keeps_the_latest_finished_jobs(tmp_path):
+    manager = TrainingJobManager(jobs_dir=str(tmp_path / "jobs"), max_finished_jobs=2)
+    jobs = [_finished_job(manager.jobs_dir, t, status)
+            for t, status in [(1, "completed"), (2, "failed"), (3, "cancelled"), (4, "completed")]]
+    running = _finished_job(manager.jobs_dir, 0, status="training")
+    training_jobs._write_status(manager.jobs_dir / running, {
+        **json.loads((manager.jobs_dir / running / "status.json").read_text()), "pid": os.getpid()
+    })
+
+    assert sorted(manager.prune()) == sorted(jobs[:2])
+    assert sorted(path.name for path in manager.jobs_dir.iterdir() if path.is_dir()) == \
+        sorted([running, *jobs[2:]])
@@ -0,0 +1,78 @@
+# c:\projects\DNA-utils-universal\ystr_predictor\tests\test_tree_artifact.py
+import asyncio
+import gc
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from models.tree_artifact import TreeArtifact
+from models.tree_predictor import TreeHaploPredictor
+
+PATHS = {
+    "R-L21": ["R", "R-M269", "R-L21"],
+    "R-U106": ["R", "R-M269", "R-U106"],
+    "I-M253": ["I", "I-M253"],
+}
+MARKERS = ["DYS393", "DYS390", "DYS19", "DYS391"]
+
+
+def _trained(seed: int) -> TreeHaploPredictor:
+    rng = np.random.default_rng(seed)
+    y = pd.Series(rng.choice(list(PATHS), 300))
+    shift = y.map({"R-L21": 0, "R-U106": 2, "I-M253": 4}).to_numpy()
+    X = pd.DataFrame(12 + shift[:, None] + rng.integers(-1, 2, (300, len(MARKERS))), columns=MARKERS)
+    predictor = TreeHaploPredictor()
+    predictor.n_estimators = 5
+    asyncio.run(predictor.train(X, y, haplo_paths=PATHS))
+    return predictor
+
+
+@pytest.fixture(scope="module")
+def predictors():
+    return [_trained(seed) for seed in range(TreeArtifact.KEEP_PREVIOUS + 3)]
+
+
+def _versions(root) -> list:
+    return sorted(path.name for path in root.glob("tree_model-*"))
+
+
+@pytest.mark.skipif(os.name != "posix", reason="symlinked versions and pid checks")
+def test_version_in_use_is_not_pruned_until_released(tmp_path, predictors):
+    path = f"{tmp_path}/"
+    predictors[0].save_model(path)
+    serving = TreeHaploPredictor()
+    serving.load_model(path)
+    first = f"tree_model-{serving.version}"
+
+    # Больше публикаций, чем хранится прежних версий
+    for predictor in predictors[1:]:
+        predictor.save_model(path)
+    assert first in _versions(tmp_path)
+    # Модели узлов старой версии по-прежнему читаются с диска
+    serving.materialize(estimators=True)
+
+    del serving
+    gc.collect()
+    predictors[1].save_model(path)
+    predictors[2].save_model(path)
+    assert first not in _versions(tmp_path)
+    assert len(_versions(tmp_path)) <= TreeArtifact.KEEP_PREVIOUS + 1
+
+
+def test_leases_of_dead_processes_are_ignored(tmp_path, predictors):
+    predictors[0].save_model(f"{tmp_path}/")
+    version = tmp_path / f"tree_model-{predictors[0].version}"
+    leases = version / TreeArtifact.LEASES
+    leases.mkdir(exist_ok=True)
+    # pid, которого нет в системе
+    (leases / f"{2 ** 22 + 1}-deadbeef").touch()
+
+    assert not TreeArtifact._leased(version)
+    assert not list(leases.iterdir())
+
+    artifact = TreeArtifact(str(tmp_path / "tree_model"))
+    assert TreeArtifact._leased(version)
+    artifact.close()
+    assert not TreeArtifact._leased(version)
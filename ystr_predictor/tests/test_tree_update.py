@@ -0,0 +1,72 @@
+# c:\projects\DNA-utils-universal\ystr_predictor\tests\test_tree_update.py
+import asyncio
+import copy
+
+import numpy as np
+import pandas as pd
+
+from models import tree_predictor
+from models.tree_predictor import TreeHaploPredictor
+
+PATHS = {
+    "R-L21": ["R", "R-M269", "R-L21"],
+    "R-U106": ["R", "R-M269", "R-U106"],
+    "I-M253": ["I", "I-M253"],
+}
+MARKERS = ["DYS393", "DYS390", "DYS19", "DYS391"]
+
+
+def _samples(n_rows: int, seed: int):
+    """Гаплогруппы различимы по сдвигу значений маркеров"""
+    rng = np.random.default_rng(seed)
+    y = pd.Series(rng.choice(list(PATHS), n_rows))
+    shift = y.map({"R-L21": 0, "R-U106": 2, "I-M253": 4}).to_numpy()
+    X = pd.DataFrame(12 + shift[:, None] + rng.integers(-1, 2, (n_rows, len(MARKERS))),
+                     columns=MARKERS)
+    return X, y
+
+
+def _trained():
+    predictor = TreeHaploPredictor()
+    predictor.n_estimators = 10
+    X, y = _samples(600, 0)
+    asyncio.run(predictor.train(X, y, haplo_paths=PATHS))
+    return predictor
+
+
+def test_update_fills_markers_missing_from_the_batch_with_zeros(monkeypatch):
+    predictor = _trained()
+    expected = copy.deepcopy(predictor)
+    X, y = _samples(200, 1)
+
+    frames = []
+    update_node = tree_predictor.update_node
+
+    def spy(model, scaler, frame, *args):
+        frames.append(frame)
+        return update_node(model, scaler, frame, *args)
+    monkeypatch.setattr(tree_predictor, "update_node", spy)
+    report = asyncio.run(predictor.update(X.drop(columns="DYS390"), y, haplo_paths=PATHS))
+    monkeypatch.undo()
+    asyncio.run(expected.update(X.assign(DYS390=0), y, haplo_paths=PATHS))
+
+    assert report["trees_added"] > 0
+    # Леса учатся на тех же значениях, что видит предсказание: пропуск - ноль
+    assert frames and all(list(frame.columns) == MARKERS for frame in frames)
+    assert not any(frame.isna().any().any() for frame in frames)
+    assert all((frame["DYS390"] == 0).all() for frame in frames)
+    test_X = _samples(100, 2)[0].to_numpy(dtype=np.float64)
+    for name in report["updated_nodes"]:
+        node, reference = _find(predictor.root, name), _find(expected.root, name)
+        np.testing.assert_array_equal(node.compiled.predict_proba(test_X),
+                                      reference.compiled.predict_proba(test_X))
+
+
+def _find(node, name: str):
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if node.name == name:
+            return node
+        stack.extend(node.children.values())
+    raise KeyError(name)